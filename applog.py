@@ -0,0 +1,81 @@
+"""日志配置：调用方只把日志放入队列，由后台线程写文件；日志按大小或时间轮转并压缩旧文件"""
+import atexit
+import gzip
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import shutil
+import time
+
+LOGGER_NAME = "CampusNetworkLogin"
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+
+class JsonFormatter(logging.Formatter):
+    """每条日志输出为一行JSON"""
+
+    def format(self, record):
+        entry = {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(record.created))
+                    + f'.{int(record.msecs):03d}',
+            'level': record.levelname,
+            'thread': record.threadName,
+            'message': record.getMessage(),
+        }
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+def _gzip_namer(name):
+    """轮转出的旧日志加上.gz后缀"""
+    return name + ".gz"
+
+
+def _gzip_rotator(source, dest):
+    """把轮转出的日志压缩后删除原文件"""
+    with open(source, 'rb') as f_in, gzip.open(dest, 'wb') as f_out:
+        shutil.copyfileobj(f_in, f_out)
+    os.remove(source)
+
+
+def setup_logging(app_dir, json_format=False, max_bytes=5 * 1024 * 1024, backup_count=5, rotate_when=None,
+                  console=True):
+    """配置日志记录，重复调用时直接返回已配置的logger；
+    rotate_when不为空时按时间轮转（取值同TimedRotatingFileHandler的when），否则按大小轮转"""
+    logger = logging.getLogger(LOGGER_NAME)
+    if getattr(logger, 'queue_listener', None) is not None:
+        return logger
+    logger.setLevel(logging.INFO)
+
+    # 创建文件处理器
+    os.makedirs(app_dir, exist_ok=True)  # 确保目录存在
+    log_file = os.path.join(app_dir, "app.log")
+    if rotate_when:
+        file_handler = logging.handlers.TimedRotatingFileHandler(log_file, when=rotate_when,
+                                                                 backupCount=backup_count, encoding="utf-8")
+    else:
+        file_handler = logging.handlers.RotatingFileHandler(log_file, maxBytes=max_bytes,
+                                                            backupCount=backup_count, encoding="utf-8")
+    file_handler.namer = _gzip_namer
+    file_handler.rotator = _gzip_rotator
+    file_handler.setFormatter(JsonFormatter() if json_format else logging.Formatter(LOG_FORMAT))
+    handlers = [file_handler]
+
+    # 创建控制台处理器
+    if console:
+        console_handler = logging.StreamHandler()
+        console_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+        handlers.append(console_handler)
+
+    # 调用方线程只负责入队，磁盘写入和压缩都在监听线程中完成
+    log_queue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+
+    logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    logger.queue_listener = listener
+    return logger
@@ -0,0 +1,90 @@
+"""远程资源的磁盘缓存加载器（不依赖GUI）"""
+import hashlib
+import json
+import os
+import threading
+import time
+
+
+class AssetCache:
+    """把远程资源缓存到本地目录，缓存未过期时完全不访问网络，过期后用ETag/Last-Modified做条件请求"""
+
+    def __init__(self, cache_dir, session_getter, max_age=7 * 24 * 3600):
+        self.cache_dir = cache_dir
+        self.session_getter = session_getter  # 返回共享HTTP会话的函数，避免提前创建会话
+        self.max_age = max_age
+
+    def _paths(self, url):
+        """返回资源文件和元数据文件的路径"""
+        name = hashlib.sha1(url.encode('utf-8')).hexdigest()[:16]
+        ext = os.path.splitext(url.split('?', 1)[0])[1] or '.bin'
+        base = os.path.join(self.cache_dir, name)
+        return base + ext, base + '.json'
+
+    def _read_meta(self, meta_path):
+        """读取缓存元数据，损坏时视为无缓存"""
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write_atomic(self, path, data):
+        """先写临时文件再替换，避免中途退出留下半个文件"""
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def load(self, url, timeout=10):
+        """返回资源内容；网络失败时退回到已有缓存，都没有时抛出异常"""
+        data_path, meta_path = self._paths(url)
+        meta = self._read_meta(meta_path)
+        cached = None
+        if meta and os.path.exists(data_path):
+            with open(data_path, 'rb') as f:
+                cached = f.read()
+            if time.time() - meta.get('checked', 0) < self.max_age:
+                return cached
+
+        headers = {}
+        if cached is not None:
+            if meta.get('etag'):
+                headers['If-None-Match'] = meta['etag']
+            if meta.get('last_modified'):
+                headers['If-Modified-Since'] = meta['last_modified']
+
+        try:
+            response = self.session_getter().get(url, headers=headers, timeout=timeout)
+            if response.status_code == 304 and cached is not None:
+                data = cached
+            else:
+                response.raise_for_status()
+                data = response.content
+                os.makedirs(self.cache_dir, exist_ok=True)
+                self._write_atomic(data_path, data)
+                meta = {
+                    'url': url,
+                    'etag': response.headers.get('ETag'),
+                    'last_modified': response.headers.get('Last-Modified'),
+                }
+        except Exception:
+            if cached is not None:
+                return cached
+            raise
+
+        meta['checked'] = time.time()
+        self._write_atomic(meta_path, json.dumps(meta).encode('utf-8'))
+        return data
+
+    def load_async(self, url, callback, timeout=10):
+        """在后台线程加载资源，完成后调用 callback(内容, 异常)"""
+        def worker():
+            try:
+                data = self.load(url, timeout=timeout)
+            except Exception as e:
+                callback(None, e)
+            else:
+                callback(data, None)
+
+        threading.Thread(target=worker, daemon=True).start()
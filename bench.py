@@ -0,0 +1,247 @@
+"""基于模拟门户的端到端性能基准：登录延迟、检查周期、掉线重连耗时和启动耗时"""
+import argparse
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from breaker import FAILURE_AUTH
+from engine import LoginEngine
+from mockportal import MockPortal
+from netcore import CaptiveDetector
+from portals import get_portal
+
+BENCH_ACCOUNT = "2021001"
+
+
+def summarize(samples):
+    """返回样本的次数、平均值和分位数（毫秒）"""
+    ordered = sorted(samples)
+    if not ordered:
+        return {'n': 0}
+
+    def pick(q):
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000
+
+    return {
+        'n': len(ordered),
+        'mean': sum(ordered) / len(ordered) * 1000,
+        'p50': pick(0.50),
+        'p95': pick(0.95),
+        'max': ordered[-1] * 1000,
+    }
+
+
+def make_engine(app_dir, portal):
+    """创建指向模拟门户的引擎"""
+    engine = LoginEngine(app_dir)
+    engine.save_config({
+        'userAccount': BENCH_ACCOUNT,
+        'encryptedPassword': 'bench',
+        'serviceName': get_portal().service_value('cmcc'),
+        'targetUrl': portal.login_url,
+        'networkParams': f'wlanuserip={portal.host}',
+    })
+    engine._detector = CaptiveDetector(engine.probe_http, check_url=portal.check_url, portal_host=portal.host)
+    engine.check_sites = [portal.host]
+    engine.prober.port = portal.port
+    engine.watch_links = False
+    engine.quality_interval = 0
+    engine.login_bucket = None  # 基准需要连续登录，不做限流
+    engine.metrics_port = 0
+    return engine
+
+
+def bench_login(engine, rounds):
+    """完整登录请求（不复用会话）"""
+    samples = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        engine.login(reuse=False)
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def bench_login_rejected(engine, portal, rounds):
+    """被门户拒绝的登录（密码错误），结果必须归类为认证失败；按用户主动登录发送，不受熔断限制"""
+    portal.accounts = {BENCH_ACCOUNT: 'wrong'}
+    samples = []
+    try:
+        for _ in range(rounds):
+            started = time.perf_counter()
+            result = engine.login(reuse=False, manual=True)
+            if result.failure == FAILURE_AUTH:
+                samples.append(time.perf_counter() - started)
+    finally:
+        portal.accounts = None
+        engine.breaker.record_success()
+    return samples
+
+
+def bench_session_check(engine, rounds):
+    """会话仍有效时的快速重认证"""
+    engine.login(reuse=False)
+    samples = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        engine.login()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def bench_check_cycle(engine, rounds):
+    """在线时一次完整的网络检查"""
+    samples = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        engine.check_network_status()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def wait_online(portal, timeout):
+    """等待模拟门户上重新出现在线会话，超时返回False"""
+    deadline = time.monotonic() + timeout
+    while not portal.sessions:
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.005)
+    return True
+
+
+def bench_reconnect(engine, portal, rounds, interval, link_event):
+    """模拟掉线后到重新认证完成的耗时；link_event为True时模拟收到网络变化事件，否则依靠定时检查"""
+    engine.login(reuse=False)
+    engine.ping_interval = interval
+    engine.start_monitor()
+    samples = []
+    try:
+        time.sleep(0.2)
+        for _ in range(rounds):
+            portal.drop()
+            started = time.perf_counter()
+            if link_event:
+                engine.on_link_change("基准测试模拟")
+            if wait_online(portal, interval * 3 + 30):
+                samples.append(time.perf_counter() - started)
+            time.sleep(interval * 2)  # 等登录后的快速复查结束，回到正常间隔再模拟下一次掉线
+    finally:
+        engine.stop_monitor()
+    return samples
+
+
+def bench_startup(app_dir, rounds):
+    """命令行 --once --force 从进程启动到认证完成的耗时"""
+    command = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "engine.py"),
+               "--once", "--force", "--app-dir", app_dir, "--metrics-port", "0", "--no-capture-params"]
+    samples = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        completed = subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        if completed.returncode == 0:
+            samples.append(time.perf_counter() - started)
+    return samples
+
+
+def bench_import(module, rounds):
+    """导入模块的耗时（新进程），导入失败时返回空列表"""
+    samples = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        completed = subprocess.run([sys.executable, "-c", f"import {module}"],
+                                   cwd=os.path.dirname(os.path.abspath(__file__)),
+                                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        if completed.returncode != 0:
+            return []
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def run_all(args):
+    """运行全部基准，返回 名称 -> 统计结果"""
+    portal = MockPortal(latency=args.latency, jitter=args.jitter).start_background()
+    results = {}
+    try:
+        with tempfile.TemporaryDirectory() as app_dir:
+            engine = make_engine(app_dir, portal)
+            try:
+                benches = [
+                    ("login", lambda: bench_login(engine, args.rounds)),
+                    ("login_rejected", lambda: bench_login_rejected(engine, portal, args.rounds)),
+                    ("session_check", lambda: bench_session_check(engine, args.rounds)),
+                    ("check_cycle", lambda: bench_check_cycle(engine, args.rounds)),
+                    ("reconnect_event", lambda: bench_reconnect(engine, portal, args.reconnect_rounds,
+                                                                args.interval, True)),
+                    ("reconnect_poll", lambda: bench_reconnect(engine, portal, args.reconnect_rounds,
+                                                               args.interval, False)),
+                    ("startup_once", lambda: bench_startup(app_dir, args.startup_rounds)),
+                    ("import_engine", lambda: bench_import("engine", args.startup_rounds)),
+                    ("import_login", lambda: bench_import("login", args.startup_rounds)),
+                ]
+                for name, bench in benches:
+                    if args.only and name not in args.only:
+                        continue
+                    results[name] = summarize(bench())
+                    print(format_row(name, results[name]), flush=True)
+            finally:
+                engine.close()
+    finally:
+        portal.stop()
+    return results
+
+
+def format_row(name, stats):
+    if not stats['n']:
+        return f"{name:<16} 跳过"
+    return (f"{name:<16} n={stats['n']:<4} mean={stats['mean']:8.1f} ms  p50={stats['p50']:8.1f} ms  "
+            f"p95={stats['p95']:8.1f} ms  max={stats['max']:8.1f} ms")
+
+
+def compare(results, baseline, threshold):
+    """与基线比较p50，返回变慢超过阈值的项目列表"""
+    regressions = []
+    for name, stats in results.items():
+        base = baseline.get(name)
+        if not stats['n'] or not base or not base.get('n'):
+            continue
+        if stats['p50'] > base['p50'] * (1 + threshold):
+            regressions.append(f"{name}: p50 {base['p50']:.1f} ms -> {stats['p50']:.1f} ms")
+    return regressions
+
+
+def main(argv=None):
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="基于本地模拟门户的性能基准")
+    parser.add_argument("--rounds", type=int, default=50, help="登录与检查类基准的次数")
+    parser.add_argument("--reconnect-rounds", type=int, default=5, help="掉线重连基准的次数")
+    parser.add_argument("--startup-rounds", type=int, default=3, help="启动类基准的次数")
+    parser.add_argument("--interval", type=float, default=2.0, help="定时检查重连基准使用的监控间隔（秒）")
+    parser.add_argument("--latency", type=float, default=0.0, help="模拟门户的请求延迟（秒）")
+    parser.add_argument("--jitter", type=float, default=0.0, help="模拟门户的随机附加延迟上限（秒）")
+    parser.add_argument("--only", nargs="+", help="只运行指定基准")
+    parser.add_argument("--save", help="把结果写入JSON文件，可作为后续比较的基线")
+    parser.add_argument("--compare", help="与基线JSON比较，p50变慢超过阈值时退出码为1")
+    parser.add_argument("--threshold", type=float, default=0.25, help="允许的变慢比例（默认0.25）")
+    parser.add_argument("-v", "--verbose", action="store_true", help="输出引擎日志")
+    args = parser.parse_args(argv)
+
+    logging.getLogger("CampusNetworkLogin").setLevel(logging.INFO if args.verbose else logging.CRITICAL)
+    results = run_all(args)
+
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        for line in regressions:
+            print(f"变慢: {line}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,134 @@
+"""登录熔断器与令牌桶限流，避免在门户故障或账号被拒时反复发送登录请求"""
+import threading
+import time
+
+from metrics import REGISTRY
+
+BREAKER_TRANSITIONS = REGISTRY.counter("login_breaker_transitions_total", "登录熔断器状态变化次数", ("state",))
+
+BREAKER_CLOSED = "closed"
+BREAKER_OPEN = "open"
+BREAKER_HALF_OPEN = "half_open"
+
+# 登录失败类型
+FAILURE_AUTH = "auth"  # 门户拒绝（账号、密码或参数错误）
+FAILURE_NON_JSON = "non_json"  # 响应不是JSON
+FAILURE_TIMEOUT = "timeout"  # 请求超时
+FAILURE_HTTP_5XX = "http_5xx"  # 门户服务器错误
+FAILURE_NETWORK = "network"  # 连接失败等其他请求异常
+FAILURE_BAD_RESPONSE = "bad_response"  # userIndex无法解析
+
+# 账号被拒时重试也不会成功，这类失败计数加倍，更快打开熔断
+FAILURE_WEIGHTS = {FAILURE_AUTH: 2}
+
+
+class TokenBucket:
+    """令牌桶：最多积攒capacity个令牌，每refill_seconds秒补充一个"""
+
+    def __init__(self, capacity=3, refill_seconds=20):
+        self.capacity = capacity
+        self.refill_seconds = refill_seconds
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) / self.refill_seconds)
+        self.updated = now
+
+    def take(self):
+        """取一个令牌，没有可用令牌时返回False"""
+        with self._lock:
+            self._refill()
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+    def wait_time(self):
+        """距离下一个令牌可用的秒数"""
+        with self._lock:
+            self._refill()
+            return max(0.0, (1 - self.tokens) * self.refill_seconds)
+
+
+class CircuitBreaker:
+    """连续失败达到阈值后打开，冷却期内拒绝登录；冷却结束后半开，只放行一次试探请求：
+    成功则关闭，失败则重新打开并加倍冷却时间"""
+
+    def __init__(self, threshold=3, cooldown=60, max_cooldown=900, on_change=None):
+        self.threshold = threshold  # 打开熔断的失败计数
+        self.base_cooldown = cooldown  # 首次打开时的冷却时间（秒）
+        self.max_cooldown = max_cooldown
+        self.on_change = on_change  # 状态变化回调 on_change(描述)
+        self.state = BREAKER_CLOSED
+        self.failures = 0
+        self.cooldown = cooldown
+        self.opened_at = 0.0
+        self.last_failure = None
+        self.trial_inflight = False
+        self._lock = threading.Lock()
+
+    def _set_state(self, state):
+        self.state = state
+        BREAKER_TRANSITIONS.labels(state=state).inc()
+        if self.on_change:
+            self.on_change(self.describe())
+
+    def allow(self):
+        """是否允许发送登录请求；半开状态下只放行一个试探请求"""
+        with self._lock:
+            if self.state == BREAKER_OPEN:
+                if time.monotonic() - self.opened_at < self.cooldown:
+                    return False
+                self._set_state(BREAKER_HALF_OPEN)
+            if self.state == BREAKER_HALF_OPEN:
+                if self.trial_inflight:
+                    return False
+                self.trial_inflight = True
+            return True
+
+    def release(self):
+        """放行后实际没有发送请求（例如被限流）时调用，归还半开状态的试探名额"""
+        with self._lock:
+            self.trial_inflight = False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.last_failure = None
+            self.trial_inflight = False
+            self.cooldown = self.base_cooldown
+            if self.state != BREAKER_CLOSED:
+                self._set_state(BREAKER_CLOSED)
+
+    def record_failure(self, kind):
+        with self._lock:
+            self.last_failure = kind
+            self.trial_inflight = False
+            if self.state == BREAKER_HALF_OPEN:
+                self.cooldown = min(self.cooldown * 2, self.max_cooldown)
+                self.opened_at = time.monotonic()
+                self._set_state(BREAKER_OPEN)
+                return
+            self.failures += FAILURE_WEIGHTS.get(kind, 1)
+            if self.state == BREAKER_CLOSED and self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+                self._set_state(BREAKER_OPEN)
+
+    def remaining(self):
+        """打开状态下距离半开的秒数"""
+        if self.state != BREAKER_OPEN:
+            return 0.0
+        return max(0.0, self.cooldown - (time.monotonic() - self.opened_at))
+
+    def describe(self):
+        """返回用于显示的状态文本"""
+        if self.state == BREAKER_OPEN:
+            return f"登录熔断: 已打开（{self.last_failure}，{self.remaining():.0f} 秒后试探）"
+        if self.state == BREAKER_HALF_OPEN:
+            return "登录熔断: 半开（试探登录中）"
+        if self.failures:
+            return f"登录熔断: 正常（连续失败 {self.failures}）"
+        return "登录熔断: 正常"
@@ -0,0 +1,157 @@
+"""类型化配置文件：JSON格式、带版本号，原子写入，可按修改时间发现外部工具的修改"""
+import json
+import logging
+import os
+
+CONFIG_FILE_NAME = "config.json"
+LEGACY_CONFIG_FILE_NAME = "login_config.ini"  # 版本1：每行 key = "value"
+SCHEMA_VERSION = 2
+
+# 账号字段，均为字符串
+ACCOUNT_FIELDS = ('portal', 'userAccount', 'encryptedPassword', 'serviceName', 'targetUrl', 'networkParams')
+
+
+def _check_sites(value):
+    if not isinstance(value, list) or not value or not all(isinstance(line, str) and line.strip() for line in value):
+        raise ValueError("必须是非空的站点列表")
+    return [line.strip() for line in value]
+
+
+def _interval(value):
+    if isinstance(value, bool) or not isinstance(value, int) or value < 10:
+        raise ValueError("必须是不小于10的整数")
+    return value
+
+
+def _sample_interval(value):
+    if isinstance(value, bool) or not isinstance(value, int) or (value != 0 and value < 10):
+        raise ValueError("必须是0（关闭）或不小于10的整数")
+    return value
+
+
+def _positive(value):
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or value <= 0:
+        raise ValueError("必须是正数")
+    return value
+
+
+def _flag(value):
+    if not isinstance(value, bool):
+        raise ValueError("必须是true或false")
+    return value
+
+
+# 运行设置：名称 -> (校验函数, 默认值)
+SETTINGS = {
+    'pingInterval': (_interval, 60),
+    'checkSites': (_check_sites, ["www.baidu.com", "qq.com", "www.taobao.com"]),
+    'captiveMode': (_flag, True),
+    'watchLinks': (_flag, True),
+    'captureParams': (_flag, True),
+    'qualityInterval': (_sample_interval, 30),
+    'qualityP95Ms': (_positive, 300),
+}
+
+
+def default_settings():
+    return {name: (list(default) if isinstance(default, list) else default)
+            for name, (_, default) in SETTINGS.items()}
+
+
+def parse_legacy(text):
+    """解析版本1的配置文本，跳过无法识别的行"""
+    account = {}
+    for line in text.splitlines():
+        key, sep, value = line.strip().partition(' = ')
+        if sep and key in ACCOUNT_FIELDS:
+            account[key] = value.strip('"')
+    return account
+
+
+class ConfigStore:
+    """配置文件读写：{"version": 2, "account": {...}, "settings": {...}}"""
+
+    def __init__(self, path, legacy_path=None, logger=None):
+        self.path = path
+        self.legacy_path = legacy_path  # 存在旧格式文件且新文件不存在时自动迁移
+        self.logger = logger or logging.getLogger("CampusNetworkLogin")
+        self._stamp = None  # 最近一次读写时文件的 (修改时间, 大小)
+
+    def exists(self):
+        return os.path.exists(self.path) or bool(self.legacy_path and os.path.exists(self.legacy_path))
+
+    def _file_stamp(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def changed(self):
+        """文件在上次读写后是否被其他程序修改过"""
+        return self._file_stamp() != self._stamp
+
+    def load(self):
+        """读取配置，返回 (账号字典, 设置字典)；文件不存在时返回None，格式错误时抛出ValueError"""
+        if not os.path.exists(self.path):
+            if self.legacy_path and os.path.exists(self.legacy_path):
+                return self._migrate_legacy()
+            self._stamp = None
+            return None
+
+        # 先记下时间戳：文件损坏时不会在每次检查中反复报错，直到它再次被修改
+        self._stamp = self._file_stamp()
+        with open(self.path, 'r', encoding='utf-8') as f:
+            try:
+                data = json.load(f)
+            except ValueError as e:
+                raise ValueError(f"配置文件不是有效的JSON: {str(e)}") from None
+        if not isinstance(data, dict):
+            raise ValueError("配置文件格式错误")
+        version = data.get('version', 1)
+        if not isinstance(version, int) or version > SCHEMA_VERSION:
+            raise ValueError(f"配置文件版本 {version} 不受支持")
+        return self._normalize(data.get('account'), data.get('settings'))
+
+    def _normalize(self, account, settings):
+        """按字段类型整理读入的数据，无效的设置退回默认值"""
+        account = {key: value for key, value in (account or {}).items()
+                   if key in ACCOUNT_FIELDS and isinstance(value, str)}
+        result = default_settings()
+        for name, value in (settings or {}).items():
+            if name not in SETTINGS:
+                continue
+            try:
+                result[name] = SETTINGS[name][0](value)
+            except ValueError as e:
+                self.logger.warning(f"配置项 {name} 无效（{str(e)}），使用默认值")
+        return account, result
+
+    def _migrate_legacy(self):
+        """把旧格式配置转换为新格式，旧文件改名为 .bak 保留"""
+        with open(self.legacy_path, 'r', encoding='utf-8') as f:
+            account = parse_legacy(f.read())
+        settings = default_settings()
+        self.save(account, settings)
+        os.replace(self.legacy_path, self.legacy_path + '.bak')
+        self.logger.info(f"旧配置文件已迁移到 {os.path.basename(self.path)}")
+        return account, settings
+
+    def save(self, account, settings):
+        """校验后先写临时文件再替换，中途退出不会留下损坏的配置"""
+        account, settings = dict(account), dict(settings)
+        for name, value in settings.items():
+            settings[name] = SETTINGS[name][0](value)
+        data = {'version': SCHEMA_VERSION,
+                'account': {key: str(account[key]) for key in ACCOUNT_FIELDS if key in account},
+                'settings': settings}
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        self._stamp = self._file_stamp()
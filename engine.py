@@ -0,0 +1,1114 @@
+"""校园网认证核心引擎（不依赖tkinter/Pillow/pystray，可独立以命令行方式运行）"""
+import argparse
+import ipaddress
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from applog import setup_logging
+from breaker import FAILURE_AUTH, FAILURE_NETWORK, FAILURE_TIMEOUT, CircuitBreaker, TokenBucket
+from configstore import CONFIG_FILE_NAME, LEGACY_CONFIG_FILE_NAME, ConfigStore, default_settings
+from healthcheck import TIER_GATEWAY, TIER_INTERFACE, TIER_NAMES, TieredHealthCheck
+from instance import LOCK_FILE_NAME, ControlServer, InstanceLock, send_command
+from linkwatch import NetlinkWatcher
+from metrics import REGISTRY, MetricsExporter
+from netbind import InterfaceBinding, list_interfaces
+from netcore import (NET_CAPTIVE, NET_OFFLINE, NET_ONLINE, CaptiveDetector, ProbeEngine,
+                     create_http_session)
+from portalparams import (PARAMS_FILE_NAME, ParamCache, follow_redirects, link_key, local_address, query_user_ip,
+                          redirect_query)
+from portals import DEFAULT_PORTAL, get_portal
+from quality import QualityHistory, QualityMonitor
+
+DEFAULT_METRICS_PORT = 9108
+
+LOGIN_TOTAL = REGISTRY.counter("login_total", "登录请求次数", ("result",))
+LOGIN_SECONDS = REGISTRY.histogram("login_duration_seconds", "登录总耗时（含解析）")
+LOGIN_HTTP_SECONDS = REGISTRY.histogram("login_http_seconds", "登录POST请求耗时")
+RELOGIN_TOTAL = REGISTRY.counter("relogin_total", "监控发现未认证后触发的重新登录次数")
+CHECK_TOTAL = REGISTRY.counter("network_check_total", "网络检查结果次数", ("state",))
+CHECK_SECONDS = REGISTRY.histogram("network_check_seconds", "单次网络检查耗时")
+CONNECTIVITY_TOTAL = REGISTRY.counter("connectivity_check_total", "登录前连通性检查次数", ("result",))
+CONNECTIVITY_SECONDS = REGISTRY.histogram("connectivity_check_seconds", "登录前连通性检查耗时")
+SESSION_CHECK_TOTAL = REGISTRY.counter("session_check_total", "登录前会话有效性检查结果次数", ("result",))
+SESSION_CHECK_SECONDS = REGISTRY.histogram("session_check_seconds", "会话有效性检查耗时")
+
+
+class LoginResult:
+    """一次登录请求的结果"""
+
+    def __init__(self):
+        self.ok = False
+        self.status_code = None
+        self.length = 0
+        self.body = ""  # 原始响应文本
+        self._raw = None
+        self.error = None  # 响应解析失败的原因
+        self.exception = None  # 请求过程中抛出的异常
+        self.user_index = None
+        self.decoded = None
+        self.device_id = None
+        self.ip = None
+        self.account = None
+        self.account_match = False
+        self.reused = False  # 会话仍有效，沿用上次登录结果而未重新登录
+        self.failure = None  # 失败类型，见breaker模块；被熔断或限流拦下时为"blocked"
+
+    @property
+    def raw(self):
+        """格式化后的JSON或原始响应文本；只在显示时才格式化"""
+        if self._raw is None:
+            try:
+                self._raw = json.dumps(json.loads(self.body), indent=2, ensure_ascii=False)
+            except ValueError:
+                self._raw = self.body
+        return self._raw
+
+
+class MonitorScheduler:
+    """根据检查结果计算下次检查前的等待时间：
+    正常时按监控间隔，刚掉线或刚登录后快速复查，持续失败时指数退避并加随机抖动"""
+
+    def __init__(self, fast_interval=5, fast_checks=3, max_backoff=300, jitter=0.1):
+        self.fast_interval = fast_interval  # 快速复查间隔（秒）
+        self.fast_checks = fast_checks  # 恢复后再快速确认的次数
+        self.max_backoff = max_backoff  # 退避上限（秒）
+        self.jitter = jitter  # 抖动比例，避免多台机器同时请求门户
+        self.failures = 0
+        self.confirm_left = 0
+
+    def reset(self):
+        """清除历史状态"""
+        self.failures = 0
+        self.confirm_left = 0
+
+    def next_delay(self, state, interval):
+        """返回下次检查前的等待秒数，快速复查不会比正常间隔更慢"""
+        fast = min(self.fast_interval, interval)
+        if state == NET_ONLINE:
+            self.failures = 0
+            if self.confirm_left > 0:
+                self.confirm_left -= 1
+                delay = fast
+            else:
+                delay = interval
+        else:
+            # 未认证（已触发登录）或门户不可达：第一次快速复查，之后指数退避
+            self.failures += 1
+            self.confirm_left = self.fast_checks
+            delay = min(fast * 2 ** (self.failures - 1), self.max_backoff)
+        return delay * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+
+class LoginEngine:
+    """认证与网络监控核心，通过回调把状态交给界面或命令行"""
+
+    def __init__(self, app_dir, logger=None, on_status=None, on_state=None, login_handler=None, binding=None):
+        self.app_dir = app_dir
+        self.logger = logger or logging.getLogger("CampusNetworkLogin")
+        self.on_status = on_status  # 状态消息回调
+        self.on_state = on_state  # 网络状态摘要回调
+        self.login_handler = login_handler  # 需要重新登录时的处理方式，默认直接登录
+        self.binding = binding  # 绑定的网卡（见netbind模块），探测和登录都从该网卡发出；为None时由系统选路
+
+        # 使用程序目录下的配置文件，旧版login_config.ini首次加载时自动迁移
+        self.config_file = os.path.join(app_dir, CONFIG_FILE_NAME)
+        self.store = ConfigStore(self.config_file, legacy_path=os.path.join(app_dir, LEGACY_CONFIG_FILE_NAME),
+                                 logger=self.logger)
+        self.config = {}
+        self.setting_overrides = {}  # 命令行指定的设置，优先于配置文件
+        self.on_config_reload = None  # 配置文件被外部修改并重新加载后的回调
+        settings = default_settings()
+
+        # 网络监控相关变量
+        self.monitoring = False
+        self.monitor_thread = None
+        self.ping_interval = settings['pingInterval']  # 网络正常时的检查间隔（秒）
+        self.scheduler = MonitorScheduler()
+        self._monitor_generation = 0  # 每次启动监控加一，旧的监控线程据此退出
+        self._wake = threading.Event()  # 打断监控等待，立即进行下一次检查
+        self.watch_links = settings['watchLinks']  # Linux下监听地址/路由变化，变化时立即检查
+        self.link_watcher = None
+        self.capture_params = settings['captureParams']  # 从门户跳转地址自动获取networkParams
+        self.param_cache = ParamCache(os.path.join(app_dir, PARAMS_FILE_NAME), logger=self.logger)
+        self._params_key = None  # 本次登录所用参数的缓存键，登录被拒绝时据此丢弃
+        self._capture_missed = None  # 上次没能获取参数的缓存键（通常是已在线），再次被门户拦截前不重复请求
+        self._stale_params = None  # 被门户拒绝过的配置参数，改用自动获取的参数
+        self.check_sites = settings['checkSites']
+        self.pinned_sites = {}  # 站点 -> 固定地址列表，这些站点不做DNS解析
+        self.prober = ProbeEngine(port=80, timeout=5, binding=binding)  # 并发探测，整轮共用一个超时
+        self.captive_mode = settings['captiveMode']  # 门户检测模式：只在被门户拦截时重新登录
+        self.quality_interval = settings['qualityInterval']  # 连接质量采样间隔（秒），0表示关闭
+        self.quality_p95 = settings['qualityP95Ms']  # 连接延迟p95超过该值（毫秒）时提示质量下降
+        self.quality = None
+
+        # 最近一次检查的结果，供控制通道查询
+        self.last_state = None
+        self.last_check_at = None
+        self.state_text = ""
+        self.control = None
+        self.max_initial_check_attempts = 12  # 最大尝试次数
+        self.initial_check_delay = 5  # 每次检查间隔（秒）
+        self._network_changed = threading.Event()  # 登录前等待网络时，网络变化可提前结束等待
+
+        self._http = None
+        self._probe_http = None
+        self._detector = None
+        self._login_request = None  # (账号配置, 编译好的登录请求)
+
+        # 指标：本机Prometheus接口和定期JSON快照，端口设为0时不开启接口
+        self.metrics_port = DEFAULT_METRICS_PORT
+        self.metrics_snapshot = os.path.join(app_dir, "metrics.json")
+        self.metrics_exporter = None
+
+        # 同一时间只允许一个登录请求，并发的登录调用等待并共享它的结果
+        self._login_lock = threading.Lock()
+        self._login_inflight = None  # (完成事件, 结果列表, 是否主动登录, 是否复用会话)
+
+        # 自动登录连续失败时熔断，并限制登录频率；用户主动登录不受限制
+        self.breaker = CircuitBreaker(on_change=self._on_breaker_change)
+        self.login_bucket = TokenBucket(capacity=3, refill_seconds=20)
+
+        # 上次成功登录的userIndex及其解码字段，重连前先用它查询会话是否仍有效；每个网卡各自保存
+        self.session_file = os.path.join(app_dir, f"session-{binding.name}.json" if binding else "session.json")
+        self.session = self.load_session()
+
+    @property
+    def http(self):
+        """共享HTTP会话：首次使用时才创建，登录和其他请求复用同一连接池"""
+        if self._http is None:
+            self._http = create_http_session(binding=self.binding)
+        return self._http
+
+    @property
+    def probe_http(self):
+        """检测用的HTTP会话：不重试，外网不可达时一次超时就返回，不拖慢离线判断"""
+        if self._probe_http is None:
+            self._probe_http = create_http_session(pool_size=2, retries=0, binding=self.binding)
+        return self._probe_http
+
+    @property
+    def detector(self):
+        """门户检测器：只有跳转到登录地址所在主机才算被门户拦截"""
+        if self._detector is None:
+            self._detector = CaptiveDetector(self.probe_http, portal_host=self.portal_address()[0])
+        return self._detector
+
+    def _sync_portal_host(self):
+        """登录地址变化后更新门户检测器认定的门户主机"""
+        if self._detector is not None:
+            self._detector.portal_host = self.portal_address()[0]
+
+    def set_override(self, key, value):
+        """命令行指定的设置，优先于配置文件"""
+        self.setting_overrides[key] = value
+
+    def start_metrics(self, port=None):
+        """启动指标接口和快照，port为None时使用metrics_port"""
+        if port is not None:
+            self.metrics_port = port
+        if self.metrics_exporter is None:
+            self.metrics_exporter = MetricsExporter(port=self.metrics_port, snapshot_path=self.metrics_snapshot,
+                                                    logger=self.logger)
+            self.metrics_exporter.start()
+
+    def status_snapshot(self):
+        """返回当前状态，供控制通道查询"""
+        session = self.session or {}
+        return {
+            'pid': os.getpid(),
+            'account': self.config.get('userAccount'),
+            'state': self.last_state,
+            'summary': self.state_text,
+            'lastCheck': self.last_check_at,
+            'monitoring': self.monitoring,
+            'interval': self.ping_interval,
+            'loginInProgress': self.login_in_progress,
+            'ip': session.get('ip'),
+            'breaker': self.breaker.describe() if self.breaker is not None else None,
+            'interface': str(self.binding) if self.binding is not None else None,
+        }
+
+    def control_commands(self):
+        """控制通道支持的命令；耗时的操作放到后台线程，立即回复"""
+        def relogin():
+            threading.Thread(target=self.login, kwargs={'reuse': False, 'manual': True}, daemon=True).start()
+
+        return {
+            'status': self.status_snapshot,
+            'relogin': relogin,
+            'check': self.recheck_now,
+        }
+
+    def start_control(self, commands=None):
+        """启动本地控制通道，commands可覆盖或增加命令"""
+        if self.control is None:
+            self.control = ControlServer(self.app_dir, dict(self.control_commands(), **(commands or {})),
+                                         logger=self.logger)
+            if not self.control.start():
+                self.control = None
+
+    def close(self):
+        """停止监控并释放连接"""
+        self.monitoring = False
+        if self.control is not None:
+            self.control.stop()
+            self.control = None
+        if self.metrics_exporter is not None:
+            self.metrics_exporter.stop()
+            self.metrics_exporter = None
+        if self.quality is not None:
+            self.quality.stop()
+            self.quality.history.close()
+            self.quality = None
+        if self._http is not None:
+            self._http.close()
+        if self._probe_http is not None:
+            self._probe_http.close()
+
+    def status(self, message):
+        """发出状态消息"""
+        if self.on_status:
+            self.on_status(message)
+
+    def set_state(self, state):
+        """发出网络状态摘要"""
+        self.state_text = state
+        if self.on_state:
+            self.on_state(state)
+
+    def load_config(self):
+        """加载账号和运行设置，文件不存在时返回False，格式错误时抛出ValueError"""
+        if not self.store.exists():
+            self.logger.info("未找到配置文件")
+            return False
+        self.logger.info("加载配置文件")
+        loaded = self.store.load()
+        if loaded is None:
+            return False
+        config, settings = loaded
+        get_portal(config.get('portal'))  # 门户类型无效时保留原配置，不让后续登录拿到无法使用的配置
+        self.config = config
+        self._sync_portal_host()
+        self.apply_settings(settings)
+        self.logger.info(f"配置加载成功: {self.config.get('userAccount', '未知用户')}")
+        return True
+
+    def apply_settings(self, settings):
+        """应用运行设置，命令行指定的设置优先"""
+        settings = dict(settings, **self.setting_overrides)
+        try:
+            self.set_check_sites(settings['checkSites'])
+        except ValueError as e:
+            self.logger.warning(f"配置中的检查站点无效: {str(e)}")
+        if settings['pingInterval'] != self.ping_interval:
+            self.ping_interval = settings['pingInterval']
+            self.recheck_now()
+        self.captive_mode = settings['captiveMode']
+        self.watch_links = settings['watchLinks']
+        self.capture_params = settings['captureParams']
+        self.quality_interval = settings['qualityInterval']
+        self.quality_p95 = settings['qualityP95Ms']
+        if self.quality is not None:
+            self.quality.interval = self.quality_interval or self.quality.interval
+            self.quality.p95_threshold = self.quality_p95
+
+    def settings(self):
+        """返回当前运行设置"""
+        return {
+            'pingInterval': self.ping_interval,
+            'checkSites': self.site_lines(),
+            'captiveMode': self.captive_mode,
+            'watchLinks': self.watch_links,
+            'captureParams': self.capture_params,
+            'qualityInterval': self.quality_interval,
+            'qualityP95Ms': self.quality_p95,
+        }
+
+    def save_config(self, config):
+        """保存账号配置（连同当前运行设置），门户类型无效时抛出ValueError"""
+        get_portal(config.get('portal'))
+        self.config = config
+        self._sync_portal_host()
+        self.store.save(self.config, self.settings())
+        self.logger.info(f"配置保存成功: {self.config['userAccount']}")
+
+    def save_settings(self):
+        """运行设置修改后写回配置文件，失败时只记录警告"""
+        try:
+            self.store.save(self.config, self.settings())
+        except (OSError, ValueError) as e:
+            self.logger.warning(f"保存设置失败: {str(e)}")
+
+    def reload_if_changed(self):
+        """配置文件被外部修改时重新加载，返回是否重新加载"""
+        if not self.store.changed():
+            return False
+        try:
+            if not self.load_config():
+                return False
+        except (OSError, ValueError) as e:
+            self.logger.warning(f"重新加载配置失败: {str(e)}")
+            return False
+        self.status("⚙️ 配置文件已修改，已重新加载")
+        if self.on_config_reload:
+            self.on_config_reload()
+        return True
+
+    def config_complete(self):
+        """检查自动登录所需配置是否齐全"""
+        return all(self.config.get(field) for field in self.required_fields())
+
+    def required_fields(self, config=None):
+        """必须填写的账号字段；开启参数自动获取时networkParams可以留空"""
+        config = self.config if config is None else config
+        return [field for field in get_portal(config.get('portal')).required_fields
+                if not (self.capture_params and field == 'networkParams')]
+
+    @property
+    def portal(self):
+        """配置中portal对应的门户适配器，未配置时为锐捷ePortal"""
+        return get_portal(self.config.get('portal'))
+
+    def service_key(self):
+        """返回配置中的服务提供商代号"""
+        return self.portal.service_key(self.config)
+
+    def login_request(self):
+        """当前账号配置对应的登录请求，账号配置不变时复用上次编译的结果"""
+        key = (self.config.get('portal'), self.config.get('userAccount'), self.config.get('encryptedPassword'),
+               self.config.get('serviceName'), self.config.get('targetUrl'))
+        cached = self._login_request
+        if cached is None or cached[0] != key:
+            cached = self._login_request = (key, self.portal.compile(self.config))
+        return cached[1]
+
+    def load_session(self):
+        """读取上次保存的会话，文件不存在或损坏时返回None"""
+        try:
+            with open(self.session_file, 'r', encoding='utf-8') as f:
+                session = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return session if isinstance(session, dict) and session.get('account') else None
+
+    def save_session(self, result):
+        """保存登录成功后的会话信息（锐捷门户为userIndex及其解码字段）"""
+        self.session = {
+            'userIndex': result.user_index,
+            'decoded': result.decoded,
+            'deviceId': result.device_id,
+            'ip': result.ip,
+            'account': result.account,
+            'service': self.config.get('serviceName'),
+            'portal': self.portal.name,
+            'loginTime': time.time(),
+        }
+        try:
+            tmp_path = self.session_file + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.session, f, ensure_ascii=False)
+            os.replace(tmp_path, self.session_file)
+        except OSError as e:
+            self.logger.warning(f"保存会话信息失败: {str(e)}")
+
+    def forget_session(self):
+        """丢弃已保存的会话，下次登录直接发送完整请求"""
+        if self.session is None:
+            return
+        self.session = None
+        try:
+            os.remove(self.session_file)
+        except OSError:
+            pass
+
+    def check_session(self):
+        """用门户的在线信息接口检查已保存的会话，返回 (是否有效, 响应数据)；请求失败时返回 (None, None)"""
+        session = self.session
+        request = self.portal.session_request(self.config, session) if session is not None else None
+        if request is None:
+            return False, None
+        method, url, data = request
+        started = time.perf_counter()
+        try:
+            response = self.http.request(method, url, data=data, timeout=5)
+            valid, data = self.portal.session_valid(response.text, session)
+        except Exception as e:
+            SESSION_CHECK_TOTAL.labels(result="error").inc()
+            self.logger.warning(f"会话检查失败: {str(e)}")
+            return None, None
+        finally:
+            SESSION_CHECK_SECONDS.observe(time.perf_counter() - started)
+        SESSION_CHECK_TOTAL.labels(result="valid" if valid else "expired").inc()
+        return valid, data
+
+    def _reuse_session(self):
+        """会话仍有效时返回由缓存字段构造的LoginResult，否则返回None"""
+        session = self.session
+        if session is None or session.get('account') != self.config.get('userAccount') \
+                or session.get('service') != self.config.get('serviceName') \
+                or session.get('portal', DEFAULT_PORTAL) != self.portal.name:
+            return None
+        valid, data = self.check_session()
+        if not valid:
+            if valid is False:
+                self.logger.info("已保存的会话已失效，重新登录")
+                self.forget_session()
+            return None
+        result = LoginResult()
+        result.ok = True
+        result.reused = True
+        result.body = json.dumps(data, ensure_ascii=False)
+        result.length = len(result.body)
+        result.user_index = session.get('userIndex')
+        result.decoded = session.get('decoded')
+        result.device_id = session.get('deviceId')
+        result.ip = session.get('ip')
+        result.account = session.get('account')
+        result.account_match = True
+        self.logger.info(f"会话仍有效，跳过登录: {result.account}")
+        self.set_state("网络状态: 已连接")
+        return result
+
+    @property
+    def login_in_progress(self):
+        """是否有登录请求正在进行"""
+        return self._login_inflight is not None
+
+    def login(self, reuse=True, manual=False):
+        """执行登录，返回LoginResult；已有登录在进行时不再重复发送，直接等待其结果；
+        reuse为True时先检查已保存的会话，仍有效就不再发送登录请求；
+        manual为True表示用户主动登录，不受熔断和限流限制；进行中的是自动登录时，
+        主动登录等它结束后再发送自己的请求（配置可能刚修改过，自动登录的结果不能代替）"""
+        while True:
+            with self._login_lock:
+                inflight = self._login_inflight
+                if inflight is None:
+                    inflight = self._login_inflight = (threading.Event(), [], manual, reuse)
+                    break
+            done, holder, inflight_manual, inflight_reuse = inflight
+            merge = not manual or (inflight_manual and (reuse or not inflight_reuse))
+            self.logger.info("登录请求已在进行，合并本次请求" if merge else "登录请求已在进行，结束后再发送本次登录")
+            done.wait()
+            if merge:
+                return holder[0]
+        done, holder = inflight[:2]
+
+        started = time.perf_counter()
+        try:
+            try:
+                result = (self._reuse_session() if reuse else None) or self._guarded_login(manual)
+            except Exception as e:
+                # 等待中的调用者也要拿到结果，异常转为失败的LoginResult
+                result = LoginResult()
+                result.exception = e
+                result.error = str(e)
+                self.logger.error(f"登录出错: {str(e)}")
+                self.set_state("网络状态: 连接失败")
+            holder.append(result)
+            LOGIN_SECONDS.observe(time.perf_counter() - started)
+            if result.reused:
+                LOGIN_TOTAL.labels(result="reused").inc()
+            elif result.failure == "blocked":
+                LOGIN_TOTAL.labels(result="blocked").inc()
+            elif result.ok:
+                LOGIN_TOTAL.labels(result="ok").inc()
+            else:
+                LOGIN_TOTAL.labels(result="error" if result.exception is not None else "rejected").inc()
+        finally:
+            with self._login_lock:
+                self._login_inflight = None
+            done.set()
+        return holder[0]
+
+    def _on_breaker_change(self, description):
+        """熔断器状态变化时在状态页提示"""
+        self.logger.warning(description)
+        self.status(f"🚦 {description}")
+
+    def _guarded_login(self, manual):
+        """经过熔断器和令牌桶后发送登录请求，并把结果反馈给熔断器"""
+        breaker, bucket = self.breaker, self.login_bucket
+        if not manual:
+            reason = None
+            if breaker is not None and not breaker.allow():
+                reason = f"登录熔断已打开，{breaker.remaining():.0f} 秒后再试"
+            elif bucket is not None and not bucket.take():
+                if breaker is not None:
+                    breaker.release()
+                reason = f"登录过于频繁，{bucket.wait_time():.0f} 秒后再试"
+            if reason:
+                result = LoginResult()
+                result.error = reason
+                result.failure = "blocked"
+                self.logger.warning(f"跳过登录: {reason}")
+                self.status(f"⏸️ {reason}")
+                return result
+
+        result = self._login(capture=not manual)
+        if breaker is not None:
+            if result.ok:
+                breaker.record_success()
+            else:
+                breaker.record_failure(result.failure)
+        return result
+
+    def _login(self, capture=True):
+        """按门户适配器编译好的请求发送登录请求，并交给适配器解析响应；
+        capture为False时（用户主动登录）只在配置中没有网络参数时才请求门户获取"""
+        result = LoginResult()
+        try:
+            request = self.login_request()
+            payload = request.render(self.network_params(capture))
+
+            # 发送请求
+            self.logger.info(f"发送登录请求: {self.config['userAccount']}")
+            with LOGIN_HTTP_SECONDS.time():
+                if request.method == "GET":
+                    response = self.http.get(payload, timeout=30)
+                else:
+                    response = self.http.post(request.url, data=payload, headers=request.headers, timeout=30)
+
+            # 处理响应
+            text = response.text
+            result.status_code = response.status_code
+            result.body = text
+            result.length = len(text)
+            self.logger.info(f"登录响应: 状态码 {response.status_code}, 长度 {len(text)}")
+
+            self.portal.parse_login(result, response.status_code, text, self.config, self.logger)
+            if result.failure == FAILURE_AUTH:
+                self.forget_params()
+            if result.ok:
+                self.logger.info(f"登录成功: {result.account}")
+                self.save_session(result)
+                self.set_state("网络状态: 已连接")
+            else:
+                self.set_state("网络状态: 连接失败")
+        except Exception as e:
+            import requests
+
+            result.exception = e
+            result.failure = FAILURE_TIMEOUT if isinstance(e, requests.Timeout) else FAILURE_NETWORK
+            self.logger.error(f"登录失败: {str(e)}")
+            self.set_state("网络状态: 连接失败")
+        return result
+
+    def network_params(self, capture=True):
+        """登录使用的queryString：优先用配置中的值，为空或已过期时用从门户跳转地址获取的参数；
+        绑定网卡时终端IP换成该网卡的地址"""
+        configured = self.config.get('networkParams', '')
+        params = configured
+        self._params_key = None
+        if self.capture_params and (not configured or self.params_stale(configured)):
+            params = self.captured_params(capture or not configured) or configured
+        return self.binding.rewrite_query(params) if self.binding is not None else params
+
+    def params_stale(self, params):
+        """配置中的参数是否已过期：门户拒绝过这组参数，或其中的终端IP不是本机当前地址；
+        按网卡登录时终端IP会换成网卡地址，不按IP判断"""
+        if params == self._stale_params:
+            return True
+        user_ip = query_user_ip(params)
+        if self.binding is not None or user_ip is None:
+            return False
+        address = local_address(*self.portal_address())
+        return address is not None and address != user_ip
+
+    def portal_address(self):
+        """认证门户的 (主机, 端口)"""
+        parts = urlsplit(self.config.get('targetUrl') or self.portal.default_target_url)
+        return parts.hostname, parts.port or 80
+
+    def captured_params(self, capture=True):
+        """当前IP/MAC对应的门户参数：先查缓存，没有且capture为True时从门户跳转地址获取；都取不到时返回None"""
+        host, port = self.portal_address()
+        key = link_key(host, port, self.binding)
+        if key is None:
+            return None
+        query = self.param_cache.get(key)
+        if query is None and capture and key != self._capture_missed:
+            query = self.capture_redirect(key)
+            self._capture_missed = None if query else key
+        if not query:
+            return None
+        self._params_key = key
+        return self.portal.params_from_query(query, self.config.get('networkParams', ''))
+
+    def capture_redirect(self, key, location=None):
+        """发送未认证的检测请求并跟随门户跳转，取出查询串存入缓存；已在线或找不到门户地址时返回None"""
+        if location is None:
+            state, location = self.detector.detect()
+            if state != NET_CAPTIVE:
+                return None
+        query = follow_redirects(self.http, location, self.portal_address()[0])
+        if query is None:
+            self.logger.warning(f"未能从门户跳转地址获取网络参数: {location}")
+            return None
+        self.param_cache.put(key, query)
+        self.logger.info(f"已从门户跳转地址获取网络参数: {key}")
+        self.status("🔗 已从门户跳转地址获取网络参数")
+        return query
+
+    def remember_redirect(self, location):
+        """门户检测被拦截时记下跳转地址中的参数，随后的重新登录直接使用"""
+        self._capture_missed = None
+        host, port = self.portal_address()
+        query = redirect_query(location, host)
+        if not self.capture_params or query is None:
+            return
+        key = link_key(host, port, self.binding)
+        if key is not None and self.param_cache.get(key) != query:
+            self.param_cache.put(key, query)
+            self.logger.info(f"已从门户跳转地址获取网络参数: {key}")
+
+    def forget_params(self):
+        """登录被拒绝时丢弃本次使用的参数：缓存的参数下次重新获取，配置中的参数视为过期"""
+        if self._params_key is not None:
+            self.param_cache.discard(self._params_key)
+            self._params_key = None
+        elif self.capture_params and self.config.get('networkParams'):
+            self._stale_params = self.config['networkParams']
+        self._capture_missed = None
+
+    def refresh_binding(self):
+        """绑定网卡的地址变化后丢弃按旧地址建立的连接"""
+        if self.binding is None or not self.binding.refresh():
+            return
+        self.logger.info(f"网卡地址已变化: {self.binding}")
+        for session in (self._http, self._probe_http):
+            if session is not None:
+                session.close()
+        self._http = self._probe_http = None
+        if self._detector is not None:
+            self._detector.session = self.probe_http
+
+    def request_login(self):
+        """需要重新登录时调用：交给login_handler处理，未设置时直接登录"""
+        RELOGIN_TOTAL.inc()
+        if self.login_handler:
+            self.login_handler()
+        else:
+            self.login()
+
+    def check_health(self):
+        """依次检查本机接口、网关、认证门户和外网，返回HealthReport"""
+        host, port = self.portal_address()
+        checker = TieredHealthCheck(host, port, detector_getter=lambda: self.detector,
+                                    binding=self.binding)
+        with CONNECTIVITY_SECONDS.time():
+            report = checker.run()
+        CONNECTIVITY_TOTAL.labels(result=report.failed_tier or "ok").inc()
+        self.logger.info(f"分层检查: {report}")
+        return report
+
+    def is_network_connected(self):
+        """认证门户是否可达（可以尝试登录）"""
+        return self.check_health().portal_reachable
+
+    def wait_for_network(self):
+        """登录前等待网络连通，超过最大尝试次数返回False"""
+        for attempt in range(1, self.max_initial_check_attempts + 1):
+            self.status(f"🔍 检查网络连接 ({attempt}/{self.max_initial_check_attempts})...")
+            self.logger.info(f"检查网络连接 ({attempt}/{self.max_initial_check_attempts})")
+
+            report = self.check_health()
+            self.status(str(report))
+            if report.portal_reachable:
+                message = "外网已可达" if report.online else "认证门户可达，准备登录..."
+                self.status(f"✅ {message}")
+                self.logger.info(message)
+                return True
+
+            # 每次等待时间递增；接口或网关不通多是刚开机或换网，等待上限较短，且网络变化时立即重试
+            failed = report.failed_tier
+            wait_time = self.initial_check_delay * attempt
+            if failed in (TIER_INTERFACE, TIER_GATEWAY):
+                wait_time = min(wait_time, 15)
+            self.status(f"❌ {TIER_NAMES[failed]}检查失败，等待 {wait_time} 秒后重试...")
+            self.logger.warning(f"{TIER_NAMES[failed]}检查失败，等待 {wait_time} 秒后重试")
+            self._network_changed.clear()
+            self._network_changed.wait(wait_time)
+
+        self.status(f"❗ 尝试 {self.max_initial_check_attempts} 次后仍无法连接网络，登录失败")
+        self.logger.error(f"尝试 {self.max_initial_check_attempts} 次后仍无法连接网络")
+        self.set_state("网络状态: 未连接")
+        return False
+
+    def check_network_status(self):
+        """检查网络状态，被门户拦截时触发重新登录，返回网络状态"""
+        started = time.perf_counter()
+        current_time = time.strftime("%Y-%m-%d %H:%M:%S")
+        self.status(f"🔍 [{current_time}] 正在检查网络连接...")
+
+        if self.captive_mode:
+            state, detail = self.detector.detect()
+            if state == NET_ONLINE:
+                self.status(f"✅ [{current_time}] 门户检测: 外网可达")
+            elif state == NET_CAPTIVE:
+                self.status(f"🔒 [{current_time}] 门户检测: 被认证门户拦截 ({detail})")
+                self.forget_session()  # 已被门户拦截，不必再检查旧会话
+                self.remember_redirect(detail)
+            else:
+                # 检测地址本身可能被屏蔽，用站点探测确认是否真的离线
+                self.status(f"❌ [{current_time}] 门户检测失败: {detail}")
+                winner, failures = self.prober.probe_first(self.check_sites)
+                if winner is not None:
+                    self.status(f"✅ [{current_time}] 连接 {winner.site} 成功")
+                    state = NET_ONLINE
+                elif failures and all(result.stage == "dns" for result in failures):
+                    self.status(f"❌ [{current_time}] 所有站点DNS解析失败，可能是DNS服务器故障")
+        else:
+            winner, failures = self.prober.probe_first(self.check_sites)
+            for result in failures:
+                reason = "DNS解析失败" if result.stage == "dns" else "连接失败"
+                self.status(f"❌ [{current_time}] 连接 {result.site} 失败（{reason}）")
+            if winner is not None:
+                self.status(f"✅ [{current_time}] 连接 {winner.site} 成功")
+                state = NET_ONLINE
+            else:
+                state = NET_CAPTIVE  # 兼容旧行为：全部失败即视为需要登录
+
+        if state != self.last_state:
+            # 只在状态变化时记录，离线分析据此计算断网时长
+            self.logger.info(f"网络状态变化: {self.last_state or '未知'} -> {state}")
+        if state == NET_ONLINE:
+            self.set_state("网络状态: 已连接")
+            self.status(f"✅ [{current_time}] 网络连接正常")
+        elif state == NET_CAPTIVE:
+            self.set_state("网络状态: 未认证")
+            self.status(f"❗ [{current_time}] 网络未认证，尝试重新登录...")
+            self.logger.warning("网络未认证，尝试重新登录")
+            self.request_login()
+        else:
+            self.set_state("网络状态: 未连接")
+            self.status(f"❗ [{current_time}] 网络不可达，非认证问题，跳过登录")
+            self.logger.warning("网络不可达，跳过登录")
+        CHECK_TOTAL.labels(state=state).inc()
+        CHECK_SECONDS.observe(time.perf_counter() - started)
+        self.last_state = state
+        self.last_check_at = current_time
+        return state
+
+    def ping_test(self):
+        """并发测试所有检查站点的连接延迟，返回结果文本行"""
+        results = []
+        for result in self.prober.probe_all(self.check_sites):
+            if result.ok:
+                dns = f"DNS {result.dns_ms:.1f}ms" if result.dns_source == "dns" else f"DNS {result.dns_source}"
+                results.append(f"✅ {result.site}: {result.latency:.2f}ms "
+                               f"({dns}, 连接 {result.connect_ms:.1f}ms)")
+            elif result.stage == "dns":
+                results.append(f"❌ {result.site}: DNS解析失败 ({str(result.error)})")
+            else:
+                results.append(f"❌ {result.site}: 连接失败 ({str(result.error)})")
+            self.status(results[-1])
+        if self.quality is not None:
+            for line in self.quality.report_lines():
+                results.append(line)
+                self.status(line)
+        result_text = "\n".join(results)
+        self.logger.info(f"Ping测试结果:\n{result_text}")
+        return results
+
+    def set_check_sites(self, lines):
+        """设置检查站点：每行为“站点 [固定地址 ...]”，地址格式错误时抛出ValueError"""
+        sites, pinned = [], {}
+        for line in lines:
+            parts = line.split()
+            if not parts:
+                continue
+            for address in parts[1:]:
+                ipaddress.ip_address(address)
+            sites.append(parts[0])
+            if len(parts) > 1:
+                pinned[parts[0]] = parts[1:]
+
+        self.check_sites = sites
+        self.pinned_sites = pinned
+        resolver = self.prober.resolver
+        resolver.unpin_all()
+        for host, addresses in pinned.items():
+            resolver.pin(host, addresses)
+        resolver.prefetch(site for site in sites if site not in pinned)
+        return sites
+
+    def site_lines(self):
+        """返回用于显示的站点配置行"""
+        return [" ".join([site] + self.pinned_sites.get(site, [])) for site in self.check_sites]
+
+    def start_monitor(self, background=True):
+        """启动网络监控，已在运行时返回False；background为False时在当前线程运行直到停止"""
+        if self.monitoring:
+            return False
+        self.monitoring = True
+        self._monitor_generation += 1
+        self.scheduler.reset()
+        self._wake.clear()
+        self.logger.info(f"启动网络监控，间隔 {self.ping_interval} 秒")
+        self.prober.resolver.prefetch(site for site in self.check_sites if site not in self.pinned_sites)
+        if self.watch_links and NetlinkWatcher.available():
+            self.link_watcher = NetlinkWatcher(self.on_link_change, logger=self.logger)
+            self.link_watcher.start()
+        if self.quality_interval:
+            if self.quality is None:
+                self.quality = QualityMonitor(self.prober, lambda: self.probe_http,
+                                              lambda: list(self.check_sites), interval=self.quality_interval,
+                                              p95_threshold=self.quality_p95,
+                                              history=QualityHistory(os.path.join(self.app_dir, "quality.db")),
+                                              logger=self.logger, on_status=self.status)
+            self.quality.start()
+        if not background:
+            self.monitor_loop(self._monitor_generation)
+            return True
+        self.monitor_thread = threading.Thread(target=self.monitor_loop, args=(self._monitor_generation,),
+                                               daemon=True)
+        self.monitor_thread.start()
+        return True
+
+    def stop_monitor(self):
+        """停止网络监控线程，正在等待的监控会立即退出"""
+        self.monitoring = False
+        self._wake.set()
+        if self.quality is not None:
+            self.quality.stop()
+        if self.link_watcher is not None:
+            self.link_watcher.stop()
+            self.link_watcher = None
+        self.logger.info("停止网络监控")
+
+    def set_ping_interval(self, seconds):
+        """修改监控间隔，立即生效"""
+        self.ping_interval = seconds
+        self.recheck_now()
+
+    def on_link_change(self, reason):
+        """网络变化回调：清除退避状态并立即检查"""
+        self.status(f"🔌 检测到网络变化（{reason}），立即检查")
+        self.logger.info(f"检测到网络变化: {reason}")
+        self.scheduler.reset()
+        self._network_changed.set()
+        self.recheck_now()
+
+    def recheck_now(self):
+        """打断当前等待，立即进行下一次检查"""
+        self._wake.set()
+
+    def monitor_loop(self, generation):
+        """网络监控主循环"""
+        while self.monitoring and generation == self._monitor_generation:
+            try:
+                self.reload_if_changed()
+                self.refresh_binding()
+                state = self.check_network_status()
+            except Exception as e:
+                self.logger.error(f"网络监控出错: {str(e)}")
+                state = NET_OFFLINE
+            delay = self.scheduler.next_delay(state, self.ping_interval)
+            if delay < self.ping_interval:
+                self.logger.info(f"{delay:.1f} 秒后再次检查")
+            self._wake.wait(delay)
+            self._wake.clear()
+
+
+class InterfaceLogger(logging.LoggerAdapter):
+    """在日志消息前加上网卡名"""
+
+    def process(self, msg, kwargs):
+        return f"[{self.extra['interface']}] {msg}", kwargs
+
+
+class InterfaceGroup:
+    """多网卡模式：每个网卡一个绑定到该网卡的引擎，共用配置文件，
+    各自保存会话、状态和熔断器，并发检查与登录"""
+
+    def __init__(self, app_dir, bindings, logger=None, on_status=None):
+        self.app_dir = app_dir
+        self.logger = logger or logging.getLogger("CampusNetworkLogin")
+        self.engines = {}
+        self.control = None
+        self._stopped = threading.Event()
+        for binding in bindings:
+            if binding.device and not binding.device_allowed:
+                self.logger.warning(f"没有权限绑定网卡 {binding.device}（需要root或CAP_NET_RAW），只绑定源地址")
+            prefix = f"[{binding.name}] "
+            engine = LoginEngine(app_dir, logger=InterfaceLogger(self.logger, {'interface': binding.name}),
+                                 on_status=(lambda message, p=prefix: on_status(p + message)) if on_status else None,
+                                 binding=binding)
+            engine.setting_overrides['qualityInterval'] = 0  # 连接质量历史不区分网卡，多网卡模式下不采样
+            engine.metrics_port = 0
+            self.engines[binding.name] = engine
+
+    def set_override(self, key, value):
+        for engine in self.engines.values():
+            engine.setting_overrides[key] = value
+
+    def load_config(self):
+        return all([engine.load_config() for engine in self.engines.values()])
+
+    def config_complete(self):
+        return all(engine.config_complete() for engine in self.engines.values())
+
+    def _each(self, function):
+        """对每个引擎并发执行function，返回 网卡名 -> 返回值"""
+        with ThreadPoolExecutor(max_workers=len(self.engines)) as executor:
+            futures = {name: executor.submit(function, engine) for name, engine in self.engines.items()}
+            return {name: future.result() for name, future in futures.items()}
+
+    def run_once(self, force=False):
+        """每个网卡检查一次并在需要时登录，返回各网卡中最差的退出码"""
+        return max(self._each(lambda engine: run_once(engine, force)).values())
+
+    def status_snapshot(self):
+        return {'pid': os.getpid(),
+                'interfaces': {name: engine.status_snapshot() for name, engine in self.engines.items()}}
+
+    def start_control(self):
+        def relogin():
+            for engine in self.engines.values():
+                engine.control_commands()['relogin']()
+
+        def check():
+            for engine in self.engines.values():
+                engine.recheck_now()
+
+        self.control = ControlServer(self.app_dir, {'status': self.status_snapshot, 'relogin': relogin,
+                                                    'check': check}, logger=self.logger)
+        if not self.control.start():
+            self.control = None
+
+    def start_metrics(self, port):
+        """指标是进程级的，由第一个引擎导出"""
+        engine = next(iter(self.engines.values()))
+        engine.metrics_port = port
+        engine.start_metrics()
+
+    def login(self, reuse=True, manual=False):
+        return self._each(lambda engine: engine.login(reuse=reuse, manual=manual))
+
+    def start_monitor(self, background=True):
+        """各网卡在自己的线程中监控；background为False时阻塞直到close"""
+        for engine in self.engines.values():
+            engine.start_monitor()
+        if not background:
+            self._stopped.wait()
+
+    def close(self):
+        self._stopped.set()
+        if self.control is not None:
+            self.control.stop()
+            self.control = None
+        for engine in self.engines.values():
+            engine.close()
+
+
+def run_once(engine, force=False):
+    """检查一次网络，需要时登录，返回命令行退出码"""
+    started = time.perf_counter()
+    results = []
+    if force:
+        results.append(engine.login(reuse=False, manual=True))
+        state = NET_CAPTIVE
+    else:
+        engine.login_handler = lambda: results.append(engine.login())
+        state = engine.check_network_status()
+    engine.logger.info(f"检查完成，耗时: {(time.perf_counter() - started) * 1000:.0f} ms")
+    if state == NET_CAPTIVE:
+        return 0 if results and results[-1].ok else 1
+    return 1 if state == NET_OFFLINE else 0
+
+
+def main(argv=None):
+    """命令行入口：--once 检查一次并在需要时登录，--daemon 持续监控"""
+    parser = argparse.ArgumentParser(description="校园网认证工具（无界面模式）")
+    mode = parser.add_mutually_exclusive_group(required=True)
+    mode.add_argument("--once", action="store_true", help="检查一次网络，需要时登录后退出")
+    mode.add_argument("--daemon", action="store_true", help="后台持续监控并自动重新登录")
+    mode.add_argument("--control", metavar="COMMAND",
+                      help="向正在运行的实例发送命令：status 查询状态，relogin 重新认证，check 立即检查")
+    parser.add_argument("--force", action="store_true", help="不检查网络状态，直接登录")
+    parser.add_argument("--interval", type=int, help="监控间隔（秒，最小10）")
+    parser.add_argument("--app-dir", default=os.path.dirname(os.path.abspath(sys.argv[0])),
+                        help="配置与日志所在目录")
+    parser.add_argument("--metrics-port", type=int, default=DEFAULT_METRICS_PORT,
+                        help=f"本机指标接口端口，0表示不开启（默认{DEFAULT_METRICS_PORT}）")
+    parser.add_argument("--no-link-watch", action="store_true", help="不监听网络变化，仅定时检查")
+    parser.add_argument("--no-capture-params", action="store_true",
+                        help="不从门户跳转地址自动获取网络参数，只使用配置中的networkParams")
+    parser.add_argument("--log-json", action="store_true", help="日志文件按行写入JSON")
+    parser.add_argument("--interface", action="append", metavar="NIC",
+                        help="只通过指定网卡（网卡名或IPv4地址）检查和登录，可多次指定，各网卡分别认证；"
+                             "all 表示所有有IPv4地址的网卡")
+    parser.add_argument("-v", "--verbose", action="store_true", help="在控制台输出状态消息")
+    args = parser.parse_args(argv)
+
+    if args.control:
+        try:
+            reply = send_command(args.app_dir, args.control)
+        except (OSError, ValueError) as e:
+            print(f"没有正在运行的实例: {str(e)}", file=sys.stderr)
+            return 3
+        print(json.dumps(reply, ensure_ascii=False, indent=2))
+        return 0 if reply.get('ok') else 1
+
+    logger = setup_logging(args.app_dir, json_format=args.log_json)
+    on_status = (lambda message: print(message, flush=True)) if args.verbose else None
+    if args.interface:
+        specs = [name for name, _ in list_interfaces()] if args.interface == ["all"] else args.interface
+        try:
+            bindings = [InterfaceBinding.resolve(spec) for spec in specs]
+        except ValueError as e:
+            logger.error(str(e))
+            return 2
+        if not bindings:
+            logger.error("没有找到可用的网卡")
+            return 2
+        engine = InterfaceGroup(args.app_dir, bindings, logger=logger, on_status=on_status)
+    else:
+        engine = LoginEngine(args.app_dir, logger=logger, on_status=on_status)
+    if args.interval is not None:
+        engine.set_override('pingInterval', max(10, args.interval))
+    if args.no_link_watch:
+        engine.set_override('watchLinks', False)
+    if args.no_capture_params:
+        engine.set_override('captureParams', False)
+
+    try:
+        if not engine.load_config() or not engine.config_complete():
+            logger.error("配置不完整，无法自动登录")
+            return 2
+    except Exception as e:
+        logger.error(f"加载配置失败: {str(e)}")
+        return 2
+
+    try:
+        if args.once:
+            if isinstance(engine, InterfaceGroup):
+                return engine.run_once(args.force)
+            return run_once(engine, args.force)
+
+        lock = InstanceLock(os.path.join(args.app_dir, LOCK_FILE_NAME))
+        if not lock.acquire():
+            logger.error("已有实例在运行，可用 --control status 查询其状态")
+            return 3
+        logger.info("以守护模式运行")
+        engine.start_control()
+        engine.start_metrics(args.metrics_port)
+        if args.force:
+            engine.login(reuse=False, manual=True)  # 用户明确要求登录：不复用会话，也不受熔断和限流限制
+        engine.start_monitor(background=False)
+    except KeyboardInterrupt:
+        logger.info("收到中断信号，退出")
+    finally:
+        engine.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
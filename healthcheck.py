@@ -0,0 +1,176 @@
+"""分层网络健康检查：本机接口/路由 → 网关 → 认证门户 → 外网，根据第一个失败的层级决定下一步"""
+import errno
+import socket
+import sys
+import time
+
+from netcore import NET_CAPTIVE, NET_ONLINE
+
+TIER_INTERFACE = "interface"
+TIER_GATEWAY = "gateway"
+TIER_PORTAL = "portal"
+TIER_INTERNET = "internet"
+TIER_NAMES = {
+    TIER_INTERFACE: "本机接口",
+    TIER_GATEWAY: "网关",
+    TIER_PORTAL: "认证门户",
+    TIER_INTERNET: "外网",
+}
+
+# 这些错误说明目标主机确实不可达，而不是被防火墙静默丢弃
+UNREACHABLE_ERRNOS = {errno.EHOSTUNREACH, errno.ENETUNREACH, errno.EHOSTDOWN}
+
+
+def default_gateway(device=None):
+    """从 /proc/net/route 读取默认网关地址（仅Linux），指定device时只找该网卡的默认路由，找不到时返回None"""
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        with open("/proc/net/route") as f:
+            next(f)
+            for line in f:
+                fields = line.split()
+                # 目标为0且带RTF_GATEWAY(0x2)标志的是默认路由
+                if len(fields) > 3 and fields[1] == "00000000" and int(fields[3], 16) & 0x2 \
+                        and device in (None, fields[0]):
+                    return socket.inet_ntoa(int(fields[2], 16).to_bytes(4, 'little'))
+    except (OSError, ValueError, StopIteration):
+        pass
+    return None
+
+
+def arp_resolved(address):
+    """ARP表中是否有该地址的完整条目（仅Linux）"""
+    try:
+        with open("/proc/net/arp") as f:
+            next(f)
+            for line in f:
+                fields = line.split()
+                if len(fields) > 2 and fields[0] == address and int(fields[2], 16) & 0x2:
+                    return True
+    except (OSError, ValueError, StopIteration):
+        pass
+    return False
+
+
+def tcp_reachable(host, port, timeout, binding=None):
+    """TCP探测：连接成功返回True，连接被拒绝返回"refused"，明确不可达返回False，超时返回None"""
+    try:
+        if binding is None:
+            with socket.create_connection((host, port), timeout=timeout):
+                return True
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+            binding.apply(sock)
+            sock.settimeout(timeout)
+            sock.connect((host, port))
+            return True
+    except ConnectionRefusedError:
+        return "refused"
+    except socket.timeout:
+        return None
+    except OSError as e:
+        return False if e.errno in UNREACHABLE_ERRNOS else None
+
+
+class TierResult:
+    """单个层级的检查结果；ok为None表示无法判断（跳过或超时），不作为失败处理"""
+
+    __slots__ = ("tier", "ok", "detail", "ms")
+
+    def __init__(self, tier, ok, detail="", ms=0.0):
+        self.tier = tier
+        self.ok = ok
+        self.detail = detail
+        self.ms = ms
+
+    def __str__(self):
+        mark = "✅" if self.ok else ("❔" if self.ok is None else "❌")
+        detail = f" {self.detail}" if self.detail else ""
+        return f"{mark} {TIER_NAMES[self.tier]}{detail} ({self.ms:.0f}ms)"
+
+
+class HealthReport:
+    """一次分层检查的结果"""
+
+    def __init__(self, results):
+        self.results = results
+
+    @property
+    def failed_tier(self):
+        """第一个失败的层级，全部通过时为None"""
+        return next((r.tier for r in self.results if r.ok is False), None)
+
+    @property
+    def portal_reachable(self):
+        """门户及之前的层级都没有失败，可以尝试登录"""
+        return self.failed_tier in (None, TIER_INTERNET)
+
+    @property
+    def online(self):
+        return any(r.tier == TIER_INTERNET and r.ok for r in self.results)
+
+    def __str__(self):
+        return "，".join(str(r) for r in self.results)
+
+
+class TieredHealthCheck:
+    """按层级依次检查，遇到失败即停止"""
+
+    def __init__(self, portal_host, portal_port=80, detector_getter=None, timeout=1.5, binding=None):
+        self.portal_host = portal_host
+        self.portal_port = portal_port
+        self.detector_getter = detector_getter  # 返回门户检测器的函数，为None时跳过外网检查
+        self.timeout = timeout
+        self.binding = binding  # 绑定的网卡，为None时检查系统默认路由
+
+    def run(self):
+        results = []
+        for tier, check in ((TIER_INTERFACE, self._check_interface), (TIER_GATEWAY, self._check_gateway),
+                            (TIER_PORTAL, self._check_portal), (TIER_INTERNET, self._check_internet)):
+            started = time.perf_counter()
+            ok, detail = check()
+            results.append(TierResult(tier, ok, detail, (time.perf_counter() - started) * 1000))
+            if ok is False:
+                break
+        return HealthReport(results)
+
+    def _check_interface(self):
+        """用UDP套接字选路（不发送数据），判断本机是否有通往门户的接口和路由"""
+        try:
+            with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+                if self.binding is not None:
+                    self.binding.apply(sock)
+                sock.connect((self.portal_host, self.portal_port))
+                source = sock.getsockname()[0]
+        except OSError as e:
+            return False, f"无可用路由: {str(e)}"
+        if source in ("0.0.0.0", ""):
+            return False, "未获得IP地址"
+        return True, source
+
+    def _check_gateway(self):
+        gateway = default_gateway(self.binding.device if self.binding is not None else None)
+        if gateway is None:
+            return None, "未知"
+        reachable = tcp_reachable(gateway, 80, min(self.timeout, 1.0), self.binding)
+        if reachable or arp_resolved(gateway):
+            return True, gateway
+        if reachable is False:
+            return False, f"{gateway} 不可达"
+        return None, f"{gateway} 无响应"
+
+    def _check_portal(self):
+        reachable = tcp_reachable(self.portal_host, self.portal_port, self.timeout, self.binding)
+        if reachable is True:
+            return True, self.portal_host
+        if reachable == "refused":
+            return False, f"{self.portal_host} 拒绝连接"
+        return False, f"{self.portal_host} 不可达"
+
+    def _check_internet(self):
+        if self.detector_getter is None:
+            return None, ""
+        state, detail = self.detector_getter().detect()
+        if state == NET_ONLINE:
+            return True, ""
+        return False, "被门户拦截" if state == NET_CAPTIVE else "不可达"
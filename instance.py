@@ -0,0 +1,145 @@
+"""单实例锁与本地控制通道：第二次启动时通知已运行的实例，脚本可查询状态或要求重新认证"""
+import json
+import logging
+import os
+import socket
+import sys
+import threading
+
+LOCK_FILE_NAME = "instance.lock"
+CONTROL_SOCKET_NAME = "control.sock"  # 支持Unix域套接字的平台
+CONTROL_PORT_NAME = "control.port"  # 其他平台使用本机TCP端口，端口号写在这个文件里
+
+
+def unix_socket_supported():
+    return hasattr(socket, 'AF_UNIX')
+
+
+class InstanceLock:
+    """基于文件锁的单实例锁，进程退出时由系统自动释放"""
+
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+
+    def acquire(self):
+        """获取锁，已被其他进程持有时返回False"""
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self.file = open(self.path, 'a+')
+        try:
+            if sys.platform.startswith('win'):
+                import msvcrt
+                self.file.seek(0)
+                msvcrt.locking(self.file.fileno(), msvcrt.LK_NBLCK, 1)
+            else:
+                import fcntl
+                fcntl.flock(self.file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            self.file.close()
+            self.file = None
+            return False
+        self.file.seek(0)
+        self.file.truncate()
+        self.file.write(str(os.getpid()))
+        self.file.flush()
+        return True
+
+    def release(self):
+        if self.file is not None:
+            self.file.close()  # 关闭文件即释放锁
+            self.file = None
+
+
+class ControlServer:
+    """控制通道：每个连接发送一行命令，收到一行JSON回复后连接关闭"""
+
+    def __init__(self, app_dir, commands, logger=None):
+        self.app_dir = app_dir
+        self.commands = commands  # 命令名 -> 处理函数，返回可序列化为JSON的字典
+        self.logger = logger or logging.getLogger("CampusNetworkLogin")
+        self.sock = None
+        self.running = False
+
+    def start(self):
+        """开始监听，失败时只记录警告并返回False；调用前应已持有单实例锁"""
+        try:
+            if unix_socket_supported():
+                path = os.path.join(self.app_dir, CONTROL_SOCKET_NAME)
+                if os.path.exists(path):
+                    os.unlink(path)  # 持有锁说明这是上次异常退出留下的文件
+                self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                self.sock.bind(path)
+                os.chmod(path, 0o600)
+            else:
+                self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                self.sock.bind(("127.0.0.1", 0))
+                with open(os.path.join(self.app_dir, CONTROL_PORT_NAME), 'w') as f:
+                    f.write(str(self.sock.getsockname()[1]))
+            self.sock.listen(4)
+        except OSError as e:
+            self.logger.warning(f"控制通道启动失败: {str(e)}")
+            if self.sock is not None:
+                self.sock.close()
+                self.sock = None
+            return False
+        self.running = True
+        threading.Thread(target=self._serve, daemon=True).start()
+        self.logger.info("控制通道已启动")
+        return True
+
+    def stop(self):
+        self.running = False
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+            for name in (CONTROL_SOCKET_NAME, CONTROL_PORT_NAME):
+                try:
+                    os.unlink(os.path.join(self.app_dir, name))
+                except OSError:
+                    pass
+
+    def _serve(self):
+        while self.running:
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                break
+            with conn:
+                try:
+                    conn.settimeout(2)
+                    reply = self.handle(conn.makefile('r', encoding='utf-8').readline().strip())
+                    conn.sendall((json.dumps(reply, ensure_ascii=False) + "\n").encode('utf-8'))
+                except OSError:
+                    pass
+
+    def handle(self, command):
+        """执行一条命令并返回回复"""
+        handler = self.commands.get(command)
+        if handler is None:
+            return {'ok': False, 'error': f"未知命令: {command}", 'commands': sorted(self.commands)}
+        try:
+            reply = handler() or {}
+        except Exception as e:
+            self.logger.error(f"控制命令 {command} 执行出错: {str(e)}")
+            return {'ok': False, 'error': str(e)}
+        self.logger.info(f"收到控制命令: {command}")
+        return dict({'ok': True}, **reply)
+
+
+def send_command(app_dir, command, timeout=2):
+    """向已运行的实例发送命令并返回回复；没有实例在监听时抛出OSError"""
+    if unix_socket_supported():
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        address = os.path.join(app_dir, CONTROL_SOCKET_NAME)
+    else:
+        with open(os.path.join(app_dir, CONTROL_PORT_NAME), 'r') as f:
+            address = ("127.0.0.1", int(f.read().strip()))
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    with sock:
+        sock.settimeout(timeout)
+        sock.connect(address)
+        sock.sendall((command + "\n").encode('utf-8'))
+        data = sock.makefile('r', encoding='utf-8').readline()
+    if not data:
+        raise ConnectionError("控制通道没有回复")
+    return json.loads(data)
@@ -0,0 +1,134 @@
+"""基于rtnetlink的网络变化监听（仅Linux）"""
+import errno
+import logging
+import select
+import socket
+import struct
+import sys
+import threading
+import time
+
+NETLINK_ROUTE = 0
+
+# 订阅的多播组
+RTMGRP_LINK = 0x1
+RTMGRP_IPV4_IFADDR = 0x10
+RTMGRP_IPV4_ROUTE = 0x40
+RTMGRP_IPV6_IFADDR = 0x100
+RTMGRP_IPV6_ROUTE = 0x400
+
+# 消息类型
+RTM_NEWLINK = 16
+RTM_NEWADDR = 20
+RTM_NEWROUTE = 24
+RTM_DELROUTE = 25
+
+RT_TABLE_MAIN = 254
+IFF_RUNNING = 0x40
+
+NLMSGHDR = struct.Struct("=LHHLL")  # 长度, 类型, 标志, 序号, 端口
+IFINFOMSG = struct.Struct("=BxHiII")  # 协议族, 设备类型, 接口序号, 标志, 变化掩码
+RTMSG = struct.Struct("=BBBBBBBBI")  # 协议族, 目标前缀长度, 源前缀长度, tos, 路由表, 协议, 范围, 类型, 标志
+
+
+def parse_events(data):
+    """解析一批netlink消息，返回值得重新检查网络的事件说明列表"""
+    events = []
+    offset = 0
+    while offset + NLMSGHDR.size <= len(data):
+        length, msg_type, _, _, _ = NLMSGHDR.unpack_from(data, offset)
+        if length < NLMSGHDR.size:
+            break
+        body = offset + NLMSGHDR.size
+        if msg_type == RTM_NEWADDR:
+            events.append("接口获得新地址")
+        elif msg_type == RTM_NEWLINK and body + IFINFOMSG.size <= len(data):
+            _, _, index, flags, change = IFINFOMSG.unpack_from(data, body)
+            if change & IFF_RUNNING and flags & IFF_RUNNING:
+                events.append(f"接口 {index} 已连接")
+        elif msg_type in (RTM_NEWROUTE, RTM_DELROUTE) and body + RTMSG.size <= len(data):
+            _, dst_len, _, _, table, _, _, _, _ = RTMSG.unpack_from(data, body)
+            if dst_len == 0 and table == RT_TABLE_MAIN:
+                events.append("默认路由已变化")
+        # 消息按4字节对齐
+        offset += (length + 3) & ~3
+    return events
+
+
+class NetlinkWatcher:
+    """监听地址、链路和默认路由变化，短时间内的一串事件合并后只回调一次"""
+
+    def __init__(self, callback, debounce=1.0, logger=None):
+        self.callback = callback  # callback(说明)
+        self.debounce = debounce  # 合并事件的静默时间（秒）
+        self.logger = logger or logging.getLogger("CampusNetworkLogin")
+        self.running = False
+        self.sock = None
+        self.thread = None
+
+    @staticmethod
+    def available():
+        """当前平台是否支持netlink"""
+        return sys.platform.startswith('linux') and hasattr(socket, 'AF_NETLINK')
+
+    def start(self):
+        """打开netlink套接字并启动监听线程，失败时返回False"""
+        if self.running:
+            return True
+        try:
+            self.sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, NETLINK_ROUTE)
+            self.sock.bind((0, RTMGRP_LINK | RTMGRP_IPV4_IFADDR | RTMGRP_IPV6_IFADDR
+                            | RTMGRP_IPV4_ROUTE | RTMGRP_IPV6_ROUTE))
+        except OSError as e:
+            self.logger.warning(f"无法监听网络变化: {str(e)}")
+            if self.sock is not None:
+                self.sock.close()
+                self.sock = None
+            return False
+        self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        self.logger.info("已开始监听网络变化(netlink)")
+        return True
+
+    def stop(self):
+        """停止监听，线程会在一秒内退出并关闭套接字"""
+        self.running = False
+
+    def _run(self):
+        """监听线程：收到相关事件后等待静默期结束再回调"""
+        pending = []
+        fire_at = None
+        try:
+            while self.running:
+                timeout = 1.0 if fire_at is None else max(0.0, fire_at - time.monotonic())
+                readable = []
+                try:
+                    readable, _, _ = select.select([self.sock], [], [], min(timeout, 1.0))
+                    events = parse_events(self.sock.recv(65536)) if readable else []
+                except OSError as e:
+                    if e.errno == errno.EBADF:
+                        raise
+                    if e.errno == errno.ENOBUFS:
+                        # 事件过多时内核丢弃了部分消息，无法知道丢了什么，合并为一次检查
+                        self.logger.warning("网络变化事件过多，netlink缓冲区溢出，部分事件已丢失")
+                        events = ["网络变化事件过多"]
+                    else:
+                        self.logger.warning(f"网络变化监听出错，继续监听: {str(e)}")
+                        time.sleep(1.0)
+                        continue
+                if events:
+                    pending.extend(events)
+                    fire_at = time.monotonic() + self.debounce
+                elif not readable and fire_at is not None and time.monotonic() >= fire_at:
+                    reason = "，".join(dict.fromkeys(pending))
+                    pending, fire_at = [], None
+                    try:
+                        self.callback(reason)
+                    except Exception as e:
+                        self.logger.error(f"处理网络变化出错: {str(e)}")
+        except OSError as e:
+            self.logger.error(f"网络变化监听出错，已停止监听: {str(e)}")
+        finally:
+            self.running = False
+            self.sock.close()
@@ -0,0 +1,537 @@
+"""离线日志分析：流式解析多台机器的app.log（含轮转和gzip分段）与quality.db，
+按列存入NumPy数组后统计断网次数与时长、登录成功率、重连耗时和各站点延迟分位数"""
+import argparse
+import csv
+import gzip
+import json
+import os
+import re
+import sqlite3
+import sys
+import time
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import numpy as np
+except ImportError:  # 解析阶段不需要NumPy，统计前再提示安装
+    np = None
+
+from quality import KIND_CONNECT, KIND_HTTP
+
+LOG_FILE_PREFIX = "app.log"  # 当前日志及其轮转分段 app.log.1.gz、app.log.2026-10-17.gz 等
+QUALITY_DB_NAME = "quality.db"
+CHUNK_SIZE = 8 * 1024 * 1024  # 每次读取的字节数，按整行切分后整块交给正则
+QUANTILES = (0.5, 0.95, 0.99)
+
+# 事件类型
+EV_LOGIN_SENT = 0
+EV_LOGIN_OK = 1
+EV_LOGIN_FAIL = 2
+EV_LOGIN_REUSED = 3  # 会话仍有效，跳过登录
+EV_LOGIN_STATUS = 4  # 数值为HTTP状态码
+EV_DOWN = 5  # 网络断开、未认证或不可达
+EV_UP = 6  # 网络状态变为已连接
+EV_PING_OK = 7  # 数值为延迟毫秒
+EV_PING_FAIL = 8
+
+# 只匹配关心的消息（兼容旧版本的写法），以" - 级别 - "开头便于正则快速跳过无关内容；时间戳从行首截取。
+# 多网卡模式下消息前带有"[网卡] "，各网卡作为单独的来源统计
+_EVENT_RE = re.compile((
+    r" - [A-Z]+ - (?:\[(?P<nic>[^\]\s]+)\] )?(?:"
+    r"(?P<sent>发送登录请求)"
+    r"|(?P<ok>登录成功)"
+    r"|(?P<fail>登录失败|登录响应不是有效的JSON格式|登录响应中缺少userIndex字段|userIndex格式错误|登录响应数据格式异常)"
+    r"|(?P<reused>会话仍有效)"
+    r"|(?P<status>登录响应: 状态码 (?P<code>\d+))"
+    r"|(?P<down>网络连接断开|网络未认证|网络不可达)"
+    r"|(?P<change>网络状态变化: \S+ -> (?P<state>\w+))"
+    r"|(?P<probe>连接 (?P<probe_site>[^\s（(]+) 失败)"
+    r"|(?P<ping>Ping测试结果:))"
+).encode('utf-8'))
+_STAMP_RE = re.compile(rb"^\d{4}-\d\d-\d\d \d\d:\d\d:\d\d,\d{3} - ", re.M)
+STAMP_LENGTH = 23  # "YYYY-mm-dd HH:MM:SS,mmm"
+# Ping结果的各站点行没有时间戳，沿用“Ping测试结果”行的时间
+_RESULT_RE = re.compile(r"^(?:✅|❌) (?P<site>[^\s:]+): (?:(?P<latency>\d+(?:\.\d+)?)ms)?".encode('utf-8'), re.M)
+
+_GROUP_KINDS = {
+    'sent': EV_LOGIN_SENT,
+    'ok': EV_LOGIN_OK,
+    'fail': EV_LOGIN_FAIL,
+    'reused': EV_LOGIN_REUSED,
+    'down': EV_DOWN,
+}
+
+
+def find_inputs(paths):
+    """展开输入路径（目录递归查找），返回 (日志文件列表, quality.db列表)"""
+    logs, databases = [], []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for name in sorted(files):
+                    if name.startswith(LOG_FILE_PREFIX):
+                        logs.append(os.path.join(root, name))
+                    elif name == QUALITY_DB_NAME:
+                        databases.append(os.path.join(root, name))
+        elif os.path.basename(path) == QUALITY_DB_NAME:
+            databases.append(path)
+        else:
+            logs.append(path)
+    return logs, databases
+
+
+def read_blocks(path, chunk_size=CHUNK_SIZE):
+    """按块读取日志（.gz自动解压），每块只包含完整的行；JSON格式的日志转换为文本格式"""
+    opener = gzip.open if path.endswith(".gz") else open
+    json_lines = None
+    rest = b""
+    with opener(path, 'rb') as f:
+        while True:
+            data = f.read(chunk_size)
+            if not data:
+                block, rest = rest, b""
+            else:
+                data = rest + data
+                cut = data.rfind(b"\n") + 1
+                block, rest = data[:cut], data[cut:]
+            if block:
+                if json_lines is None:
+                    json_lines = block.lstrip()[:1] == b"{"
+                yield _json_to_text(block) if json_lines else block
+            if not data:
+                break
+
+
+def _json_to_text(block):
+    """把 --log-json 写出的行转换为文本格式，便于用同一个正则解析"""
+    lines = []
+    for line in block.splitlines():
+        try:
+            entry = json.loads(line)
+            stamp = entry['time']
+            lines.append(f"{stamp[:10]} {stamp[11:19]},{stamp[20:23]} - {entry['level']} - {entry['message']}")
+        except (ValueError, KeyError, TypeError):
+            continue
+    return ("\n".join(lines) + "\n").encode('utf-8')
+
+
+class EventColumns:
+    """按列累积的事件：时间戳文本、毫秒、类型、来源、站点编号、数值；时间戳留到最后批量转换"""
+
+    def __init__(self):
+        self.stamps = []  # b'YYYY-mm-dd HH:MM:SS'
+        self.millis = array('H')
+        self.kinds = array('b')
+        self.sources = array('i')
+        self.sites = array('i')  # 没有站点时为-1
+        self.values = array('d')  # 没有数值时为NaN
+        self.source_names = []
+        self.site_names = []
+        self._source_ids = {}
+        self._site_ids = {}
+        # quality.db 中的采样
+        self.q_sites = array('i')
+        self.q_kinds = array('b')
+        self.q_latency = array('d')  # 失败时为NaN
+        self.files = 0
+        self.bytes = 0
+
+    def source_id(self, name):
+        source = self._source_ids.get(name)
+        if source is None:
+            source = self._source_ids[name] = len(self.source_names)
+            self.source_names.append(name)
+        return source
+
+    def site_id(self, name):
+        site = self._site_ids.get(name)
+        if site is None:
+            site = self._site_ids[name] = len(self.site_names)
+            self.site_names.append(name)
+        return site
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def add_log(self, path, source_name=None):
+        """解析一个日志分段；同一目录下的分段属于同一台机器"""
+        source_name = source_name or os.path.dirname(path) or "."
+        pending = None
+        for block in read_blocks(path):
+            self.bytes += len(block)
+            pending = self._parse(block, source_name, pending)
+        self.files += 1
+
+    def _parse(self, block, source_name, pending):
+        """解析一块完整的行；pending为上一块末尾未结束的Ping结果所属的 (时间戳文本, 毫秒, 来源)，返回本块的该值"""
+        kinds, sources, sites, values = self.kinds, self.sources, self.sites, self.values
+        stamps, millis = self.stamps, self.millis
+        site_id = self.site_id
+        nan = float('nan')
+        source_id = self.source_id
+        if pending is not None:
+            pending = self._parse_results(block, 0, pending)
+        for match in _EVENT_RE.finditer(block):
+            start = match.start()
+            line = block.rfind(b"\n", 0, start) + 1
+            if start - line != STAMP_LENGTH or not block[line:line + 4].isdigit():
+                continue  # 不是以时间戳开头的日志行
+            stamp, ms = block[line:line + 19], int(block[line + 20:line + 23])
+            nic = match.group('nic')
+            source = source_id(f"{source_name} [{nic.decode('utf-8')}]" if nic else source_name)
+            group = match.lastgroup
+            site, value = -1, nan
+            kind = _GROUP_KINDS.get(group)
+            if kind is None:
+                if group == 'ping':
+                    pending = self._parse_results(block, match.end(), (stamp, ms, source))
+                    continue
+                if group == 'status':
+                    kind, value = EV_LOGIN_STATUS, float(match.group('code'))
+                elif group == 'change':
+                    kind = EV_UP if match.group('state') == b"online" else EV_DOWN
+                else:
+                    kind, site = EV_PING_FAIL, site_id(match.group('probe_site').decode('utf-8'))
+            stamps.append(stamp)
+            millis.append(ms)
+            kinds.append(kind)
+            sources.append(source)
+            sites.append(site)
+            values.append(value)
+        return pending
+
+    def _parse_results(self, block, pos, header):
+        """解析pos之后到下一条带时间戳的行之前的Ping结果，header为 (时间戳文本, 毫秒, 来源)；
+        延续到块末尾时返回header，否则返回None"""
+        following = _STAMP_RE.search(block, pos)
+        end = following.start() if following else len(block)
+        stamp, ms, source = header
+        for match in _RESULT_RE.finditer(block, pos, end):
+            latency = match.group('latency')
+            self.stamps.append(stamp)
+            self.millis.append(ms)
+            self.kinds.append(EV_PING_FAIL if latency is None else EV_PING_OK)
+            self.sources.append(source)
+            self.sites.append(self.site_id(match.group('site').decode('utf-8')))
+            self.values.append(float('nan') if latency is None else float(latency))
+        return None if following else header
+
+    def merge(self, other):
+        """并入另一个进程解析出的事件，来源和站点编号按名称重新映射"""
+        sources = [self.source_id(name) for name in other.source_names]
+        sites = [self.site_id(name) for name in other.site_names]
+        self.stamps += other.stamps
+        self.millis += other.millis
+        self.kinds += other.kinds
+        self.sources += array('i', [sources[source] for source in other.sources])
+        self.sites += array('i', [sites[site] if site >= 0 else -1 for site in other.sites])
+        self.values += other.values
+        self.q_sites += array('i', [sites[site] for site in other.q_sites])
+        self.q_kinds += other.q_kinds
+        self.q_latency += other.q_latency
+        self.files += other.files
+        self.bytes += other.bytes
+
+    def add_quality(self, path):
+        """读取一个quality.db中的全部采样"""
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        try:
+            cursor = conn.execute("SELECT site, kind, latency FROM samples")
+            site_id = self.site_id
+            nan = float('nan')
+            while True:
+                rows = cursor.fetchmany(100000)
+                if not rows:
+                    break
+                for site, kind, latency in rows:
+                    self.q_sites.append(site_id(site))
+                    self.q_kinds.append(kind)
+                    self.q_latency.append(nan if latency is None else latency)
+        finally:
+            conn.close()
+        self.files += 1
+
+    def to_arrays(self):
+        """转换为NumPy数组，按 (来源, 时间) 排序；时间为本地时间的秒数（不含时区）"""
+        if not self.stamps:
+            times = np.zeros(0)
+        else:
+            # 同一秒的日志很多，只解析不重复的时间戳文本
+            unique, inverse = np.unique(np.array(self.stamps, dtype='S19'), return_inverse=True)
+            seconds = unique.astype('U19').astype('datetime64[s]').astype(np.int64)
+            times = seconds[inverse] + np.frombuffer(self.millis, dtype=np.uint16) / 1000.0
+        sources = np.frombuffer(self.sources, dtype=np.int32)
+        order = np.lexsort((times, sources))
+        return {
+            'time': times[order],
+            'kind': np.frombuffer(self.kinds, dtype=np.int8)[order],
+            'source': sources[order],
+            'site': np.frombuffer(self.sites, dtype=np.int32)[order],
+            'value': np.frombuffer(self.values, dtype=np.float64)[order],
+            'q_site': np.frombuffer(self.q_sites, dtype=np.int32),
+            'q_kind': np.frombuffer(self.q_kinds, dtype=np.int8),
+            'q_latency': np.frombuffer(self.q_latency, dtype=np.float64),
+        }
+
+
+def parse_log(path):
+    """在子进程中解析一个日志分段"""
+    columns = EventColumns()
+    columns.add_log(path)
+    return columns
+
+
+def format_time(seconds):
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(seconds))
+
+
+def describe(values):
+    """样本数、总和、平均、分位数与最大值"""
+    values = np.asarray(values, dtype=np.float64)
+    if not len(values):
+        return {'count': 0}
+    quantiles = np.quantile(values, QUANTILES)
+    result = {'count': int(len(values)), 'total': round(float(values.sum()), 3),
+              'mean': round(float(values.mean()), 3)}
+    for q, value in zip(QUANTILES, quantiles):
+        result[f"p{int(q * 100)}"] = round(float(value), 3)
+    result['max'] = round(float(values.max()), 3)
+    return result
+
+
+def group_quantiles(keys, values, quantiles=QUANTILES):
+    """按keys分组计算values的分位数（线性插值），返回 (分组键, 样本数, 平均值, 分位数矩阵)"""
+    order = np.lexsort((values, keys))
+    keys, values = keys[order], values[order]
+    groups, starts, counts = np.unique(keys, return_index=True, return_counts=True)
+    if not len(groups):
+        return groups, counts, np.zeros(0), np.zeros((0, len(quantiles)))
+    positions = starts[:, None] + (counts[:, None] - 1) * np.asarray(quantiles)[None, :]
+    low = np.floor(positions).astype(np.int64)
+    high = np.minimum(low + 1, (starts + counts - 1)[:, None])
+    matrix = values[low] + (values[high] - values[low]) * (positions - low)
+    means = np.add.reduceat(values, starts) / counts
+    return groups, counts, means, matrix
+
+
+def find_outages(data):
+    """断网区间：从第一条断开事件开始，到网络恢复或登录成功（含会话仍有效）为止；
+    返回 (开始索引, 结束索引)，结束索引为-1表示到日志末尾仍未恢复"""
+    kind, source = data['kind'], data['source']
+    down = kind == EV_DOWN
+    marks = np.flatnonzero(down | (kind == EV_UP) | (kind == EV_LOGIN_OK) | (kind == EV_LOGIN_REUSED))
+    if not len(marks):
+        return marks, marks
+    state = down[marks].astype(np.int8)
+    mark_sources = source[marks]
+    previous = np.empty_like(state)
+    previous[0] = 0
+    previous[1:] = state[:-1]
+    previous[1:][mark_sources[1:] != mark_sources[:-1]] = 0  # 每台机器从“已连接”开始
+    changes = np.flatnonzero(state != previous)
+    starts = changes[state[changes] == 1]
+    # 每个开始之后的下一次状态变化如果是同一台机器的恢复，就是这次断网的结束
+    following = np.searchsorted(changes, starts, side='right')
+    ends = np.full(len(starts), -1, dtype=np.int64)
+    has_next = following < len(changes)
+    candidates = changes[following[has_next]]
+    closed = (state[candidates] == 0) & (mark_sources[candidates] == mark_sources[starts[has_next]])
+    ends[np.flatnonzero(has_next)[closed]] = marks[candidates[closed]]
+    return marks[starts], ends
+
+
+def reconnect_times(data, starts, ends):
+    """每次断网从开始到登录成功的秒数；期间没有登录成功（自行恢复或仍未恢复）时为NaN"""
+    times, source = data['time'], data['source']
+    logins = np.flatnonzero(data['kind'] == EV_LOGIN_OK)
+    following = np.searchsorted(logins, starts)
+    seconds = np.full(len(starts), np.nan)
+    found = np.flatnonzero(following < len(logins))
+    login_at = logins[following[found]]
+    # 登录成功必须属于同一台机器，并且不晚于这次断网的结束
+    same = (source[login_at] == source[starts[found]]) & ((ends[found] < 0) | (login_at <= ends[found]))
+    seconds[found[same]] = times[login_at[same]] - times[starts[found[same]]]
+    return seconds
+
+
+def site_stats(names, keys, latency, failures, label):
+    """一类延迟样本按站点统计分位数和失败率"""
+    groups, sizes, means, matrix = group_quantiles(keys, latency)
+    failed_counts = np.bincount(failures, minlength=len(names))
+    entries = []
+    for group, size, mean, row in zip(groups, sizes, means, matrix):
+        failed = int(failed_counts[group])
+        entry = {'site': names[group], 'kind': label, 'count': int(size), 'failed': failed,
+                 'loss': round(failed / (size + failed), 4), 'mean': round(float(mean), 3)}
+        for q, value in zip(QUANTILES, row):
+            entry[f"p{int(q * 100)}"] = round(float(value), 3)
+        entries.append(entry)
+    for group in np.setdiff1d(np.flatnonzero(failed_counts), groups):  # 只有失败记录的站点
+        entries.append({'site': names[group], 'kind': label, 'count': 0,
+                        'failed': int(failed_counts[group]), 'loss': 1.0})
+    return entries
+
+
+def summarize(columns, data):
+    """计算汇总结果，data为 columns.to_arrays() 的返回值；返回可序列化为JSON的字典"""
+    times, kind, source, site, value = (data['time'], data['kind'], data['source'], data['site'],
+                                        data['value'])
+    counts = np.bincount(kind.astype(np.int64), minlength=EV_PING_FAIL + 1)
+    summary = {
+        'files': columns.files,
+        'bytes': columns.bytes,
+        'events': int(len(kind)),
+        'machines': len(columns.source_names),
+    }
+    if len(times):
+        summary['first'] = format_time(times.min())
+        summary['last'] = format_time(times.max())
+
+    # 登录
+    succeeded, failed = int(counts[EV_LOGIN_OK]), int(counts[EV_LOGIN_FAIL])
+    codes, code_counts = np.unique(value[kind == EV_LOGIN_STATUS].astype(np.int64), return_counts=True)
+    summary['login'] = {
+        'attempts': int(counts[EV_LOGIN_SENT]),
+        'succeeded': succeeded,
+        'failed': failed,
+        'reused': int(counts[EV_LOGIN_REUSED]),
+        'success_rate': round(succeeded / (succeeded + failed), 4) if succeeded + failed else None,
+        'status_codes': {str(code): int(n) for code, n in zip(codes, code_counts)},
+    }
+
+    # 断网与重连
+    starts, ends = find_outages(data)
+    closed = ends >= 0
+    durations = times[ends[closed]] - times[starts[closed]]
+    reconnect = reconnect_times(data, starts, ends)
+    summary['outages'] = dict(describe(durations), open=int((~closed).sum()))
+    summary['reconnect'] = dict(describe(reconnect[~np.isnan(reconnect)]),
+                                self_recovered=int((closed & np.isnan(reconnect)).sum()))
+
+    # 各机器
+    machines = len(columns.source_names)
+    outage_counts = np.bincount(source[starts], minlength=machines)
+    outage_seconds = np.bincount(source[starts[closed]], weights=durations, minlength=machines)
+    logins_ok = np.bincount(source[kind == EV_LOGIN_OK], minlength=machines)
+    logins_failed = np.bincount(source[kind == EV_LOGIN_FAIL], minlength=machines)
+    summary['sources'] = [
+        {'name': name, 'outages': int(outage_counts[i]), 'outage_seconds': round(float(outage_seconds[i]), 3),
+         'logins_ok': int(logins_ok[i]), 'logins_failed': int(logins_failed[i])}
+        for i, name in enumerate(columns.source_names)]
+
+    # 各站点延迟：日志中的Ping结果与quality.db中的连接/HTTP采样分别统计
+    names = columns.site_names
+    sites = site_stats(names, site[kind == EV_PING_OK], value[kind == EV_PING_OK], site[kind == EV_PING_FAIL],
+                       "ping")
+    q_site, q_kind, q_latency = data['q_site'], data['q_kind'], data['q_latency']
+    lost = np.isnan(q_latency)
+    for label, selected in (("connect", q_kind == KIND_CONNECT), ("http", q_kind == KIND_HTTP)):
+        sites += site_stats(names, q_site[selected & ~lost], q_latency[selected & ~lost],
+                            q_site[selected & lost], label)
+    summary['sites'] = sites
+    return summary
+
+
+def outage_rows(columns, data):
+    """逐条断网记录：机器, 开始, 结束, 时长秒, 重连耗时秒"""
+    starts, ends = find_outages(data)
+    times = data['time']
+    for start, end, seconds in zip(starts, ends, reconnect_times(data, starts, ends)):
+        yield (columns.source_names[data['source'][start]], format_time(times[start]),
+               format_time(times[end]) if end >= 0 else "",
+               round(float(times[end] - times[start]), 3) if end >= 0 else "",
+               "" if np.isnan(seconds) else round(float(seconds), 3))
+
+
+def flatten(summary):
+    """把汇总结果展开为 (分类, 名称, 指标, 数值) 行，用于CSV输出"""
+    for section, content in summary.items():
+        if isinstance(content, list):
+            for entry in content:
+                name = entry.get('name') or f"{entry['site']}/{entry['kind']}"
+                for metric, value in entry.items():
+                    if metric not in ('name', 'site', 'kind'):
+                        yield section, name, metric, value
+        elif isinstance(content, dict):
+            for metric, value in content.items():
+                if isinstance(value, dict):
+                    for key, item in value.items():
+                        yield section, metric, key, item
+                else:
+                    yield section, "", metric, value
+        else:
+            yield "overall", "", section, content
+
+
+def main(argv=None):
+    """命令行入口：分析日志目录或文件，输出JSON或CSV汇总"""
+    parser = argparse.ArgumentParser(description="离线分析认证日志与连接质量历史")
+    parser.add_argument("paths", nargs="+", help="日志文件、quality.db或包含它们的目录（可多台机器）")
+    parser.add_argument("--format", choices=("json", "csv"), default="json", help="输出格式（默认json）")
+    parser.add_argument("--output", help="输出文件，默认输出到标准输出")
+    parser.add_argument("--outages", help="把每次断网的明细写入CSV文件")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1,
+                        help="同时解析的日志文件数（默认CPU核数）")
+    args = parser.parse_args(argv)
+
+    if np is None:
+        print("日志分析需要NumPy，请先安装: pip install numpy", file=sys.stderr)
+        return 2
+    logs, databases = find_inputs(args.paths)
+    if not logs and not databases:
+        print("没有找到日志文件", file=sys.stderr)
+        return 1
+
+    started = time.perf_counter()
+    columns = EventColumns()
+    if args.jobs > 1 and len(logs) > 1:
+        # 解析主要耗时在正则匹配，多个分段用多进程并行
+        with ProcessPoolExecutor(max_workers=min(args.jobs, len(logs))) as executor:
+            futures = [(path, executor.submit(parse_log, path)) for path in logs]
+            for path, future in futures:
+                try:
+                    columns.merge(future.result())
+                except (OSError, EOFError) as e:
+                    print(f"读取失败 {path}: {str(e)}", file=sys.stderr)
+    else:
+        for path in logs:
+            try:
+                columns.add_log(path)
+            except (OSError, EOFError) as e:
+                print(f"读取失败 {path}: {str(e)}", file=sys.stderr)
+    for path in databases:
+        try:
+            columns.add_quality(path)
+        except sqlite3.Error as e:
+            print(f"读取失败 {path}: {str(e)}", file=sys.stderr)
+    parsed = time.perf_counter()
+    data = columns.to_arrays()
+    summary = summarize(columns, data)
+    print(f"解析 {columns.files} 个文件（{columns.bytes / 1048576:.1f} MB，{len(columns)} 个事件）"
+          f"耗时 {parsed - started:.2f} 秒，统计耗时 {time.perf_counter() - parsed:.2f} 秒", file=sys.stderr)
+
+    out = open(args.output, 'w', encoding='utf-8', newline='') if args.output else sys.stdout
+    try:
+        if args.format == "json":
+            json.dump(summary, out, ensure_ascii=False, indent=2)
+            out.write("\n")
+        else:
+            writer = csv.writer(out)
+            writer.writerow(("section", "name", "metric", "value"))
+            writer.writerows(flatten(summary))
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    if args.outages:
+        with open(args.outages, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(("machine", "start", "end", "seconds", "reconnect_seconds"))
+            writer.writerows(outage_rows(columns, data))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,34 +1,34 @@
-import requests
-import json
-import os
-import binascii
-import tkinter as tk
-from tkinter import ttk, messagebox, scrolledtext
-import sys
-from tkinter import font
-import subprocess
-import threading
 import time
-import logging
-import socket  # 新增：导入socket模块（修复NameError）
 
-# 尝试导入Pillow库
-try:
-    from PIL import Image, ImageTk, ImageDraw
-    import io
+STARTUP_T0 = time.perf_counter()  # 启动计时起点，用于统计启动到认证完成的耗时
 
-    PILLOW_AVAILABLE = True
-except ImportError:
-    PILLOW_AVAILABLE = False
+import collections  # noqa: E402
+import importlib.util  # noqa: E402
+import os  # noqa: E402
+import queue  # noqa: E402
+import tkinter as tk  # noqa: E402
+from tkinter import ttk, messagebox, scrolledtext  # noqa: E402
+import sys  # noqa: E402
+from tkinter import font  # noqa: E402
+import subprocess  # noqa: E402
+import threading  # noqa: E402
 
-# 尝试导入托盘支持库
-try:
-    import pystray
-    from pystray import MenuItem as item
+from applog import setup_logging  # noqa: E402
+from assets import AssetCache  # noqa: E402
+from engine import LoginEngine, LoginResult  # noqa: E402
+from instance import LOCK_FILE_NAME, InstanceLock, send_command  # noqa: E402
 
-    PYSTRAY_AVAILABLE = True
-except ImportError:
-    PYSTRAY_AVAILABLE = False
+# Pillow和托盘支持库较重，启动时只检查是否安装，用到时再导入
+PILLOW_AVAILABLE = importlib.util.find_spec("PIL") is not None
+PYSTRAY_AVAILABLE = importlib.util.find_spec("pystray") is not None
+
+# 界面批量刷新间隔（毫秒），即状态消息最多每秒刷新10次
+UI_FLUSH_INTERVAL = 100
+# 状态页最多保留的行数
+STATUS_MAX_LINES = 500
+
+# 教程示意图地址
+TUTORIAL_IMAGE_URL = "https://img.picui.cn/free/2025/05/22/682f1e2cafbf2.png"
 
 # Windows系统自启动需要的模块
 if sys.platform.startswith('win'):
@@ -57,6 +57,34 @@ class ScrollableFrame(ttk.Frame):
         self.canvas.yview_scroll(int(-1 * (event.delta / 120)), "units")
 
 
+class StatusSink:
+    """状态消息缓冲：任意线程写入，主线程按固定频率批量取出；历史只保留最近max_lines行"""
+
+    def __init__(self, max_lines=STATUS_MAX_LINES):
+        self.history = collections.deque(maxlen=max_lines)
+        self._pending = collections.deque(maxlen=max_lines)
+        self._lock = threading.Lock()
+
+    def push(self, message):
+        """写入一条状态消息"""
+        with self._lock:
+            self.history.append(message)
+            self._pending.append(message)
+
+    def take(self):
+        """取出上次刷新以来的新消息"""
+        with self._lock:
+            lines = list(self._pending)
+            self._pending.clear()
+        return lines
+
+    def take_history(self):
+        """返回保留的全部历史消息，并清空待刷新消息（它们已包含在历史中）"""
+        with self._lock:
+            self._pending.clear()
+            return list(self.history)
+
+
 class NetworkLoginApp:
     def __init__(self, root):
         self.root = root
@@ -73,7 +101,7 @@ class NetworkLoginApp:
         self.root_active = True  # 跟踪主窗口是否活跃
 
         # 配置日志记录
-        self.setup_logging()
+        self.logger = setup_logging(self.app_dir)
         self.logger.info("程序启动")
 
         # 字体设置
@@ -81,14 +109,18 @@ class NetworkLoginApp:
         self.default_font.configure(family="Microsoft YaHei", size=10)
         self.subtitle_font = font.Font(family="Microsoft YaHei", size=12, weight="bold")
 
-        # 网络监控相关变量 - 提前初始化
-        self.monitoring = False
-        self.monitor_thread = None
-        self.ping_interval = 60  # 秒
-        self.check_sites = ["www.baidu.com", "qq.com", "www.taobao.com"]  # 增加更多检测网站
-        self.initial_network_check_attempts = 0  # 初始网络检查尝试次数
-        self.max_initial_check_attempts = 12  # 最大尝试次数（12次 * 5秒 = 60秒）
-        self.initial_check_delay = 5  # 每次检查间隔（秒）
+        # 认证与网络监控核心，界面只负责展示
+        self.engine = LoginEngine(self.app_dir, logger=self.logger,
+                                  on_status=self.update_status,
+                                  on_state=self.set_last_check,
+                                  login_handler=self.schedule_login)
+        self.engine.on_config_reload = lambda: self.post_ui("config", None)
+
+        self.engine.start_metrics()
+
+        # 教程图片等远程资源缓存在程序目录，离线时使用随程序附带的图片
+        self.assets = AssetCache(os.path.join(self.app_dir, "cache"), lambda: self.engine.http)
+        self.tutorial_fallback = os.path.join(self.app_dir, "tutorial.png")
 
         # 自启动配置
         self.auto_start = False
@@ -96,9 +128,33 @@ class NetworkLoginApp:
         self.auto_start_path = os.path.abspath(sys.argv[0])  # 获取当前程序路径
         self.load_auto_start_status()  # 加载自启动状态
 
-        # 使用程序目录下的配置文件
-        self.config_file = os.path.join(self.app_dir, "login_config.ini")
-        self.config = {}
+        # 状态页和教程页首次打开时才构建，在此之前状态消息只保存在缓冲区
+        self.status_text = None
+        self.monitor_btn = None
+        self.last_check_var = None
+        self.sites_text = None
+        self.breaker_var = None
+        self.last_check = "尚未进行检查"
+        self.status_sink = StatusSink()
+
+        # 后台线程产生的界面更新统一放入队列，由主线程定时批量取出
+        self.ui_queue = queue.Queue()
+        self.login_guard = threading.Lock()
+        self.login_running = False
+        self.pending_manual_login = None  # 登录进行中到达的主动登录：None或是否复用会话，当前登录结束后再发送
+        self.startup_login_done = False
+
+        # 本地控制通道：再次启动程序时显示窗口，脚本可查询状态或要求重新认证
+        self.engine.start_control({
+            'show': lambda: self.post_ui("show", None),
+            'relogin': lambda: self.login(reuse=False, manual=True),
+        })
+
+        # 先读取配置并在后台开始认证，再构建界面
+        config_loaded = self.load_config()
+        if config_loaded and self.engine.config_complete():
+            threading.Thread(target=self.check_network_before_login, daemon=True).start()
+
         self.scrollable_frame = ScrollableFrame(self.root)
         self.scrollable_frame.grid(row=0, column=0, sticky="nsew")
         self.scrollable_frame.grid_rowconfigure(0, weight=1)
@@ -107,42 +163,19 @@ class NetworkLoginApp:
         self.create_widgets()
 
         # 自动登录检查
-        if self.load_config():
-            self.root.after(100, self.auto_login)
+        if config_loaded:
+            self.fill_config_fields()
+            self.auto_login()
             # 确保在root_active设置后再启动监控
             if self.root_active:
                 self.start_network_monitor()  # 启动网络监控
+        self.logger.info(f"界面构建完成，启动耗时: {(time.perf_counter() - STARTUP_T0) * 1000:.0f} ms")
+        self.root.after(UI_FLUSH_INTERVAL, self.drain_ui_queue)
 
-        # 初始化系统托盘
+        # 初始化系统托盘：导入pystray和Pillow较慢，放到认证开始之后
         self.tray = None
         self.tray_active = False  # 跟踪托盘是否处于活动状态
-        self.init_system_tray()
-
-    def setup_logging(self):
-        """配置日志记录"""
-        # 使用已获取的程序目录
-        log_file = os.path.join(self.app_dir, "app.log")
-
-        self.logger = logging.getLogger("CampusNetworkLogin")
-        self.logger.setLevel(logging.INFO)
-
-        # 创建文件处理器
-        os.makedirs(self.app_dir, exist_ok=True)  # 确保目录存在
-        file_handler = logging.FileHandler(log_file, encoding="utf-8")
-        file_handler.setLevel(logging.INFO)
-
-        # 创建控制台处理器
-        console_handler = logging.StreamHandler()
-        console_handler.setLevel(logging.INFO)
-
-        # 创建日志格式
-        formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
-        file_handler.setFormatter(formatter)
-        console_handler.setFormatter(formatter)
-
-        # 添加处理器
-        self.logger.addHandler(file_handler)
-        self.logger.addHandler(console_handler)
+        self.root.after(500, self.init_system_tray)
 
     def init_system_tray(self):
         """初始化系统托盘图标"""
@@ -151,6 +184,10 @@ class NetworkLoginApp:
             return
 
         try:
+            import pystray
+            from pystray import MenuItem as item
+            from PIL import Image, ImageDraw
+
             # 创建托盘菜单
             menu = (
                 item("显示窗口", self.show_window),
@@ -220,9 +257,7 @@ class NetworkLoginApp:
             if self.tray and self.tray_active:
                 self.tray.stop()
 
-            if self.monitoring:
-                self.monitoring = False
-
+            self.engine.close()
             self.root.destroy()
             sys.exit(0)
         except Exception as e:
@@ -254,8 +289,16 @@ class NetworkLoginApp:
 
         self.create_config_tab()
         self.create_result_tab()
-        self.create_tutorial_tab()
-        self.create_status_tab()
+
+        # 教程页和状态页在首次切换到时再构建
+        self.deferred_tabs = {2: self.create_tutorial_tab, 3: self.create_status_tab}
+        self.tab_control.bind("<<NotebookTabChanged>>", self.on_tab_changed)
+
+    def on_tab_changed(self, event=None):
+        """切换标签页时构建尚未创建的页面"""
+        builder = self.deferred_tabs.pop(self.tab_control.index("current"), None)
+        if builder:
+            builder()
 
     def create_config_tab(self):
         """配置页面"""
@@ -286,13 +329,12 @@ class NetworkLoginApp:
 
         # 服务提供商
         ttk.Label(left_frame, text="服务提供商:", font=self.subtitle_font).grid(row=4, column=0, sticky="w", pady=5)
-        self.service_name = tk.StringVar(value="cmcc")
+        self.service_name = tk.StringVar(value=self.engine.service_key())
         service_frame = ttk.Frame(left_frame)
         service_frame.grid(row=5, column=0, sticky="w", pady=15)
-        ttk.Radiobutton(service_frame, text="中国移动宽带", variable=self.service_name, value="cmcc",
-                        style="TRadiobutton").pack(anchor="w", pady=2)
-        ttk.Radiobutton(service_frame, text="中国电信宽带", variable=self.service_name, value="telecom",
-                        style="TRadiobutton").pack(anchor="w", pady=2)
+        for key, (label, _) in self.engine.portal.services.items():  # 选项随配置的门户类型变化
+            ttk.Radiobutton(service_frame, text=label, variable=self.service_name, value=key,
+                            style="TRadiobutton").pack(anchor="w", pady=2)
         left_frame.grid_rowconfigure(5, weight=1)
 
         # 网络参数
@@ -328,7 +370,7 @@ class NetworkLoginApp:
 1. 用户账号：通常为学号或工号
 2. 加密密码：从浏览器开发者工具中获取
 3. 服务提供商：选择对应的网络服务
-4. 网络参数：从登录请求中提取的参数
+4. 网络参数：从登录请求中提取的参数；开启"自动获取网络参数"（默认开启）时可以留空，程序会从认证页面的跳转地址中获取
 点击"保存配置并登录"按钮完成操作。
 """
         ttk.Label(info_frame, text=info_text, font=self.default_font, justify="left").pack(fill="both", expand=True)
@@ -445,32 +487,10 @@ class NetworkLoginApp:
             image_frame.grid_rowconfigure(0, weight=1)
             image_frame.grid_columnconfigure(0, weight=1)
 
-            try:
-                # 下载并显示图片 - 放大版本
-                img_url = "https://img.picui.cn/free/2025/05/22/682f1e2cafbf2.png"
-                img_data = requests.get(img_url, timeout=10).content
-                img = Image.open(io.BytesIO(img_data))
-
-                # 放大图片至合适尺寸，保持宽高比
-                max_width = 600
-                max_height = 400
-                width, height = img.size
-                aspect_ratio = width / height
-
-                if width > max_width or height > max_height:
-                    if aspect_ratio > 1:
-                        new_width = max_width
-                        new_height = int(new_width / aspect_ratio)
-                    else:
-                        new_height = max_height
-                        new_width = int(new_height * aspect_ratio)
-                    img = img.resize((new_width, new_height), Image.LANCZOS)
-
-                self.tutorial_image = ImageTk.PhotoImage(img)
-                ttk.Label(image_frame, image=self.tutorial_image).pack(pady=5, fill="both", expand=True)
-            except Exception as e:
-                self.logger.error(f"加载教程图片失败: {str(e)}")
-                ttk.Label(image_frame, text=f"❌ 图片加载失败\n原因：{str(e)}", font=self.default_font).pack(pady=5)
+            # 先显示占位文字，图片在后台加载完成后替换
+            self.tutorial_image_label = ttk.Label(image_frame, text="⏳ 正在加载示意图...", font=self.default_font)
+            self.tutorial_image_label.pack(pady=5, fill="both", expand=True)
+            self.assets.load_async(TUTORIAL_IMAGE_URL, self._on_tutorial_image_loaded)
         else:
             # 提示安装Pillow
             no_image_frame = ttk.LabelFrame(right_frame, text="图片显示", padding=5)
@@ -497,6 +517,53 @@ class NetworkLoginApp:
                                                                                                              pady=15,
                                                                                                              sticky="s")
 
+    def _on_tutorial_image_loaded(self, data, error):
+        """教程图片加载完成（后台线程）：解码并缩放后交给主线程显示"""
+        img = None
+        try:
+            import io
+            from PIL import Image
+
+            if data is not None:
+                img = Image.open(io.BytesIO(data))
+            elif os.path.exists(self.tutorial_fallback):
+                self.logger.warning(f"下载教程图片失败，使用内置图片: {str(error)}")
+                img = Image.open(self.tutorial_fallback)
+            else:
+                raise error
+
+            # 放大图片至合适尺寸，保持宽高比
+            max_width = 600
+            max_height = 400
+            width, height = img.size
+            aspect_ratio = width / height
+
+            if width > max_width or height > max_height:
+                if aspect_ratio > 1:
+                    new_width = max_width
+                    new_height = int(new_width / aspect_ratio)
+                else:
+                    new_height = max_height
+                    new_width = int(new_height * aspect_ratio)
+                img = img.resize((new_width, new_height), Image.LANCZOS)
+            img.load()
+        except Exception as e:
+            self.logger.error(f"加载教程图片失败: {str(e)}")
+            img, error = None, e
+
+        if self.root_active:  # 新增：检查窗口是否已销毁
+            self.root.after(0, lambda: self._show_tutorial_image(img, error))
+
+    def _show_tutorial_image(self, img, error):
+        """在主线程用加载好的图片替换占位文字"""
+        if img is None:
+            self.tutorial_image_label.config(text=f"❌ 图片加载失败\n原因：{str(error)}")
+            return
+        from PIL import ImageTk
+
+        self.tutorial_image = ImageTk.PhotoImage(img)
+        self.tutorial_image_label.config(image=self.tutorial_image, text="")
+
     def create_status_tab(self):
         """网络状态页面"""
         frame = ttk.Frame(self.tab_status, padding=20)
@@ -513,31 +580,42 @@ class NetworkLoginApp:
         self.status_text = scrolledtext.ScrolledText(status_frame, width=70, height=10, font=self.default_font)
         self.status_text.pack(fill="both", expand=True, pady=10)
         self.status_text.config(state=tk.DISABLED)
+        self._update_status_ui(self.status_sink.take_history())
 
         # 监控控制按钮
         btn_frame = ttk.Frame(frame)
         btn_frame.grid(row=1, column=0, sticky="ew", pady=10)
 
-        self.monitor_btn = ttk.Button(btn_frame, text="开始监控", command=self.toggle_network_monitor, style="TButton")
+        self.monitor_btn = ttk.Button(btn_frame, text="停止监控" if self.engine.monitoring else "开始监控",
+                                      command=self.toggle_network_monitor, style="TButton")
         self.monitor_btn.pack(side="left", padx=5)
 
         self.test_ping_btn = ttk.Button(btn_frame, text="测试Ping", command=self.test_ping, style="TButton")
         self.test_ping_btn.pack(side="left", padx=5)
 
+        self.breaker_var = tk.StringVar(value=self.engine.breaker.describe())
+        ttk.Label(btn_frame, textvariable=self.breaker_var, font=self.default_font).pack(side="right", padx=5)
+
         # 监控间隔设置
         interval_frame = ttk.LabelFrame(frame, text="监控间隔设置", padding=10)
         interval_frame.grid(row=2, column=0, sticky="ew", pady=10)
         interval_frame.grid_columnconfigure(0, weight=1)
 
         ttk.Label(interval_frame, text="Ping检查间隔 (秒):", font=self.default_font).pack(side="left", padx=5)
-        self.interval_var = tk.StringVar(value=str(self.ping_interval))
+        self.interval_var = tk.StringVar(value=str(self.engine.ping_interval))
         ttk.Entry(interval_frame, textvariable=self.interval_var, width=5, font=self.default_font).pack(side="left",
                                                                                                         padx=5)
         ttk.Button(interval_frame, text="应用设置", command=self.apply_interval, style="TButton").pack(side="left",
                                                                                                        padx=5)
+        self.captive_mode_var = tk.IntVar(value=self.engine.captive_mode)
+        ttk.Checkbutton(interval_frame, text="门户检测（仅在被拦截时登录）", variable=self.captive_mode_var,
+                        command=self.toggle_captive_mode, style="TCheckbutton").pack(side="left", padx=10)
+        self.capture_params_var = tk.IntVar(value=self.engine.capture_params)
+        ttk.Checkbutton(interval_frame, text="自动获取网络参数", variable=self.capture_params_var,
+                        command=self.toggle_capture_params, style="TCheckbutton").pack(side="left", padx=10)
 
         # 上次检查结果
-        self.last_check_var = tk.StringVar(value="尚未进行检查")
+        self.last_check_var = tk.StringVar(value=self.last_check)
         ttk.Label(frame, textvariable=self.last_check_var, font=self.subtitle_font).grid(row=3, column=0, sticky="n",
                                                                                          pady=10)
 
@@ -546,44 +624,46 @@ class NetworkLoginApp:
         sites_frame.grid(row=4, column=0, sticky="ew", pady=10)
         sites_frame.grid_columnconfigure(0, weight=1)
 
-        ttk.Label(sites_frame, text="当前检查站点:", font=self.default_font).pack(anchor="w", pady=5)
+        ttk.Label(sites_frame, text="当前检查站点（每行一个，可在站点后写固定IP跳过DNS解析）:",
+                  font=self.default_font).pack(anchor="w", pady=5)
         self.sites_text = tk.Text(sites_frame, height=3, width=50, font=self.default_font)
-        self.sites_text.insert(tk.END, "\n".join(self.check_sites))
+        self.sites_text.insert(tk.END, "\n".join(self.engine.site_lines()))
         self.sites_text.pack(fill="x", pady=5)
 
         ttk.Button(sites_frame, text="应用站点设置", command=self.apply_sites, style="TButton").pack(anchor="w")
 
     def load_config(self):
         """加载配置文件"""
-        if os.path.exists(self.config_file):
-            try:
-                self.logger.info("加载配置文件")
-                with open(self.config_file, 'r', encoding='utf-8') as f:
-                    for line in f:
-                        key, value = line.strip().split(' = ', 1)
-                        self.config[key] = value.strip('"')
-                self.logger.info(f"配置加载成功: {self.config.get('userAccount', '未知用户')}")
+        try:
+            return self.engine.load_config()
+        except Exception as e:
+            self.logger.error(f"加载配置失败: {str(e)}")
+            messagebox.showerror("错误", f"加载配置失败：{str(e)}")
+            return False
 
-                # 加载配置到界面
-                self.user_account.delete(0, tk.END)
-                self.user_account.insert(0, self.config.get('userAccount', ''))
+    def fill_config_fields(self):
+        """把已加载的配置填入界面"""
+        config = self.engine.config
+        self.user_account.delete(0, tk.END)
+        self.user_account.insert(0, config.get('userAccount', ''))
 
-                self.encrypted_password.delete('1.0', tk.END)
-                self.encrypted_password.insert(tk.END, self.config.get('encryptedPassword', ''))
+        self.encrypted_password.delete('1.0', tk.END)
+        self.encrypted_password.insert(tk.END, config.get('encryptedPassword', ''))
 
-                self.network_params.delete('1.0', tk.END)
-                self.network_params.insert(tk.END, self.config.get('networkParams', ''))
+        self.network_params.delete('1.0', tk.END)
+        self.network_params.insert(tk.END, config.get('networkParams', ''))
 
-                service_value = '%E4%B8%AD%E5%9B%BD%E7%A7%BB%E5%8A%A8%E5%AE%BD%E5%B8%A6'
-                self.service_name.set('cmcc' if self.config.get('serviceName') == service_value else 'telecom')
+        self.service_name.set(self.engine.service_key())
 
-                return True
-            except Exception as e:
-                self.logger.error(f"加载配置失败: {str(e)}")
-                messagebox.showerror("错误", f"加载配置失败：{str(e)}")
-                return False
-        self.logger.info("未找到配置文件")
-        return False
+    def fill_settings_fields(self):
+        """把当前运行设置填入设置界面（界面尚未创建时跳过）"""
+        if self.sites_text is None:
+            return
+        self.interval_var.set(str(self.engine.ping_interval))
+        self.captive_mode_var.set(self.engine.captive_mode)
+        self.capture_params_var.set(self.engine.capture_params)
+        self.sites_text.delete('1.0', tk.END)
+        self.sites_text.insert(tk.END, "\n".join(self.engine.site_lines()))
 
     def load_auto_start_status(self):
         """加载自启动状态"""
@@ -695,10 +775,9 @@ Comment=校园网自动登录工具"""
             self.auto_start_var.set(1)  # 重新勾选
 
     def auto_login(self):
-        """自动登录功能"""
+        """自动登录功能：认证已在后台开始，这里只展示登录信息"""
         # 检查必要配置
-        required_fields = ['userAccount', 'encryptedPassword', 'serviceName', 'networkParams', 'targetUrl']
-        if not all(field in self.config for field in required_fields):
+        if not self.engine.config_complete():
             self.logger.warning("配置不完整，无法自动登录")
             messagebox.showwarning("提示", "配置不完整，无法自动登录")
             return
@@ -709,82 +788,39 @@ Comment=校园网自动登录工具"""
 
         # 显示登录信息
         self.summary_text.insert(tk.END, "检测到配置文件，准备自动登录...\n")
-        self.summary_text.insert(tk.END, f"用户账号: {self.config['userAccount']}\n")
-        self.summary_text.insert(tk.END, f"服务提供商: {self.config['serviceName']}\n")
+        self.summary_text.insert(tk.END, f"用户账号: {self.engine.config['userAccount']}\n")
+        self.summary_text.insert(tk.END, f"服务提供商: {self.engine.config['serviceName']}\n")
         self.summary_text.insert(tk.END, "正在检查网络连接状态...\n")
-        self.root.update()
-
-        # 在单独线程中检查网络连接
-        threading.Thread(target=self.check_network_before_login, daemon=True).start()
 
     def check_network_before_login(self):
-        """在登录前检查网络连接状态"""
-        self.initial_network_check_attempts = 0
-
-        while self.initial_network_check_attempts < self.max_initial_check_attempts:
-            self.initial_network_check_attempts += 1
-
-            self.update_status(
-                f"🔍 检查网络连接 ({self.initial_network_check_attempts}/{self.max_initial_check_attempts})...")
-            self.logger.info(f"检查网络连接 ({self.initial_network_check_attempts}/{self.max_initial_check_attempts})")
-
-            # 检查网络连接
-            if self.is_network_connected():
-                self.update_status("✅ 网络已连接，准备登录...")
-                self.logger.info("网络已连接，准备登录")
-
-                # 在主线程执行登录
-                if self.root_active:  # 新增：检查窗口是否已销毁
-                    self.root.after(0, self.login)
-                return
-            else:
-                wait_time = self.initial_check_delay * self.initial_network_check_attempts
-                self.update_status(f"❌ 网络未连接，等待 {wait_time} 秒后重试...")
-                self.logger.warning(f"网络未连接，等待 {wait_time} 秒后重试")
-
-                # 指数退避算法：每次等待时间递增
-                time.sleep(wait_time)
-
-        # 达到最大尝试次数
-        self.update_status(f"❗ 尝试 {self.max_initial_check_attempts} 次后仍无法连接网络，登录失败")
-        self.logger.error(f"尝试 {self.max_initial_check_attempts} 次后仍无法连接网络")
-        self.last_check_var.set("网络状态: 未连接")
-        if self.root_active:  # 新增：检查窗口是否已销毁
-            self.root.after(0, lambda: messagebox.showerror("登录失败", "尝试多次后仍无法连接网络，请检查网络设置"))
+        """在登录前检查网络连接状态，连通后直接在后台线程登录"""
+        if not self.engine.wait_for_network():
+            if self.root_active:  # 新增：检查窗口是否已销毁
+                self.root.after(0, lambda: messagebox.showerror("登录失败", "尝试多次后仍无法连接网络，请检查网络设置"))
+            return
 
-    def is_network_connected(self):
-        """检查网络是否连接"""
-        try:
-            # 尝试连接到本地网关或DNS服务器
-            # 使用较短的超时时间以快速检测
-            socket.create_connection(("8.8.8.8", 53), timeout=2)
-            return True
-        except OSError:
-            return False
+        self.login()
 
     def save_config(self):
         """保存配置文件"""
         try:
-            service_name = '%E4%B8%AD%E5%9B%BD%E7%A7%BB%E5%8A%A8%E5%AE%BD%E5%B8%A6' if self.service_name.get() == 'cmcc' else '%E4%B8%AD%E5%9B%BD%E7%94%B5%E4%BF%A1%E5%AE%BD%E5%B8%A6'
-            self.config = {
+            portal = self.engine.portal
+            config = {
+                'portal': portal.name,
                 'userAccount': self.user_account.get(),
                 'encryptedPassword': self.encrypted_password.get('1.0', tk.END).strip(),
-                'serviceName': service_name,
-                'targetUrl': 'http://172.17.10.100/eportal/InterFace.do?method=login',
+                'serviceName': portal.service_value(self.service_name.get()),
+                'targetUrl': self.engine.config.get('targetUrl') or portal.default_target_url,
                 'networkParams': self.network_params.get('1.0', tk.END).strip()
             }
 
             # 验证必要字段
-            if not self.config['userAccount'] or not self.config['encryptedPassword'] or not self.config[
-                'networkParams']:
+            if not all(config[field] for field in self.engine.required_fields(config)):
                 self.logger.warning("保存配置失败：必要字段为空")
-                messagebox.showerror("错误", "用户账号、加密密码和网络参数不能为空")
+                messagebox.showerror("错误", "用户账号和加密密码不能为空（关闭自动获取网络参数时，网络参数也不能为空）")
                 return False
 
-            with open(self.config_file, 'w', encoding='utf-8') as f:
-                for key, value in self.config.items():
-                    f.write(f'{key} = "{value}"\n')
-            self.logger.info(f"配置保存成功: {self.config['userAccount']}")
+            self.engine.save_config(config)
             return True
         except Exception as e:
             self.logger.error(f"保存配置失败: {str(e)}")
@@ -793,164 +829,118 @@ Comment=校园网自动登录工具"""
 
     def reset_config(self):
         """重置配置"""
-        if os.path.exists(self.config_file):
-            os.remove(self.config_file)
+        if os.path.exists(self.engine.config_file):
+            os.remove(self.engine.config_file)
             self.logger.info("配置文件已删除")
         self.user_account.delete(0, tk.END)
         self.encrypted_password.delete('1.0', tk.END)
         self.network_params.delete('1.0', tk.END)
         messagebox.showinfo("提示", "配置已重置")
 
-    def login(self):
-        """执行登录"""
-        try:
-            # 构造参数
-            post_params = {
-                'userId': self.config['userAccount'],
-                'password': self.config['encryptedPassword'],
-                'service': self.config['serviceName'],
-                'queryString': self.config['networkParams'],
-                'operatorPwd': '',
-                'operatorUserId': '',
-                'validcode': '',
-                'passwordEncrypt': 'true'
-            }
-            headers = {
-                'Content-Type': 'application/x-www-form-urlencoded',
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/116.0.0.0 Safari/537.36'
-            }
-
-            # 发送请求
-            self.summary_text.insert(tk.END, "正在发送登录请求...\n")
-            if self.root_active:  # 新增：检查窗口是否已销毁
-                self.root.update()
-            self.logger.info(f"发送登录请求: {self.config['userAccount']}")
-            response = requests.post(self.config['targetUrl'], data=post_params, headers=headers, timeout=30)
-
-            # 处理响应
-            self.summary_text.insert(tk.END, f"HTTP状态码：{response.status_code}\n")
-            self.summary_text.insert(tk.END, f"响应长度：{len(response.text)} 字节\n")
-            self.logger.info(f"登录响应: 状态码 {response.status_code}, 长度 {len(response.text)}")
+    def login(self, reuse=True, manual=False):
+        """执行登录：请求在后台线程发送，已有登录在进行时合并本次请求（可在任意线程调用）；
+        reuse为False时不检查已保存的会话，直接发送登录请求；manual表示用户主动登录，不受熔断限制"""
+        with self.login_guard:
+            if self.login_running:
+                if manual:
+                    # 进行中的登录可能用的是旧配置，主动登录不能被合并掉
+                    pending = self.pending_manual_login
+                    self.pending_manual_login = reuse if pending is None else pending and reuse
+                    self.logger.info("登录请求已在进行，结束后再发送本次登录")
+                else:
+                    self.logger.info("登录请求已在进行，合并本次请求")
+                return
+            self.login_running = True
+        self.post_ui("summary", "正在发送登录请求...\n")
+        threading.Thread(target=self._login_worker, args=(reuse, manual), daemon=True).start()
 
+    def _login_worker(self, reuse, manual):
+        """登录线程：结果经队列交给主线程展示；期间有主动登录到达时接着发送"""
+        while True:
             try:
-                json_data = response.json()
-                self.raw_text.insert(tk.END, json.dumps(json_data, indent=2))
-            except json.JSONDecodeError:
-                self.summary_text.insert(tk.END, "\n❌ 响应非JSON格式\n")
-                self.raw_text.insert(tk.END, response.text)
-                self.logger.error("登录响应不是有效的JSON格式")
+                result = self.engine.login(reuse=reuse, manual=manual)
+            except Exception as e:
+                result = LoginResult()
+                result.exception = e
+                self.logger.error(f"登录出错: {str(e)}")
+            with self.login_guard:
+                pending = self.pending_manual_login
+                self.pending_manual_login = None
+                self.login_running = pending is not None
+            if result.ok and not self.startup_login_done:
+                self.logger.info(f"启动到认证完成耗时: {(time.perf_counter() - STARTUP_T0) * 1000:.0f} ms")
+            self.startup_login_done = True
+            self.post_ui("result", result)
+            if pending is None:
                 return
+            reuse, manual = pending, True
+            self.post_ui("summary", "正在发送登录请求...\n")
 
-            # 解析userIndex
-            if 'userIndex' not in json_data:
-                self.summary_text.insert(tk.END, "\n❌ 响应中缺少userIndex字段\n")
-                self.logger.error("登录响应中缺少userIndex字段")
-                return
+    def show_login_result(self, result):
+        """在结果页面展示登录结果"""
+        if result.exception is not None:
+            if self.root_active:  # 新增：检查窗口是否已销毁
+                messagebox.showerror("登录失败", f"登录失败: {str(result.exception)}")
+                self.summary_text.insert(tk.END, f"\n错误详情：{str(result.exception)}\n")
+            return
+        if result.failure == "blocked":
+            self.summary_text.insert(tk.END, f"⏸️ {result.error}\n")
+            return
 
-            hex_user_index = json_data['userIndex']
-            try:
-                decoded = binascii.unhexlify(hex_user_index).decode('utf-8', errors='replace')
-                self.summary_text.insert(tk.END, f"\n原始十六进制：{hex_user_index}\n解码内容：{decoded}\n")
-                self.logger.info(f"userIndex解码成功: {decoded}")
-            except binascii.Error:
-                self.summary_text.insert(tk.END, f"\n❌ userIndex格式错误：{hex_user_index}\n")
-                self.logger.error(f"userIndex格式错误: {hex_user_index}")
-                return
+        if result.reused:
+            self.summary_text.insert(tk.END, "✅ 会话仍有效，未重新发送登录请求\n")
+        else:
+            self.summary_text.insert(tk.END, f"HTTP状态码：{result.status_code}\n")
+        self.summary_text.insert(tk.END, f"响应长度：{result.length} 字节\n")
+        self.raw_text.insert(tk.END, result.raw)
+        if result.error:
+            self.summary_text.insert(tk.END, f"\n❌ {result.error}\n")
+            return
 
-            # 拆分数据
-            segments = decoded.split('_')
-            if len(segments) >= 3:
-                self.data_text.insert(tk.END, f"设备标识：{segments[0]}\n分配IP：{segments[1]}\n用户账号：{segments[2]}\n")
-                self.verify_text.insert(tk.END,
-                                        f"账号一致性：{'✔️ 一致' if segments[2] == self.config['userAccount'] else '❌ 不一致'}\n")
-                self.logger.info(f"登录成功: {segments[2]}")
-                self.last_check_var.set("网络状态: 已连接")
-            else:
-                self.data_text.insert(tk.END, "❌ 数据格式异常，无法拆分\n")
-                self.logger.warning("登录响应数据格式异常")
-                self.last_check_var.set("网络状态: 连接失败")
+        if result.user_index:
+            self.summary_text.insert(tk.END, f"\n原始十六进制：{result.user_index}\n解码内容：{result.decoded}\n")
+        if result.ok:
+            self.data_text.insert(tk.END, f"设备标识：{result.device_id}\n分配IP：{result.ip}\n用户账号：{result.account}\n")
+            self.verify_text.insert(tk.END, f"账号一致性：{'✔️ 一致' if result.account_match else '❌ 不一致'}\n")
+        else:
+            self.data_text.insert(tk.END, "❌ 数据格式异常，无法拆分\n")
 
-            if self.root_active:  # 新增：检查窗口是否已销毁
-                self.tab_control.select(1)
+        if self.root_active:  # 新增：检查窗口是否已销毁
+            self.tab_control.select(1)
 
-        except Exception as e:
-            error_msg = f"登录失败: {str(e)}"
-            self.logger.error(error_msg)
-            if self.root_active:  # 新增：检查窗口是否已销毁
-                messagebox.showerror("登录失败", error_msg)
-                self.summary_text.insert(tk.END, f"\n错误详情：{str(e)}\n")
-                self.last_check_var.set("网络状态: 连接失败")
+    def schedule_login(self):
+        """监控线程发现未认证时触发登录"""
+        if self.root_active:  # 新增：检查窗口是否已销毁
+            self.login()
 
     def save_config_and_login(self):
         """保存配置并登录"""
         if self.save_config():
-            self.login()
+            self.login(reuse=False, manual=True)
 
     def start_network_monitor(self):
         """启动网络监控线程"""
-        if self.monitoring:
+        if not self.engine.start_monitor():
             return
 
-        self.monitoring = True
-        self.monitor_btn.config(text="停止监控")
-        self.logger.info(f"启动网络监控，间隔 {self.ping_interval} 秒")
-
-        self.monitor_thread = threading.Thread(target=self.network_monitor_loop, daemon=True)
-        self.monitor_thread.start()
-
+        if self.monitor_btn is not None:
+            self.monitor_btn.config(text="停止监控")
         self.update_status("✅ 网络监控已启动")
 
     def stop_network_monitor(self):
         """停止网络监控线程"""
-        self.monitoring = False
-        self.monitor_btn.config(text="开始监控")
-        self.logger.info("停止网络监控")
+        self.engine.stop_monitor()
+        if self.monitor_btn is not None:
+            self.monitor_btn.config(text="开始监控")
         self.update_status("🛑 网络监控已停止")
 
     def toggle_network_monitor(self):
         """切换网络监控状态"""
-        if self.monitoring:
+        if self.engine.monitoring:
             self.stop_network_monitor()
         else:
             self.start_network_monitor()
 
-    def network_monitor_loop(self):
-        """网络监控主循环"""
-        while self.monitoring:
-            try:
-                self.check_network_status()
-                time.sleep(self.ping_interval)
-            except Exception as e:
-                self.logger.error(f"网络监控出错: {str(e)}")
-                time.sleep(self.ping_interval)
-
-    def check_network_status(self):
-        """检查网络状态"""
-        current_time = time.strftime("%Y-%m-%d %H:%M:%S")
-        self.update_status(f"🔍 [{current_time}] 正在检查网络连接...")
-
-        connected = False
-        for site in self.check_sites:
-            try:
-                socket.create_connection((site, 80), timeout=5)
-                self.update_status(f"✅ [{current_time}] 连接 {site} 成功")
-                connected = True
-                break
-            except OSError:
-                self.update_status(f"❌ [{current_time}] 连接 {site} 失败")
-
-        if connected:
-            status = "网络状态: 已连接"
-            self.update_status(f"✅ [{current_time}] 网络连接正常")
-        else:
-            status = "网络状态: 未连接"
-            self.update_status(f"❗ [{current_time}] 网络连接断开，尝试重新登录...")
-            self.logger.warning("网络连接断开，尝试重新登录")
-            if self.root_active:  # 新增：检查窗口是否已销毁
-                self.root.after(0, self.login)  # 在主线程执行登录
-
-        self.last_check_var.set(status)
-
     def test_ping(self):
         """测试Ping功能"""
         threading.Thread(target=self._test_ping_thread, daemon=True).start()
@@ -958,35 +948,74 @@ Comment=校园网自动登录工具"""
     def _test_ping_thread(self):
         """Ping测试线程"""
         self.update_status("🔍 开始Ping测试...")
-        results = []
+        self.engine.ping_test()
 
-        for site in self.check_sites:
-            try:
-                start_time = time.time()
-                socket.create_connection((site, 80), timeout=5)
-                end_time = time.time()
-                latency = (end_time - start_time) * 1000  # 转换为毫秒
-                results.append(f"✅ {site}: {latency:.2f}ms")
-                self.update_status(f"✅ {site}: {latency:.2f}ms")
-            except OSError as e:
-                results.append(f"❌ {site}: 连接失败 ({str(e)})")
-                self.update_status(f"❌ {site}: 连接失败 ({str(e)})")
-
-        result_text = "\n".join(results)
-        self.logger.info(f"Ping测试结果:\n{result_text}")
+    def post_ui(self, kind, payload):
+        """把界面更新放入队列（可在任意线程调用）"""
+        if self.root_active:  # 新增：检查窗口是否已销毁
+            self.ui_queue.put((kind, payload))
 
-    def update_status(self, message):
-        """更新状态文本"""
-        if not self.root_active:  # 新增：检查窗口是否已销毁
+    def drain_ui_queue(self):
+        """主线程定时取出队列中积压的全部更新，同类消息合并后一次写入界面"""
+        if not self.root_active:
             return
+        summary_lines = []
+        try:
+            while True:
+                kind, payload = self.ui_queue.get_nowait()
+                if kind == "summary":
+                    summary_lines.append(payload)
+                elif kind == "state":
+                    self.last_check = payload
+                elif kind == "show":
+                    self.show_window()
+                elif kind == "config":
+                    self.fill_config_fields()
+                    self.fill_settings_fields()
+                elif kind == "result":
+                    # 登录结果要排在之前的摘要之后
+                    if summary_lines:
+                        self.summary_text.insert(tk.END, "".join(summary_lines))
+                        summary_lines = []
+                    self.show_login_result(payload)
+        except queue.Empty:
+            pass
+
+        if summary_lines:
+            self.summary_text.insert(tk.END, "".join(summary_lines))
+        status_lines = self.status_sink.take()
+        if status_lines and self.status_text is not None:
+            self._update_status_ui(status_lines)
+        if self.last_check_var is not None and self.last_check_var.get() != self.last_check:
+            self.last_check_var.set(self.last_check)
+        if self.breaker_var is not None:
+            breaker_text = self.engine.breaker.describe()
+            if self.breaker_var.get() != breaker_text:
+                self.breaker_var.set(breaker_text)
+        self.root.after(UI_FLUSH_INTERVAL, self.drain_ui_queue)
+
+    def update_status(self, message):
+        """更新状态文本（可在任意线程调用，由主线程批量刷新）"""
+        if self.root_active:  # 新增：检查窗口是否已销毁
+            self.status_sink.push(message)
 
-        self.root.after(0, lambda: self._update_status_ui(message))
+    def set_last_check(self, status):
+        """更新上次检查结果"""
+        self.post_ui("state", status)
 
-    def _update_status_ui(self, message):
-        """在UI线程中更新状态文本"""
+    def _update_status_ui(self, messages):
+        """在UI线程中批量追加状态文本，并删除超出上限的旧行"""
+        if not messages:
+            return
+        # 用户向上翻看历史时不强制滚动到底部
+        at_bottom = self.status_text.yview()[1] >= 1.0
         self.status_text.config(state=tk.NORMAL)
-        self.status_text.insert(tk.END, message + "\n")
-        self.status_text.see(tk.END)
+        self.status_text.insert(tk.END, "\n".join(messages) + "\n")
+        excess = int(self.status_text.index("end-1c").split(".")[0]) - 1 - STATUS_MAX_LINES
+        if excess > 0:
+            self.status_text.delete("1.0", f"{excess + 1}.0")
+        if at_bottom:
+            self.status_text.see(tk.END)
         self.status_text.config(state=tk.DISABLED)
 
     def apply_interval(self):
@@ -996,27 +1025,53 @@ Comment=校园网自动登录工具"""
             if new_interval < 10:
                 messagebox.showerror("错误", "监控间隔不能小于10秒")
                 return
-            self.ping_interval = new_interval
-            self.logger.info(f"更新监控间隔为 {self.ping_interval} 秒")
-            messagebox.showinfo("提示", f"监控间隔已更新为 {self.ping_interval} 秒")
+            self.engine.set_ping_interval(new_interval)
+            self.engine.save_settings()
+            self.logger.info(f"更新监控间隔为 {new_interval} 秒")
+            messagebox.showinfo("提示", f"监控间隔已更新为 {new_interval} 秒")
         except ValueError:
             messagebox.showerror("错误", "请输入有效的整数")
 
+    def toggle_captive_mode(self):
+        """切换门户检测模式"""
+        self.engine.captive_mode = bool(self.captive_mode_var.get())
+        self.engine.save_settings()
+        self.logger.info(f"门户检测模式: {'开启' if self.engine.captive_mode else '关闭'}")
+
+    def toggle_capture_params(self):
+        """切换是否从门户跳转地址自动获取网络参数"""
+        self.engine.capture_params = bool(self.capture_params_var.get())
+        self.engine.save_settings()
+        self.logger.info(f"自动获取网络参数: {'开启' if self.engine.capture_params else '关闭'}")
+
     def apply_sites(self):
         """应用检查网站设置"""
         sites_text = self.sites_text.get("1.0", tk.END).strip()
-        sites = [site.strip() for site in sites_text.split("\n") if site.strip()]
+        lines = [line.strip() for line in sites_text.split("\n") if line.strip()]
 
-        if not sites:
+        if not lines:
             messagebox.showerror("错误", "检查站点列表不能为空")
             return
 
-        self.check_sites = sites
-        self.logger.info(f"更新检查站点列表: {', '.join(self.check_sites)}")
+        try:
+            sites = self.engine.set_check_sites(lines)
+        except ValueError as e:
+            messagebox.showerror("错误", f"固定IP格式错误：{str(e)}")
+            return
+        self.engine.save_settings()
+        self.logger.info(f"更新检查站点列表: {', '.join(sites)}")
         messagebox.showinfo("提示", "检查站点列表已更新")
 
 
 if __name__ == "__main__":
+    # 同一目录只运行一个实例，再次启动时让已运行的实例显示窗口
+    instance_lock = InstanceLock(os.path.join(os.path.dirname(os.path.abspath(sys.argv[0])), LOCK_FILE_NAME))
+    if not instance_lock.acquire():
+        try:
+            send_command(os.path.dirname(os.path.abspath(sys.argv[0])), "show")
+        except (OSError, ValueError):
+            pass
+        sys.exit(0)
     root = tk.Tk()
     app = NetworkLoginApp(root)
     root.mainloop()
\ No newline at end of file
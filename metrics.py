@@ -0,0 +1,245 @@
+"""进程内指标：计数器、直方图、Prometheus文本接口和定期JSON快照"""
+import json
+import logging
+import os
+import threading
+import time
+
+# 延迟直方图的默认桶（秒）
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class _CounterValue:
+    """单组标签下的计数器"""
+
+    def __init__(self, lock):
+        self._lock = lock
+        self.value = 0
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+
+class _HistogramValue:
+    """单组标签下的直方图"""
+
+    def __init__(self, lock, buckets):
+        self._lock = lock
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        with self._lock:
+            self.count += 1
+            self.sum += value
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    self.counts[i] += 1
+                    break
+
+    def time(self):
+        """返回计时上下文，退出时记录耗时"""
+        return _Timer(self)
+
+
+class _Timer:
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start)
+
+
+class Metric:
+    """带标签的指标族"""
+
+    def __init__(self, kind, name, documentation, labelnames, buckets=None):
+        self.kind = kind  # "counter" 或 "histogram"
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._children = {}
+
+    def labels(self, **labels):
+        """返回指定标签值对应的计数器或直方图"""
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.get(key)
+                if child is None:
+                    if self.kind == "counter":
+                        child = _CounterValue(self._lock)
+                    else:
+                        child = _HistogramValue(self._lock, self.buckets)
+                    self._children[key] = child
+        return child
+
+    # 无标签指标可以直接使用
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+    def time(self):
+        return self.labels().time()
+
+    def items(self):
+        """返回 (标签字典, 值) 列表的快照"""
+        with self._lock:
+            return [(dict(zip(self.labelnames, key)), child) for key, child in self._children.items()]
+
+
+def _escape(value):
+    """转义Prometheus标签值"""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels, extra=None):
+    """格式化Prometheus标签"""
+    pairs = list(labels.items()) + (list(extra.items()) if extra else [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+class MetricsRegistry:
+    """指标注册表，同名指标只创建一次"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    def _get(self, kind, name, documentation, labelnames, buckets=None):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = Metric(kind, name, documentation, labelnames, buckets)
+            return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._get("counter", name, documentation, labelnames)
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._get("histogram", name, documentation, labelnames, tuple(buckets))
+
+    def render_prometheus(self):
+        """输出Prometheus文本格式"""
+        lines = []
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for labels, child in metric.items():
+                if metric.kind == "counter":
+                    lines.append(f"{metric.name}{_format_labels(labels)} {child.value}")
+                    continue
+                cumulative = 0
+                for bound, count in zip(child.buckets, child.counts):
+                    cumulative += count
+                    lines.append(f"{metric.name}_bucket{_format_labels(labels, {'le': bound})} {cumulative}")
+                lines.append(f"{metric.name}_bucket{_format_labels(labels, {'le': '+Inf'})} {child.count}")
+                lines.append(f"{metric.name}_sum{_format_labels(labels)} {child.sum}")
+                lines.append(f"{metric.name}_count{_format_labels(labels)} {child.count}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self):
+        """返回可序列化为JSON的指标快照"""
+        result = {"timestamp": time.time(), "metrics": {}}
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            series = []
+            for labels, child in metric.items():
+                if metric.kind == "counter":
+                    series.append({"labels": labels, "value": child.value})
+                else:
+                    series.append({"labels": labels, "count": child.count, "sum": child.sum,
+                                   "buckets": dict(zip(map(str, child.buckets), child.counts))})
+            result["metrics"][metric.name] = {"type": metric.kind, "series": series}
+        return result
+
+
+# 全局注册表，各模块的指标都登记在这里
+REGISTRY = MetricsRegistry()
+
+
+class MetricsExporter:
+    """在本机端口提供 /metrics 接口，并定期把快照写入JSON文件"""
+
+    def __init__(self, registry=REGISTRY, port=None, snapshot_path=None, snapshot_interval=60, logger=None):
+        self.registry = registry
+        self.port = port
+        self.snapshot_path = snapshot_path
+        self.snapshot_interval = snapshot_interval
+        self.logger = logger or logging.getLogger("CampusNetworkLogin")
+        self.server = None
+        self._stop = threading.Event()
+
+    def start(self):
+        """启动HTTP接口和快照线程，端口被占用时只记录警告"""
+        if self.port:
+            from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+            registry = self.registry
+
+            class Handler(BaseHTTPRequestHandler):
+                def do_GET(self):
+                    if self.path.split('?', 1)[0] != '/metrics':
+                        self.send_error(404)
+                        return
+                    body = registry.render_prometheus().encode('utf-8')
+                    self.send_response(200)
+                    self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                    self.send_header('Content-Length', str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+
+                def log_message(self, *args):
+                    pass
+
+            try:
+                self.server = ThreadingHTTPServer(("127.0.0.1", self.port), Handler)
+                self.server.daemon_threads = True
+                threading.Thread(target=self.server.serve_forever, daemon=True).start()
+                self.logger.info(f"指标接口已启动: http://127.0.0.1:{self.port}/metrics")
+            except OSError as e:
+                self.logger.warning(f"指标接口启动失败: {str(e)}")
+                self.server = None
+
+        if self.snapshot_path:
+            threading.Thread(target=self._snapshot_loop, daemon=True).start()
+
+    def stop(self):
+        """停止接口并写出最后一次快照"""
+        self._stop.set()
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+        if self.snapshot_path:
+            self.write_snapshot()
+
+    def write_snapshot(self):
+        """原子地写出一次JSON快照"""
+        try:
+            tmp_path = self.snapshot_path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.registry.snapshot(), f, ensure_ascii=False)
+            os.replace(tmp_path, self.snapshot_path)
+        except OSError as e:
+            self.logger.warning(f"写入指标快照失败: {str(e)}")
+
+    def _snapshot_loop(self):
+        while not self._stop.wait(self.snapshot_interval):
+            self.write_snapshot()
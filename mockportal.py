@@ -0,0 +1,256 @@
+"""本地模拟的eportal认证服务器（asyncio），用于离线测试和性能基准；同时提供锐捷和Dr.COM两种门户的接口"""
+import argparse
+import asyncio
+import binascii
+import collections
+import hashlib
+import json
+import random
+import threading
+from urllib.parse import parse_qs, unquote, urlsplit
+
+INTERFACE_PATH = "/eportal/InterFace.do"
+CHECK_PATH = "/generate_204"
+PORTAL_PAGE = "/eportal/index.jsp"
+DRCOM_PATH = "/eportal/"
+DRCOM_STATUS_PATH = "/drcom/chkstatus"
+
+REASONS = {200: "OK", 204: "No Content", 302: "Found", 404: "Not Found", 500: "Internal Server Error"}
+
+
+class MockPortal:
+    """模拟门户：登录、在线信息、保活和注销接口，以及按在线状态返回204或重定向的检测地址；
+    可注入延迟、5xx错误、非JSON响应和无法解码的userIndex"""
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, jitter=0.0, error_rate=0.0, non_json_rate=0.0,
+                 bad_index_rate=0.0, accounts=None, seed=None):
+        self.host = host
+        self.port = port  # 0表示由系统分配，启动后更新为实际端口
+        self.latency = latency  # 每个请求的固定延迟（秒）
+        self.jitter = jitter  # 在固定延迟上再加0~jitter秒的随机延迟
+        self.error_rate = error_rate  # 认证接口返回500的概率
+        self.non_json_rate = non_json_rate  # 认证接口返回HTML页面的概率
+        self.bad_index_rate = bad_index_rate  # 登录成功但userIndex不是十六进制的概率
+        self.accounts = accounts  # 账号 -> 密码，为None时接受任何账号
+        self.random = random.Random(seed)
+        self.sessions = {}  # userIndex -> 账号
+        self.counts = collections.Counter()  # 各接口请求次数
+        self.server = None
+        self._loop = None
+        self._thread = None
+        self._writers = set()  # 当前打开的连接
+
+    @property
+    def base_url(self):
+        return f"http://{self.host}:{self.port}"
+
+    @property
+    def login_url(self):
+        return f"{self.base_url}{INTERFACE_PATH}?method=login"
+
+    @property
+    def drcom_url(self):
+        return f"{self.base_url}{DRCOM_PATH}"
+
+    @property
+    def check_url(self):
+        return f"{self.base_url}{CHECK_PATH}"
+
+    def drop(self):
+        """模拟掉线：清空所有在线会话"""
+        self.sessions.clear()
+
+    # ---- 服务器生命周期 ----
+
+    async def start(self):
+        """在当前事件循环中开始监听"""
+        self.server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def serve_forever(self):
+        await self.start()
+        async with self.server:
+            await self.server.serve_forever()
+
+    def start_background(self):
+        """在后台线程运行事件循环，监听就绪后返回"""
+        ready = threading.Event()
+        self._loop = asyncio.new_event_loop()
+
+        def run():
+            asyncio.set_event_loop(self._loop)
+            self._loop.run_until_complete(self.start())
+            ready.set()
+            self._loop.run_forever()
+            self.server.close()
+            # 关闭仍在等待keep-alive请求的连接，让处理协程正常结束
+            for writer in list(self._writers):
+                writer.close()
+            pending = asyncio.all_tasks(self._loop)
+            if pending:
+                self._loop.run_until_complete(asyncio.wait(pending, timeout=1))
+            self._loop.run_until_complete(self.server.wait_closed())
+            self._loop.close()
+
+        self._thread = threading.Thread(target=run, daemon=True)
+        self._thread.start()
+        ready.wait()
+        return self
+
+    def stop(self):
+        """停止后台线程中的服务器"""
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(timeout=5)
+            self._loop = None
+
+    # ---- HTTP处理 ----
+
+    async def _handle(self, reader, writer):
+        """处理一个连接上的请求，支持keep-alive"""
+        self._writers.add(writer)
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                method, target, _ = line.decode('latin-1').split(' ', 2)
+                headers = {}
+                while True:
+                    header = await reader.readline()
+                    if header in (b'\r\n', b'\n', b''):
+                        break
+                    key, _, value = header.decode('latin-1').partition(':')
+                    headers[key.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get('content-length') or 0))
+
+                status, extra_headers, payload = await self.dispatch(method, target, headers, body)
+                close = headers.get('connection', '').lower() == 'close'
+                lines = [f"HTTP/1.1 {status} {REASONS.get(status, 'OK')}",
+                         f"Content-Length: {len(payload)}",
+                         "Connection: close" if close else "Connection: keep-alive"]
+                lines += [f"{key}: {value}" for key, value in extra_headers.items()]
+                writer.write(("\r\n".join(lines) + "\r\n\r\n").encode('latin-1') + payload)
+                await writer.drain()
+                if close:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            self._writers.discard(writer)
+            writer.close()
+
+    async def dispatch(self, method, target, headers, body):
+        """按路径分发请求，返回 (状态码, 额外响应头, 响应体)"""
+        delay = self.latency + (self.random.uniform(0, self.jitter) if self.jitter else 0)
+        if delay:
+            await asyncio.sleep(delay)
+        parts = urlsplit(target)
+        query = {key: values[0] for key, values in parse_qs(parts.query).items()}
+        self.counts[parts.path + ('?' + query['method'] if 'method' in query else '')] += 1
+
+        if parts.path == CHECK_PATH:
+            if self.sessions:
+                return 204, {}, b""
+            host = headers.get('host', f"{self.host}:{self.port}")
+            return 302, {"Location": f"http://{host}{PORTAL_PAGE}?wlanuserip={self.host}"}, b""
+        if parts.path == PORTAL_PAGE:
+            return 200, {"Content-Type": "text/html; charset=utf-8"}, "<html>认证页面</html>".encode('utf-8')
+        if parts.path == "/_control/drop":
+            self.drop()
+            return 200, {}, b"dropped"
+        if parts.path == "/_control/stats":
+            return self._json({'sessions': len(self.sessions), 'counts': dict(self.counts)})
+        if parts.path not in (INTERFACE_PATH, DRCOM_PATH, DRCOM_STATUS_PATH):
+            return 404, {}, b""
+
+        roll = self.random.random()
+        if roll < self.error_rate:
+            return 500, {}, b"Internal Server Error"
+        if roll < self.error_rate + self.non_json_rate:
+            return 200, {"Content-Type": "text/html; charset=utf-8"}, "<html>系统繁忙，请稍后再试</html>".encode('utf-8')
+
+        if parts.path == DRCOM_PATH and query.get('a') == 'login':
+            return self._drcom_login(query)
+        if parts.path == DRCOM_STATUS_PATH:
+            ip = next((key[len("drcom_"):] for key in self.sessions if key.startswith("drcom_")), None)
+            data = {'result': 1, 'uid': self.sessions[f"drcom_{ip}"], 'v46ip': ip} if ip else {'result': 0}
+            return self._jsonp(query.get('callback', 'dr1002'), data)
+        if parts.path == DRCOM_PATH:
+            return 404, {}, b""
+
+        form = {key: values[0] for key, values in parse_qs(body.decode('utf-8', errors='replace')).items()}
+        action = query.get('method')
+        if action == 'login':
+            return self._login(form)
+        if action in ('getOnlineUserInfo', 'keepalive'):
+            user_index = form.get('userIndex')
+            if user_index in self.sessions:
+                return self._json({'result': 'success', 'userIndex': user_index,
+                                   'userId': self.sessions[user_index]})
+            return self._json({'result': 'fail', 'message': '用户已下线'})
+        if action == 'logout':
+            self.sessions.pop(form.get('userIndex'), None)
+            return self._json({'result': 'success', 'message': '下线成功'})
+        return self._json({'result': 'fail', 'message': '未知接口'})
+
+    def _login(self, form):
+        """处理登录请求"""
+        account = form.get('userId', '')
+        if not account or (self.accounts is not None and self.accounts.get(account) != form.get('password')):
+            return self._json({'userIndex': None, 'result': 'fail', 'message': '用户不存在或密码错误'})
+        if self.random.random() < self.bad_index_rate:
+            return self._json({'result': 'success', 'userIndex': 'not-a-hex-index'})
+        query = form.get('queryString', '')
+        params = parse_qs(query if '=' in query else unquote(query))
+        ip = params.get('wlanuserip', [self.host])[0]
+        device = hashlib.md5(ip.encode('utf-8')).hexdigest()[:12]
+        user_index = binascii.hexlify(f"{device}_{ip}_{account}".encode('utf-8')).decode('ascii')
+        self.sessions[user_index] = account
+        return self._json({'result': 'success', 'message': '', 'userIndex': user_index})
+
+    def _drcom_login(self, query):
+        """处理Dr.COM门户的登录请求：账号格式为 ,0,账号@运营商，响应为JSONP"""
+        callback = query.get('callback', 'dr1003')
+        account = query.get('user_account', '').split(',')[-1].split('@')[0]
+        if not account or (self.accounts is not None and self.accounts.get(account) != query.get('user_password')):
+            return self._jsonp(callback, {'result': '0', 'msg': '账号或密码错误', 'ret_code': 1})
+        ip = query.get('wlan_user_ip', self.host)
+        self.sessions[f"drcom_{ip}"] = account
+        return self._jsonp(callback, {'result': '1', 'msg': '认证成功', 'v46ip': ip})
+
+    @staticmethod
+    def _jsonp(callback, data):
+        return 200, {"Content-Type": "application/javascript;charset=UTF-8"}, \
+            f"{callback}({json.dumps(data, ensure_ascii=False)})".encode('utf-8')
+
+    @staticmethod
+    def _json(data):
+        return 200, {"Content-Type": "application/json;charset=UTF-8"}, json.dumps(data, ensure_ascii=False).encode('utf-8')
+
+
+def main(argv=None):
+    """命令行入口：在前台运行模拟门户"""
+    parser = argparse.ArgumentParser(description="本地模拟eportal认证服务器")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--latency", type=float, default=0.0, help="每个请求的固定延迟（秒）")
+    parser.add_argument("--jitter", type=float, default=0.0, help="额外随机延迟上限（秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="认证接口返回500的概率")
+    parser.add_argument("--non-json-rate", type=float, default=0.0, help="认证接口返回HTML页面的概率")
+    parser.add_argument("--bad-index-rate", type=float, default=0.0, help="返回无法解码的userIndex的概率")
+    args = parser.parse_args(argv)
+
+    portal = MockPortal(args.host, args.port, latency=args.latency, jitter=args.jitter,
+                        error_rate=args.error_rate, non_json_rate=args.non_json_rate,
+                        bad_index_rate=args.bad_index_rate)
+    print(f"模拟门户: {portal.base_url}{INTERFACE_PATH}?method=login  检测地址: {portal.base_url}{CHECK_PATH}")
+    print(f"模拟掉线: {portal.base_url}/_control/drop  请求统计: {portal.base_url}/_control/stats")
+    try:
+        asyncio.run(portal.serve_forever())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""网卡绑定：让探测、门户检测和登录请求从指定网卡或源地址发出（Linux下使用SO_BINDTODEVICE）"""
+import ipaddress
+import re
+import socket
+import struct
+import sys
+
+SO_BINDTODEVICE = getattr(socket, 'SO_BINDTODEVICE', 25)
+SIOCGIFADDR = 0x8915
+
+# 门户参数中的终端IP，按网卡登录时换成该网卡的地址；参数可能已做URL编码
+USER_IP_RE = re.compile(r'(wlanuserip(?:=|%3D))[0-9.]+', re.IGNORECASE)
+
+
+def device_binding_supported():
+    return sys.platform.startswith('linux')
+
+
+def interface_address(device):
+    """返回网卡的IPv4地址（仅Linux），网卡不存在或没有地址时返回None"""
+    import fcntl
+
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        try:
+            data = fcntl.ioctl(sock.fileno(), SIOCGIFADDR, struct.pack('256s', device.encode()[:15]))
+        except OSError:
+            return None
+    return socket.inet_ntoa(data[20:24])
+
+
+def list_interfaces():
+    """返回 (网卡名, IPv4地址) 列表，不含回环网卡和没有地址的网卡（仅Linux）"""
+    if not device_binding_supported():
+        return []
+    interfaces = []
+    for _, name in socket.if_nameindex():
+        address = interface_address(name)
+        if address and not ipaddress.ip_address(address).is_loopback:
+            interfaces.append((name, address))
+    return interfaces
+
+
+class InterfaceBinding:
+    """绑定到一个网卡及其源地址；没有权限使用SO_BINDTODEVICE时只绑定源地址"""
+
+    def __init__(self, device=None, source=None):
+        self.device = device
+        self.source = source
+        self.name = device or source
+        self.device_allowed = bool(device) and device_binding_supported() and self._test_device()
+
+    @classmethod
+    def resolve(cls, spec):
+        """根据网卡名或IPv4地址创建绑定，找不到对应网卡时抛出ValueError"""
+        try:
+            ipaddress.IPv4Address(spec)
+        except ValueError:
+            if not device_binding_supported():
+                raise ValueError(f"当前系统不支持按网卡名绑定，请使用IP地址: {spec}")
+            address = interface_address(spec)
+            if address is None:
+                raise ValueError(f"网卡不存在或没有IPv4地址: {spec}")
+            return cls(device=spec, source=address)
+        device = next((name for name, address in list_interfaces() if address == spec), None)
+        return cls(device=device, source=spec)
+
+    def _test_device(self):
+        """内核5.7之前设置SO_BINDTODEVICE需要CAP_NET_RAW权限"""
+        try:
+            with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+                sock.setsockopt(socket.SOL_SOCKET, SO_BINDTODEVICE, self.device.encode())
+        except OSError:
+            return False
+        return True
+
+    def refresh(self):
+        """重新读取网卡地址（DHCP续租后可能变化），返回地址是否变化"""
+        if not self.device or not device_binding_supported():
+            return False
+        address = interface_address(self.device)
+        if address is None or address == self.source:
+            return False
+        self.source = address
+        return True
+
+    def socket_options(self):
+        """返回需要设置的 (level, option, value) 列表"""
+        if self.device_allowed:
+            return [(socket.SOL_SOCKET, SO_BINDTODEVICE, self.device.encode())]
+        return []
+
+    def apply(self, sock):
+        """在connect之前把套接字绑定到网卡和源地址；IPv6套接字只绑定网卡"""
+        for level, option, value in self.socket_options():
+            sock.setsockopt(level, option, value)
+        if self.source and sock.family == socket.AF_INET:
+            sock.bind((self.source, 0))
+
+    def pool_kwargs(self):
+        """urllib3连接池参数，使HTTP请求从该网卡发出"""
+        from urllib3.connection import HTTPConnection
+
+        kwargs = {'socket_options': HTTPConnection.default_socket_options + self.socket_options()}
+        if self.source:
+            kwargs['source_address'] = (self.source, 0)
+        return kwargs
+
+    def rewrite_query(self, query):
+        """把门户参数中的终端IP换成本网卡的地址"""
+        if not self.source:
+            return query
+        return USER_IP_RE.sub(lambda match: match.group(1) + self.source, query)
+
+    def __str__(self):
+        if self.device and self.source:
+            return f"{self.device} ({self.source})"
+        return self.name
@@ -0,0 +1,361 @@
+"""网络探测核心（不依赖任何GUI库）"""
+import queue
+import socket
+import threading
+import time
+from urllib.parse import urljoin, urlsplit
+
+from metrics import REGISTRY
+
+# 门户登录使用的浏览器标识
+BROWSER_USER_AGENT = ('Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 '
+                      '(KHTML, like Gecko) Chrome/116.0.0.0 Safari/537.36')
+
+# 校园网认证门户地址
+PORTAL_HOST = "172.17.10.100"
+
+# 门户检测得到的网络状态
+NET_ONLINE = "online"    # 外网可达
+NET_CAPTIVE = "captive"  # 流量被门户拦截，需要登录
+NET_OFFLINE = "offline"  # 网络不可达，登录也无济于事
+
+PROBE_DNS_SECONDS = REGISTRY.histogram("probe_dns_seconds", "探测站点的DNS解析耗时", ("site",))
+PROBE_CONNECT_SECONDS = REGISTRY.histogram("probe_connect_seconds", "探测站点的TCP连接耗时", ("site",))
+PROBE_TOTAL = REGISTRY.counter("probe_total", "站点探测次数", ("site", "result"))
+DNS_CACHE_TOTAL = REGISTRY.counter("dns_cache_total", "DNS缓存查询结果次数", ("result",))
+CAPTIVE_CHECK_SECONDS = REGISTRY.histogram("captive_check_seconds", "门户检测HTTP请求耗时")
+CAPTIVE_CHECK_TOTAL = REGISTRY.counter("captive_check_total", "门户检测结果次数", ("state",))
+
+
+class ResolverCache:
+    """进程内DNS缓存：结果按TTL缓存，A和AAAA同时解析，支持固定地址；
+    解析失败时退回到过期的缓存地址，以便区分DNS故障和链路故障"""
+
+    # 一种地址族先解析出结果后，最多再等另一种这么久（秒）
+    RESOLUTION_DELAY = 0.05
+
+    def __init__(self, ttl=300, timeout=3):
+        self.ttl = ttl
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._cache = {}  # 主机名 -> (过期时间, 套接字地址列表)
+        self._pinned = {}  # 主机名 -> 固定地址列表
+
+    def pin(self, host, addresses):
+        """为主机指定固定地址，之后不再解析"""
+        infos = []
+        for address in addresses:
+            family = socket.AF_INET6 if ':' in address else socket.AF_INET
+            infos.append((family, (address, 0, 0, 0) if family == socket.AF_INET6 else (address, 0)))
+        with self._lock:
+            self._pinned[host] = infos
+
+    def unpin_all(self):
+        """清除全部固定地址"""
+        with self._lock:
+            self._pinned.clear()
+
+    def prefetch(self, hosts):
+        """在后台预先解析，填充缓存"""
+        for host in hosts:
+            threading.Thread(target=self._prefetch_one, args=(host,), daemon=True).start()
+
+    def _prefetch_one(self, host):
+        try:
+            self.resolve(host, 0)
+        except OSError:
+            pass
+
+    def _lookup(self, host, family, results):
+        """解析一种地址族，结果放入队列"""
+        try:
+            infos = socket.getaddrinfo(host, None, family, socket.SOCK_STREAM)
+            results.put((family, [(info[0], info[4]) for info in infos], None))
+        except OSError as e:
+            results.put((family, [], e))
+
+    def resolve(self, host, port, timeout=None):
+        """返回 (getaddrinfo格式的地址列表, 实际解析耗时秒, 来源)；来源为 pinned/cache/dns/stale"""
+        now = time.monotonic()
+        with self._lock:
+            pinned = self._pinned.get(host)
+            entry = self._cache.get(host)
+        if pinned:
+            DNS_CACHE_TOTAL.labels(result="pinned").inc()
+            return self._with_port(pinned, port), 0.0, "pinned"
+        if entry and entry[0] > now:
+            DNS_CACHE_TOTAL.labels(result="hit").inc()
+            return self._with_port(entry[1], port), 0.0, "cache"
+
+        families = [socket.AF_INET] + ([socket.AF_INET6] if socket.has_ipv6 else [])
+        results = queue.Queue()
+        for family in families:
+            threading.Thread(target=self._lookup, args=(host, family, results), daemon=True).start()
+
+        deadline_at = now + (timeout if timeout is not None else self.timeout)
+        found = {}
+        error = None
+        for _ in families:
+            remaining = deadline_at - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                family, infos, exc = results.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if infos:
+                found[family] = infos
+                deadline_at = min(deadline_at, time.monotonic() + self.RESOLUTION_DELAY)
+            else:
+                error = exc
+        elapsed = time.monotonic() - now
+
+        # IPv4优先，校园网内IPv6往往不通
+        infos = [info for family in families for info in found.get(family, [])]
+        if infos:
+            DNS_CACHE_TOTAL.labels(result="miss").inc()
+            with self._lock:
+                self._cache[host] = (time.monotonic() + self.ttl, infos)
+            return self._with_port(infos, port), elapsed, "dns"
+        if entry:
+            DNS_CACHE_TOTAL.labels(result="stale").inc()
+            return self._with_port(entry[1], port), elapsed, "stale"
+        DNS_CACHE_TOTAL.labels(result="fail").inc()
+        raise error or socket.gaierror(f"解析 {host} 超时")
+
+    @staticmethod
+    def _with_port(infos, port):
+        """把缓存的地址换成目标端口，输出与getaddrinfo相同的格式"""
+        return [(family, socket.SOCK_STREAM, socket.IPPROTO_TCP, '', (addr[0], port) + tuple(addr[2:]))
+                for family, addr in infos]
+
+
+# 进程内共享的DNS缓存
+RESOLVER = ResolverCache()
+
+
+class ProbeResult:
+    """单个站点的探测结果"""
+
+    __slots__ = ("site", "ok", "latency", "error", "dns_ms", "connect_ms", "stage", "dns_source")
+
+    def __init__(self, site, ok, latency=None, error=None, dns_ms=None, connect_ms=None, stage=None,
+                 dns_source=None):
+        self.site = site
+        self.ok = ok
+        self.latency = latency  # 毫秒，DNS解析加连接
+        self.error = error
+        self.dns_ms = dns_ms
+        self.connect_ms = connect_ms
+        self.stage = stage  # 失败发生在 "dns" 还是 "connect" 阶段
+        self.dns_source = dns_source  # 地址来源：pinned/cache/dns/stale
+
+    def __repr__(self):
+        if self.ok:
+            return f"<ProbeResult {self.site} ok {self.latency:.2f}ms>"
+        return f"<ProbeResult {self.site} failed: {self.error}>"
+
+
+class ProbeEngine:
+    """并发探测多个站点：所有站点同时连接，整轮共用一个截止时间"""
+
+    def __init__(self, port=80, timeout=5, resolver=None, binding=None):
+        self.port = port
+        self.timeout = timeout
+        self.resolver = resolver or RESOLVER
+        self.binding = binding  # 绑定的网卡（见netbind模块），为None时由系统选路
+
+    def _connect(self, site, deadline_at, cancel, sockets, lock):
+        """连接单个站点，连接成功后立即关闭套接字"""
+        result = self._attempt(site, deadline_at, cancel, sockets, lock)
+        if result.ok:
+            PROBE_TOTAL.labels(site=site, result="ok").inc()
+        else:
+            PROBE_TOTAL.labels(site=site, result="cancelled" if cancel.is_set() else "fail").inc()
+        return result
+
+    def _attempt(self, site, deadline_at, cancel, sockets, lock):
+        """依次尝试站点解析出的地址"""
+        start = time.monotonic()
+        try:
+            infos, dns_seconds, source = self.resolver.resolve(site, self.port, timeout=deadline_at - start)
+        except OSError as e:
+            return ProbeResult(site, False, error=e, dns_ms=(time.monotonic() - start) * 1000, stage="dns")
+        if source in ("dns", "stale"):
+            PROBE_DNS_SECONDS.labels(site=site).observe(dns_seconds)
+
+        last_error = None
+        for family, socktype, proto, _, addr in infos:
+            remaining = deadline_at - time.monotonic()
+            if cancel.is_set() or remaining <= 0:
+                break
+            sock = socket.socket(family, socktype, proto)
+            with lock:
+                sockets.add(sock)
+            try:
+                if self.binding is not None:
+                    self.binding.apply(sock)
+                sock.settimeout(remaining)
+                connect_start = time.monotonic()
+                sock.connect(addr)
+                connect_seconds = time.monotonic() - connect_start
+                PROBE_CONNECT_SECONDS.labels(site=site).observe(connect_seconds)
+                return ProbeResult(site, True, latency=(time.monotonic() - start) * 1000,
+                                   dns_ms=dns_seconds * 1000, connect_ms=connect_seconds * 1000,
+                                   dns_source=source)
+            except OSError as e:
+                last_error = e
+            finally:
+                with lock:
+                    sockets.discard(sock)
+                sock.close()
+        return ProbeResult(site, False, error=last_error or socket.timeout("timed out"), dns_ms=dns_seconds * 1000,
+                           stage="connect", dns_source=source)
+
+    def _run(self, sites, deadline, first_wins):
+        """启动探测线程并收集结果"""
+        sites = list(dict.fromkeys(sites))  # 去重，保持顺序
+        deadline_at = time.monotonic() + (deadline if deadline is not None else self.timeout)
+        results = queue.Queue()
+        cancel = threading.Event()
+        sockets = set()
+        lock = threading.Lock()
+
+        for site in sites:
+            threading.Thread(
+                target=lambda s=site: results.put(self._connect(s, deadline_at, cancel, sockets, lock)),
+                daemon=True).start()
+
+        collected = {}
+        while len(collected) < len(sites):
+            remaining = deadline_at - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                result = results.get(timeout=remaining)
+            except queue.Empty:
+                break
+            collected[result.site] = result
+            if first_wins and result.ok:
+                break
+
+        # 取消其余仍在进行的连接：shutdown 会唤醒阻塞中的 connect，由各线程自行关闭套接字
+        cancel.set()
+        with lock:
+            for sock in sockets:
+                try:
+                    sock.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+        return collected
+
+    def probe_first(self, sites, deadline=None):
+        """并发探测，首个成功即返回 (成功结果或None, 失败结果列表)"""
+        collected = self._run(sites, deadline, first_wins=True)
+        winner = next((r for r in collected.values() if r.ok), None)
+        failures = [r for r in collected.values() if not r.ok]
+        if winner is None:
+            failures.extend(ProbeResult(site, False, error=socket.timeout("timed out"))
+                            for site in sites if site not in collected)
+        return winner, failures
+
+    def probe_all(self, sites, deadline=None):
+        """并发探测全部站点，按站点顺序返回结果列表"""
+        collected = self._run(sites, deadline, first_wins=False)
+        return [collected.get(site) or ProbeResult(site, False, error=socket.timeout("timed out"))
+                for site in sites]
+
+
+def create_http_session(pool_size=4, retries=2, binding=None):
+    """创建带连接池、长连接和重试策略的共享HTTP会话；指定binding时所有连接从该网卡发出；
+    retries为0时不重试，用于检测类请求，失败应立即反映出来"""
+    # 延迟导入：纯探测场景不需要加载requests
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    class BoundAdapter(HTTPAdapter):
+        """连接池创建连接时带上网卡绑定参数"""
+
+        def init_poolmanager(self, *args, **kwargs):
+            if binding is not None:
+                kwargs.update(binding.pool_kwargs())
+            super().init_poolmanager(*args, **kwargs)
+
+    # 仅对连接阶段失败重试；登录是POST，读超时后不能盲目重发
+    retry = Retry(total=retries, connect=retries, read=0, status=retries,
+                  backoff_factor=0.3, status_forcelist=(502, 503, 504),
+                  allowed_methods=frozenset({"GET", "HEAD"}), raise_on_status=False)
+    adapter = BoundAdapter(pool_connections=2, pool_maxsize=pool_size, max_retries=retry)
+
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers.update({
+        'User-Agent': BROWSER_USER_AGENT,
+        'Connection': 'keep-alive',
+    })
+    return session
+
+
+def portal_link(text, portal_host):
+    """在门户返回的跳转页面（脚本跳转或meta refresh）中找出指向门户的地址，找不到时返回None"""
+    start = text.find(f"http://{portal_host}")
+    while start >= 0:
+        end = min((i for i in (text.find(c, start) for c in "'\" <>") if i >= 0), default=len(text))
+        link = text[start:end]
+        if urlsplit(link).hostname == portal_host:  # 排除 172.17.10.1000 这类前缀相同的主机
+            return link
+        start = text.find(f"http://{portal_host}", end)
+    return None
+
+
+class CaptiveDetector:
+    """门户检测：请求一个返回204的地址，根据响应判断在线、被门户拦截或离线；
+    只有跳转到认证门户（portal_host）才算被拦截，5xx、其他页面或跳转到其他主机都按离线处理，交给站点探测确认；
+    session应不带重试（create_http_session(retries=0)），否则地址不可达时要等多次连接超时"""
+
+    def __init__(self, session, check_url="http://connect.rom.miui.com/generate_204",
+                 portal_host=PORTAL_HOST, timeout=5):
+        self.session = session
+        self.check_url = check_url
+        self.portal_host = portal_host
+        self.timeout = timeout
+
+    def detect(self):
+        """返回 (状态, 说明)；被拦截时说明为门户跳转地址"""
+        with CAPTIVE_CHECK_SECONDS.time():
+            state, detail = self._detect()
+        CAPTIVE_CHECK_TOTAL.labels(state=state).inc()
+        return state, detail
+
+    def _detect(self):
+        """发送检测请求并分类"""
+        import requests
+
+        try:
+            response = self.session.get(self.check_url, allow_redirects=False,
+                                        timeout=self.timeout, stream=True)
+        except requests.RequestException as e:
+            return NET_OFFLINE, str(e)
+
+        with response:
+            if response.status_code == 204:
+                return NET_ONLINE, ""
+
+            location = response.headers.get('Location', '')
+            if response.is_redirect and location:
+                location = urljoin(self.check_url, location)
+                if urlsplit(location).hostname == self.portal_host:
+                    return NET_CAPTIVE, location
+                return NET_OFFLINE, f"HTTP {response.status_code} 跳转到非门户地址 {location}"
+
+            # 锐捷门户常以200返回一段跳转脚本，只读取开头即可找到门户地址
+            try:
+                head = next(response.iter_content(4096), b"").decode('utf-8', errors='replace')
+            except requests.RequestException:
+                head = ""
+            link = portal_link(head, self.portal_host)
+            if link is not None:
+                return NET_CAPTIVE, link
+            return NET_OFFLINE, f"HTTP {response.status_code}"
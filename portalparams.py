@@ -0,0 +1,145 @@
+"""门户参数自动获取：未认证时的HTTP请求会被重定向到认证页面（如 /eportal/index.jsp?wlanuserip=...），
+跳转地址的查询串就是登录所需的networkParams；按本机IP和MAC缓存，换地址或换网卡后重新获取"""
+import json
+import logging
+import os
+import re
+import socket
+import threading
+import time
+from urllib.parse import urljoin, urlsplit
+
+from netbind import list_interfaces
+from netcore import portal_link
+
+PARAMS_FILE_NAME = "portal_params.json"
+MAX_ENTRIES = 32  # 最多缓存的 IP/MAC 组合
+MAX_HOPS = 3  # 检测地址之后最多再跟随的跳转次数
+
+# 门户参数中的终端IP，参数可能已做URL编码
+QUERY_IP_RE = re.compile(r'wlanuserip(?:=|%3D)([0-9.]+)', re.IGNORECASE)
+
+
+def redirect_query(url, portal_host):
+    """跳转地址指向门户且带查询串时返回查询串，否则返回None"""
+    parts = urlsplit(url)
+    if parts.hostname != portal_host or not parts.query:
+        return None
+    return parts.query
+
+
+def query_user_ip(params):
+    """networkParams中的终端IP（wlanuserip），没有时返回None"""
+    match = QUERY_IP_RE.search(params)
+    return match.group(1) if match else None
+
+
+def follow_redirects(session, url, portal_host, timeout=5):
+    """从门户检测得到的跳转地址继续跟随重定向（含脚本跳转），返回门户地址的查询串；找不到时返回None"""
+    import requests
+
+    for _ in range(MAX_HOPS + 1):
+        query = redirect_query(url, portal_host)
+        if query:
+            return query
+        if urlsplit(url).scheme not in ("http", "https"):
+            return None
+        try:
+            response = session.get(url, allow_redirects=False, timeout=timeout, stream=True)
+        except requests.RequestException:
+            return None
+        with response:
+            location = response.headers.get('Location', '')
+            if response.is_redirect and location:
+                url = urljoin(url, location)
+                continue
+            try:
+                head = next(response.iter_content(4096), b"").decode('utf-8', errors='replace')
+            except requests.RequestException:
+                head = ""
+        url = portal_link(head, portal_host)
+        if url is None:
+            return None
+    return None
+
+
+def local_address(host, port, binding=None):
+    """连接门户时使用的本机IPv4地址（UDP套接字选路，不发送数据），没有路由时返回None"""
+    try:
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            if binding is not None:
+                binding.apply(sock)
+            sock.connect((host, port))
+            address = sock.getsockname()[0]
+    except OSError:
+        return None
+    return address if address not in ("0.0.0.0", "") else None
+
+
+def interface_mac(device):
+    """网卡的MAC地址（仅Linux），读取失败时返回None"""
+    try:
+        with open(f"/sys/class/net/{device}/address") as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+def link_key(host, port, binding=None):
+    """当前网络的缓存键 "IP/MAC"；无法确定本机地址时返回None"""
+    address = local_address(host, port, binding)
+    if address is None:
+        return None
+    device = binding.device if binding is not None and binding.device else \
+        next((name for name, ip in list_interfaces() if ip == address), None)
+    mac = interface_mac(device) if device else None
+    return f"{address}/{mac or '-'}"
+
+
+class ParamCache:
+    """门户参数缓存文件：键为 "IP/MAC"，值为跳转地址的查询串；按网卡登录时多个引擎共用同一文件"""
+
+    _lock = threading.Lock()
+
+    def __init__(self, path, logger=None):
+        self.path = path
+        self.logger = logger or logging.getLogger("CampusNetworkLogin")
+
+    def _read(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                entries = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        return entries if isinstance(entries, dict) else {}
+
+    def _write(self, entries):
+        """写入缓存文件；写入失败（目录只读、磁盘已满）只记录警告，不影响登录"""
+        tmp_path = self.path + '.tmp'
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(entries, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            self.logger.warning(f"保存网络参数缓存失败: {str(e)}")
+
+    def get(self, key):
+        entry = self._read().get(key)
+        return entry.get('query') if isinstance(entry, dict) else None
+
+    def put(self, key, query):
+        """保存查询串，超过MAX_ENTRIES时丢弃最早获取的条目"""
+        with self._lock:
+            entries = self._read()
+            entries[key] = {'query': query, 'time': time.time()}
+            if len(entries) > MAX_ENTRIES:
+                oldest = sorted(entries, key=lambda k: entries[k].get('time', 0) if isinstance(entries[k], dict) else 0)
+                for name in oldest[:len(entries) - MAX_ENTRIES]:
+                    del entries[name]
+            self._write(entries)
+
+    def discard(self, key):
+        with self._lock:
+            entries = self._read()
+            if entries.pop(key, None) is not None:
+                self._write(entries)
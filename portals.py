@@ -0,0 +1,261 @@
+"""认证门户适配器：每种门户负责构造登录请求、解析登录响应和查询在线会话，配置中的portal决定使用哪一种；
+请求模板和响应解析用的正则在创建时准备好，重复登录时只填入变化的参数"""
+import binascii
+import json
+import re
+from urllib.parse import parse_qsl, quote, quote_plus, unquote, urlencode, urlsplit, urlunsplit
+
+from breaker import FAILURE_AUTH, FAILURE_BAD_RESPONSE, FAILURE_HTTP_5XX, FAILURE_NON_JSON
+
+DEFAULT_PORTAL = "eportal"
+FORM_HEADERS = {'Content-Type': 'application/x-www-form-urlencoded; charset=UTF-8'}
+
+PORTALS = {}  # 配置中的portal取值 -> 适配器
+
+
+def register(adapter_class):
+    """登记门户适配器（类装饰器），每种门户只创建一个实例，供所有引擎共用"""
+    PORTALS[adapter_class.name] = adapter_class()
+    return adapter_class
+
+
+def get_portal(name=None):
+    """按名称返回门户适配器，未指定时为默认门户；不支持的名称抛出ValueError"""
+    adapter = PORTALS.get(name or DEFAULT_PORTAL)
+    if adapter is None:
+        raise ValueError(f"不支持的门户类型: {name}（可选: {', '.join(PORTALS)}）")
+    return adapter
+
+
+class LoginRequest:
+    """编译好的登录请求：账号相关的部分已编码，每次登录只需编码queryString"""
+
+    __slots__ = ("method", "url", "headers", "_render", "_last")
+
+    def __init__(self, method, url, render, headers=None):
+        self.method = method
+        self.url = url
+        self.headers = headers
+        self._render = render  # queryString -> 请求体（GET时为完整地址）
+        self._last = None  # 上次的 (queryString, 渲染结果)
+
+    def render(self, network_params):
+        """返回请求体（GET请求返回完整地址）；queryString未变时直接复用上次结果"""
+        last = self._last
+        if last is None or last[0] != network_params:
+            last = self._last = (network_params, self._render(network_params))
+        return last[1]
+
+
+class PortalAdapter:
+    """门户适配器基类"""
+
+    name = ""  # 配置中的portal取值
+    title = ""  # 显示名称
+    default_target_url = ""
+    services = {}  # 服务代号 -> (显示名称, 配置中serviceName的值)
+    required_fields = ('userAccount', 'encryptedPassword', 'targetUrl')
+
+    def service_key(self, config):
+        """配置中serviceName对应的服务代号，找不到时返回第一个"""
+        value = config.get('serviceName')
+        return next((key for key, (_, service) in self.services.items() if service == value), next(iter(self.services)))
+
+    def service_value(self, key):
+        """服务代号对应的serviceName，不支持的代号抛出ValueError"""
+        if key not in self.services:
+            raise ValueError(f"{self.title}不支持服务提供商: {key}（可选: {', '.join(self.services)}）")
+        return self.services[key][1]
+
+    def params_from_query(self, query, current=""):
+        """把门户跳转地址的查询串转换为networkParams，current为配置中原有的值"""
+        return query
+
+    def compile(self, config):
+        """根据账号配置生成LoginRequest"""
+        raise NotImplementedError
+
+    def parse_login(self, result, status_code, text, config, logger):
+        """解析登录响应，填写result的ok、ip、account等字段；失败时填写error和failure"""
+        raise NotImplementedError
+
+    def session_request(self, config, session):
+        """查询已保存会话是否在线的请求 (方法, 地址, 表单)；门户不支持时返回None"""
+        return None
+
+    def session_valid(self, text, session):
+        """解析会话查询响应，返回 (是否在线, 用于显示的数据)；无法解析时抛出ValueError"""
+        raise NotImplementedError
+
+
+@register
+class RuijieEportal(PortalAdapter):
+    """锐捷ePortal（本校门户）：表单POST到InterFace.do?method=login，
+    成功时返回十六进制编码的userIndex，解码后为 设备标识_IP_账号"""
+
+    name = "eportal"
+    title = "锐捷ePortal"
+    default_target_url = 'http://172.17.10.100/eportal/InterFace.do?method=login'
+    services = {
+        'cmcc': ("中国移动宽带", '%E4%B8%AD%E5%9B%BD%E7%A7%BB%E5%8A%A8%E5%AE%BD%E5%B8%A6'),
+        'telecom': ("中国电信宽带", '%E4%B8%AD%E5%9B%BD%E7%94%B5%E4%BF%A1%E5%AE%BD%E5%B8%A6'),
+    }
+    required_fields = ('userAccount', 'encryptedPassword', 'serviceName', 'networkParams', 'targetUrl')
+
+    # 常见的成功响应直接用正则取出userIndex，其余情况再完整解析JSON以区分失败原因
+    USER_INDEX_RE = re.compile(r'^\s*\{.*?"userIndex"\s*:\s*"([0-9A-Fa-f]+)"', re.DOTALL)
+    SUCCESS_RE = re.compile(r'"result"\s*:\s*"success"')
+    STATIC_FIELDS = urlencode({'operatorPwd': '', 'operatorUserId': '', 'validcode': '', 'passwordEncrypt': 'true'})
+
+    def params_from_query(self, query, current=""):
+        # 认证页面提交的queryString是对查询串再做一次encodeURIComponent；原有配置是未编码的形式时沿用原形式
+        if current and '=' in current:
+            return query
+        return quote(query, safe="-_.!~*'()")
+
+    def compile(self, config):
+        # 字段顺序与浏览器提交的表单一致：userId, password, service, queryString, 固定字段
+        head = urlencode({'userId': config['userAccount'], 'password': config['encryptedPassword'],
+                          'service': config['serviceName']}) + "&queryString="
+        tail = "&" + self.STATIC_FIELDS
+        return LoginRequest("POST", config['targetUrl'], lambda params: head + quote_plus(params) + tail,
+                            FORM_HEADERS)
+
+    def parse_login(self, result, status_code, text, config, logger):
+        match = self.USER_INDEX_RE.match(text)
+        if match is not None and self.SUCCESS_RE.search(text):
+            result.user_index = match.group(1)
+        else:
+            try:
+                data = json.loads(text)
+            except ValueError:
+                result.error = "响应非JSON格式"
+                result.failure = FAILURE_HTTP_5XX if status_code >= 500 else FAILURE_NON_JSON
+                logger.error("登录响应不是有效的JSON格式")
+                return
+            if not isinstance(data, dict):
+                data = {}
+            if data.get('result') != 'success':
+                # 门户拒绝登录（账号密码错误、参数过期等），userIndex为null
+                result.error = f"门户拒绝登录（{data.get('message') or data.get('result') or '未知原因'}）"
+                result.failure = FAILURE_AUTH
+                logger.error(f"登录失败: {result.error}")
+                return
+            if not data.get('userIndex'):
+                result.error = "响应中缺少userIndex字段"
+                if data.get('message'):
+                    result.error += f"（门户提示：{data['message']}）"
+                result.failure = FAILURE_AUTH
+                logger.error("登录响应中缺少userIndex字段")
+                return
+            result.user_index = data['userIndex']
+
+        try:
+            result.decoded = binascii.unhexlify(result.user_index).decode('utf-8', errors='replace')
+            logger.info(f"userIndex解码成功: {result.decoded}")
+        except (binascii.Error, TypeError):
+            result.error = f"userIndex格式错误：{result.user_index}"
+            result.failure = FAILURE_BAD_RESPONSE
+            logger.error(f"userIndex格式错误: {result.user_index}")
+            return
+
+        segments = result.decoded.split('_')
+        if len(segments) < 3:
+            result.failure = FAILURE_BAD_RESPONSE
+            logger.warning("登录响应数据格式异常")
+            return
+        result.ok = True
+        result.device_id, result.ip, result.account = segments[:3]
+        result.account_match = result.account == config['userAccount']
+
+    @staticmethod
+    def interface_url(target_url, method):
+        """把登录地址的method参数换成指定接口，例如getOnlineUserInfo"""
+        parts = urlsplit(target_url)
+        query = [(k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if k != 'method']
+        query.insert(0, ('method', method))
+        return urlunsplit(parts._replace(query=urlencode(query)))
+
+    def session_request(self, config, session):
+        if not session.get('userIndex'):
+            return None
+        return ("POST", self.interface_url(config['targetUrl'], 'getOnlineUserInfo'),
+                {'userIndex': session['userIndex']})
+
+    def session_valid(self, text, session):
+        data = json.loads(text)
+        return isinstance(data, dict) and data.get('result') == 'success', data
+
+
+@register
+class DrcomEportal(PortalAdapter):
+    """Dr.COM ePortal：GET请求 /eportal/?c=Portal&a=login，响应为JSONP，result为1表示成功；
+    运营商以账号后缀区分，networkParams可填跳转地址中的参数（wlanuserip、wlanusermac等），可以为空"""
+
+    name = "drcom"
+    title = "Dr.COM ePortal"
+    default_target_url = 'http://172.17.10.100:801/eportal/'
+    services = {
+        'campus': ("校园网", ''),
+        'cmcc': ("中国移动", '@cmcc'),
+        'telecom': ("中国电信", '@telecom'),
+        'unicom': ("中国联通", '@unicom'),
+    }
+
+    JSONP_RE = re.compile(r'^\s*[\w.]*\((.*)\)\s*;?\s*$', re.DOTALL)
+    # 跳转地址中的参数名 -> 登录接口的参数名
+    PARAM_NAMES = {'wlanuserip': 'wlan_user_ip', 'wlanusermac': 'wlan_user_mac', 'wlanacip': 'wlan_ac_ip',
+                   'wlanacname': 'wlan_ac_name'}
+
+    def _account(self, config):
+        return f",0,{config['userAccount']}{config.get('serviceName') or ''}"
+
+    def compile(self, config):
+        parts = urlsplit(config['targetUrl'])
+        base = urlunsplit(parts._replace(query=""))
+        head = base + "?" + urlencode([('c', 'Portal'), ('a', 'login'), ('callback', 'dr1003'), ('login_method', '1'),
+                                       ('user_account', self._account(config)),
+                                       ('user_password', config['encryptedPassword'])])
+        names = self.PARAM_NAMES
+
+        def render(params):
+            if '=' not in params:  # 从浏览器复制的是编码后的queryString
+                params = unquote(params)
+            fields = [(names[key.lower()], value) for key, value in parse_qsl(params) if key.lower() in names]
+            return head + ("&" + urlencode(fields) if fields else "")
+
+        return LoginRequest("GET", base, render)
+
+    def _jsonp(self, text):
+        """取出JSONP中的JSON对象，无法解析时抛出ValueError"""
+        match = self.JSONP_RE.match(text)
+        data = json.loads(match.group(1) if match else text)
+        if not isinstance(data, dict):
+            raise ValueError("响应不是JSON对象")
+        return data
+
+    def parse_login(self, result, status_code, text, config, logger):
+        try:
+            data = self._jsonp(text)
+        except ValueError:
+            result.error = "响应非JSON格式"
+            result.failure = FAILURE_HTTP_5XX if status_code >= 500 else FAILURE_NON_JSON
+            logger.error("登录响应不是有效的JSON格式")
+            return
+        if str(data.get('result')) != '1':
+            result.error = f"门户拒绝登录（{data.get('msg') or data.get('ret_code') or '未知原因'}）"
+            result.failure = FAILURE_AUTH
+            logger.error(f"登录失败: {result.error}")
+            return
+        result.ok = True
+        result.account = config['userAccount']
+        result.account_match = True
+        result.ip = data.get('v46ip') or data.get('wlan_user_ip')
+
+    def session_request(self, config, session):
+        parts = urlsplit(config['targetUrl'])
+        return "GET", f"{parts.scheme}://{parts.netloc}/drcom/chkstatus?callback=dr1002", None
+
+    def session_valid(self, text, session):
+        data = self._jsonp(text)
+        return str(data.get('result')) == '1' and str(data.get('uid', '')).startswith(session['account']), data
@@ -0,0 +1,243 @@
+"""多账号配置档案与并发批量登录"""
+import argparse
+import json
+import logging
+import os
+import re
+import shutil
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from applog import setup_logging
+from configstore import CONFIG_FILE_NAME, LEGACY_CONFIG_FILE_NAME
+from engine import LoginEngine
+from portals import DEFAULT_PORTAL, PORTALS, get_portal
+
+PROFILE_NAME_RE = re.compile(r'^[\w.-]+$')
+DEFAULT_CONCURRENCY = 8
+
+
+class ProfileStore:
+    """档案目录：每个档案是一个子目录，内含与单账号相同格式的配置文件及其会话文件"""
+
+    def __init__(self, root, logger=None):
+        self.root = root
+        self.logger = logger or logging.getLogger("CampusNetworkLogin")
+
+    def path(self, name):
+        """返回档案目录，名称只允许字母、数字、下划线、点和连字符"""
+        if not PROFILE_NAME_RE.match(name):
+            raise ValueError(f"档案名称不合法: {name}")
+        return os.path.join(self.root, name)
+
+    def names(self):
+        """返回所有档案名称"""
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(name for name in os.listdir(self.root)
+                      if any(os.path.isfile(os.path.join(self.root, name, file_name))
+                             for file_name in (CONFIG_FILE_NAME, LEGACY_CONFIG_FILE_NAME)))
+
+    def _new_engine(self, path):
+        """档案代表其他终端，各自使用配置中的网络参数，不从本机的门户跳转地址获取"""
+        engine = LoginEngine(path, logger=self.logger)
+        engine.set_override('captureParams', False)
+        engine.capture_params = False
+        return engine
+
+    def engine(self, name):
+        """返回加载了该档案配置的LoginEngine，配置缺失或不完整时抛出ValueError"""
+        engine = self._new_engine(self.path(name))
+        if not engine.load_config() or not engine.config_complete():
+            raise ValueError(f"档案 {name} 配置不完整")
+        return engine
+
+    def save(self, name, config):
+        """新建或覆盖档案"""
+        path = self.path(name)
+        engine = self._new_engine(path)
+        missing = [field for field in engine.required_fields(config) if not config.get(field)]
+        if missing:
+            raise ValueError(f"缺少字段: {', '.join(missing)}")
+        os.makedirs(path, exist_ok=True)
+        engine.save_config(config)
+
+    def remove(self, name):
+        """删除档案及其会话文件"""
+        path = self.path(name)
+        if not os.path.isdir(path):
+            raise ValueError(f"档案不存在: {name}")
+        shutil.rmtree(path)
+        self.logger.info(f"档案已删除: {name}")
+
+
+class ProfileResult:
+    """单个档案的批量登录结果"""
+
+    def __init__(self, name):
+        self.name = name
+        self.account = None
+        self.service = None
+        self.ok = False
+        self.reused = False
+        self.ip = None
+        self.error = None
+        self.seconds = 0.0
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'account': self.account,
+            'service': self.service,
+            'ok': self.ok,
+            'reused': self.reused,
+            'ip': self.ip,
+            'error': self.error,
+            'seconds': round(self.seconds, 3),
+        }
+
+
+class BatchLogin:
+    """并发登录多个档案，同时进行的登录数不超过concurrency"""
+
+    def __init__(self, store, concurrency=DEFAULT_CONCURRENCY, logger=None, on_result=None):
+        self.store = store
+        self.concurrency = max(1, concurrency)
+        self.logger = logger or logging.getLogger("CampusNetworkLogin")
+        self.on_result = on_result  # 每个档案完成时回调 on_result(ProfileResult)，在工作线程中调用
+
+    def run(self, names=None, reuse=True):
+        """登录指定档案（默认全部），按传入顺序返回ProfileResult列表"""
+        names = list(names) if names else self.store.names()
+        if not names:
+            return []
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=min(self.concurrency, len(names)),
+                                thread_name_prefix="batch-login") as pool:
+            results = list(pool.map(lambda name: self._login_one(name, reuse), names))
+        succeeded = sum(1 for result in results if result.ok)
+        self.logger.info(f"批量登录完成: {succeeded}/{len(results)} 成功，"
+                         f"耗时 {(time.perf_counter() - started) * 1000:.0f} ms")
+        return results
+
+    def _login_one(self, name, reuse):
+        """登录单个档案，任何异常都记录在结果中而不向外抛出"""
+        record = ProfileResult(name)
+        started = time.perf_counter()
+        engine = None
+        try:
+            engine = self.store.engine(name)
+            record.account = engine.config['userAccount']
+            record.service = engine.service_key()
+            result = engine.login(reuse=reuse)
+            record.ok = result.ok
+            record.reused = result.reused
+            record.ip = result.ip
+            if result.exception is not None:
+                record.error = str(result.exception)
+            elif not result.ok:
+                record.error = result.error or "登录响应数据格式异常"
+        except Exception as e:
+            record.error = str(e)
+            self.logger.error(f"档案 {name} 登录失败: {str(e)}")
+        finally:
+            if engine is not None:
+                engine.close()
+        record.seconds = time.perf_counter() - started
+        if self.on_result:
+            self.on_result(record)
+        return record
+
+
+def save_results(path, results):
+    """把批量登录结果原子地写入JSON文件"""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'time': time.strftime("%Y-%m-%d %H:%M:%S"),
+                   'results': [result.to_dict() for result in results]}, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def main(argv=None):
+    """命令行入口：管理档案并批量登录"""
+    parser = argparse.ArgumentParser(description="校园网多账号批量认证")
+    parser.add_argument("--app-dir", default=os.path.dirname(os.path.abspath(sys.argv[0])),
+                        help="日志所在目录，档案默认位于其下的profiles目录")
+    parser.add_argument("--profiles-dir", help="档案目录")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    commands.add_parser("list", help="列出所有档案")
+
+    add = commands.add_parser("add", help="新建或覆盖档案")
+    add.add_argument("name")
+    add.add_argument("--account", required=True, help="用户账号")
+    add.add_argument("--password", required=True, help="加密后的密码")
+    add.add_argument("--portal", choices=sorted(PORTALS), default=DEFAULT_PORTAL, help="门户类型")
+    add.add_argument("--service", default="cmcc", help="服务提供商（锐捷门户: cmcc/telecom）")
+    add.add_argument("--params", default="", help="网络参数(queryString)")
+    add.add_argument("--target-url", help="登录地址（默认为该门户的登录地址）")
+
+    remove = commands.add_parser("remove", help="删除档案")
+    remove.add_argument("name")
+
+    login = commands.add_parser("login", help="并发登录档案")
+    login.add_argument("names", nargs="*", help="要登录的档案，默认全部")
+    login.add_argument("-j", "--concurrency", type=int, default=DEFAULT_CONCURRENCY,
+                       help=f"同时进行的登录数（默认{DEFAULT_CONCURRENCY}）")
+    login.add_argument("--force", action="store_true", help="不检查已保存的会话，直接登录")
+    login.add_argument("--output", help="结果JSON文件（默认写入档案目录下的batch_results.json）")
+    args = parser.parse_args(argv)
+
+    logger = setup_logging(args.app_dir)
+    store = ProfileStore(args.profiles_dir or os.path.join(args.app_dir, "profiles"), logger=logger)
+
+    try:
+        if args.command == "list":
+            for name in store.names():
+                try:
+                    engine = store.engine(name)
+                    print(f"{name}\t{engine.config['userAccount']}\t{engine.service_key()}")
+                except Exception as e:
+                    print(f"{name}\t<{str(e)}>")
+            return 0
+
+        if args.command == "add":
+            portal = get_portal(args.portal)
+            store.save(args.name, {
+                'portal': portal.name,
+                'userAccount': args.account,
+                'encryptedPassword': args.password,
+                'serviceName': portal.service_value(args.service),
+                'targetUrl': args.target_url or portal.default_target_url,
+                'networkParams': args.params,
+            })
+            return 0
+
+        if args.command == "remove":
+            store.remove(args.name)
+            return 0
+    except ValueError as e:
+        logger.error(str(e))
+        return 2
+
+    def report(record):
+        state = ("会话有效" if record.reused else "成功") if record.ok else f"失败: {record.error}"
+        print(f"{record.name}\t{record.account or '-'}\t{record.ip or '-'}\t"
+              f"{record.seconds * 1000:.0f} ms\t{state}", flush=True)
+
+    results = BatchLogin(store, concurrency=args.concurrency, logger=logger,
+                         on_result=report).run(args.names, reuse=not args.force)
+    if not results:
+        logger.error("没有可登录的档案")
+        return 2
+    output = args.output or os.path.join(store.root, "batch_results.json")
+    try:
+        save_results(output, results)
+    except OSError as e:
+        logger.warning(f"写入批量登录结果失败: {str(e)}")
+    return 0 if all(result.ok for result in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
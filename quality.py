@@ -0,0 +1,297 @@
+"""连接质量监控：定时采样连接和HTTP延迟，按站点维护滚动分位数与抖动，历史写入SQLite"""
+import argparse
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+from array import array
+
+from metrics import REGISTRY
+
+QUALITY_DEGRADED_TOTAL = REGISTRY.counter("quality_degraded_total", "站点连接质量下降次数", ("site",))
+
+KIND_CONNECT = 0  # 仅TCP连接耗时，不含DNS解析
+KIND_HTTP = 1
+KIND_DNS = 2  # 实际发出的DNS查询耗时，命中缓存时不记录
+KIND_NAMES = {KIND_CONNECT: "连接", KIND_HTTP: "HTTP", KIND_DNS: "DNS"}
+SUMMARY_KEYS = {KIND_CONNECT: 'connect', KIND_HTTP: 'http', KIND_DNS: 'dns'}
+
+
+class RollingWindow:
+    """固定容量的环形缓冲区（array('d')），保存最近的延迟样本（毫秒）"""
+
+    def __init__(self, size):
+        self.size = size
+        self.samples = array('d')
+        self.pos = 0  # 缓冲区满后下一个要覆盖的位置
+
+    def add(self, value):
+        if len(self.samples) < self.size:
+            self.samples.append(value)
+        else:
+            self.samples[self.pos] = value
+            self.pos = (self.pos + 1) % self.size
+
+    def ordered(self):
+        """按时间顺序返回样本"""
+        return self.samples[self.pos:] + self.samples[:self.pos]
+
+    def __len__(self):
+        return len(self.samples)
+
+    def percentile(self, q):
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def jitter(self):
+        """相邻样本差值绝对值的平均数"""
+        samples = self.ordered()
+        if len(samples) < 2:
+            return None
+        return sum(abs(b - a) for a, b in zip(samples, samples[1:])) / (len(samples) - 1)
+
+
+class SiteStats:
+    """单个站点的滚动统计"""
+
+    def __init__(self, window):
+        self.windows = {kind: RollingWindow(window) for kind in KIND_NAMES}
+        self.outcomes = array('b')  # 最近的探测结果，1成功0失败
+        self.window = window
+        self.pos = 0
+        self.degraded = False
+
+    def record(self, kind, latency):
+        """记录一个样本，latency为None表示失败（只有连接样本计入丢失率）"""
+        if latency is not None:
+            self.windows[kind].add(latency)
+        if kind == KIND_CONNECT:
+            ok = 0 if latency is None else 1
+            if len(self.outcomes) < self.window:
+                self.outcomes.append(ok)
+            else:
+                self.outcomes[self.pos] = ok
+                self.pos = (self.pos + 1) % self.window
+
+    def loss(self):
+        if not self.outcomes:
+            return 0.0
+        return 1 - sum(self.outcomes) / len(self.outcomes)
+
+    def summary(self):
+        result = {'loss': self.loss(), 'degraded': self.degraded}
+        for kind, window in self.windows.items():
+            result[SUMMARY_KEYS[kind]] = {
+                'n': len(window),
+                'p50': window.percentile(0.5),
+                'p95': window.percentile(0.95),
+                'jitter': window.jitter(),
+            }
+        return result
+
+
+class QualityHistory:
+    """延迟历史：SQLite表 samples(时间, 站点, 类型, 延迟毫秒)，失败时延迟为NULL"""
+
+    def __init__(self, path, retention_days=30):
+        self.path = path
+        self.retention_days = retention_days
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _connection(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS samples ("
+                               "ts REAL NOT NULL, site TEXT NOT NULL, kind INTEGER NOT NULL, latency REAL)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS samples_ts ON samples (ts)")
+        return self._conn
+
+    def append(self, rows):
+        """批量写入 (时间, 站点, 类型, 延迟) 行"""
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                conn.executemany("INSERT INTO samples VALUES (?, ?, ?, ?)", rows)
+
+    def prune(self):
+        """删除超过保留期的记录"""
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                conn.execute("DELETE FROM samples WHERE ts < ?", (time.time() - self.retention_days * 86400,))
+
+    def by_hour(self, days=7, kind=KIND_CONNECT, site=None):
+        """按一天中的小时汇总最近几天的记录，返回 (小时, 样本数, 平均延迟, 最大延迟, 丢失率) 列表"""
+        query = ("SELECT CAST(strftime('%H', ts, 'unixepoch', 'localtime') AS INTEGER) AS hour, COUNT(*), "
+                 "AVG(latency), MAX(latency), 1.0 - 1.0 * COUNT(latency) / COUNT(*) "
+                 "FROM samples WHERE ts >= ? AND kind = ?")
+        params = [time.time() - days * 86400, kind]
+        if site:
+            query += " AND site = ?"
+            params.append(site)
+        with self._lock:
+            return self._connection().execute(query + " GROUP BY hour ORDER BY hour", params).fetchall()
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+class QualityMonitor:
+    """定时采样各检查站点的连接和HTTP延迟，p95或丢失率超过阈值时提示质量下降"""
+
+    def __init__(self, prober, session_getter, sites_getter, interval=30, window=120, p95_threshold=300,
+                 loss_threshold=0.2, min_samples=5, history=None, logger=None, on_status=None):
+        self.prober = prober
+        self.session_getter = session_getter  # 返回共享HTTP会话的函数
+        self.sites_getter = sites_getter  # 返回当前检查站点列表的函数
+        self.interval = interval  # 采样间隔（秒）
+        self.window = window  # 每个站点保留的样本数
+        self.p95_threshold = p95_threshold  # 连接延迟p95阈值（毫秒）
+        self.loss_threshold = loss_threshold  # 丢失率阈值
+        self.min_samples = min_samples  # 样本数达到后才判断质量
+        self.history = history
+        self.logger = logger or logging.getLogger("CampusNetworkLogin")
+        self.on_status = on_status
+        self.stats = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self.thread = None
+
+    def start(self):
+        """启动采样线程；每次启动使用新的停止事件，刚停止的旧线程不会影响新线程"""
+        if self.thread is not None and self.thread.is_alive() and not self._stop.is_set():
+            return
+        self._stop = threading.Event()
+        self.thread = threading.Thread(target=self._run, args=(self._stop,), daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self, stop):
+        last_prune = 0
+        while not stop.is_set():
+            try:
+                self.sample()
+                if self.history is not None and time.time() - last_prune > 3600:
+                    self.history.prune()
+                    last_prune = time.time()
+            except Exception as e:
+                self.logger.error(f"连接质量采样出错: {str(e)}")
+            stop.wait(self.interval)
+
+    def _http_latency(self, site):
+        """对站点首页发一个HEAD请求，返回毫秒数，失败时返回None"""
+        started = time.perf_counter()
+        try:
+            self.session_getter().head(f"http://{site}/", allow_redirects=False, timeout=5)
+        except Exception:
+            return None
+        return (time.perf_counter() - started) * 1000
+
+    def sample(self):
+        """采样一轮并更新统计"""
+        now = time.time()
+        rows = []
+        for result in self.prober.probe_all(self.sites_getter()):
+            # 连接延迟不含DNS：解析偶尔变慢（缓存过期后重新查询）不应被当作连接质量下降
+            connect = result.connect_ms if result.ok else None
+            rows.append((now, result.site, KIND_CONNECT, connect))
+            if result.dns_source in ("dns", "stale") and result.dns_ms is not None:
+                rows.append((now, result.site, KIND_DNS, result.dns_ms))
+            if result.ok:
+                rows.append((now, result.site, KIND_HTTP, self._http_latency(result.site)))
+
+        with self._lock:
+            for _, site, kind, latency in rows:
+                stats = self.stats.get(site)
+                if stats is None:
+                    stats = self.stats[site] = SiteStats(self.window)
+                stats.record(kind, latency)
+            changes = [(site, stats) for site, stats in self.stats.items() if self._evaluate(stats)]
+
+        for site, stats in changes:
+            summary = stats.summary()
+            if stats.degraded:
+                QUALITY_DEGRADED_TOTAL.labels(site=site).inc()
+                message = (f"⚠️ {site} 连接质量下降: p95 {summary['connect']['p95'] or 0:.0f}ms，"
+                           f"抖动 {summary['connect']['jitter'] or 0:.0f}ms，丢失 {summary['loss']:.0%}")
+                self.logger.warning(message)
+            else:
+                message = f"✅ {site} 连接质量已恢复"
+                self.logger.info(message)
+            if self.on_status:
+                self.on_status(message)
+
+        if self.history is not None:
+            self.history.append(rows)
+
+    def _evaluate(self, stats):
+        """更新站点的质量状态，返回状态是否变化"""
+        window = stats.windows[KIND_CONNECT]
+        if len(stats.outcomes) < self.min_samples:
+            return False
+        p95 = window.percentile(0.95)
+        degraded = stats.loss() > self.loss_threshold or (p95 is not None and p95 > self.p95_threshold)
+        if degraded == stats.degraded:
+            return False
+        stats.degraded = degraded
+        return True
+
+    def snapshot(self):
+        """返回 站点 -> 统计摘要"""
+        with self._lock:
+            return {site: stats.summary() for site, stats in self.stats.items()}
+
+    def report_lines(self):
+        """返回用于显示的滚动统计文本行"""
+        lines = []
+        for site, summary in self.snapshot().items():
+            for kind, name in KIND_NAMES.items():
+                key = SUMMARY_KEYS[kind]
+                item = summary[key]
+                if not item['n']:
+                    continue
+                lines.append(f"📊 {site} {name}: p50 {item['p50']:.1f}ms, p95 {item['p95']:.1f}ms, "
+                             f"抖动 {item['jitter'] or 0:.1f}ms ({item['n']} 个样本)")
+            if summary['loss']:
+                lines.append(f"📊 {site} 丢失率: {summary['loss']:.0%}")
+        return lines
+
+
+def main(argv=None):
+    """命令行入口：按小时汇总历史延迟"""
+    parser = argparse.ArgumentParser(description="连接质量历史报告")
+    parser.add_argument("--app-dir", default=os.path.dirname(os.path.abspath(sys.argv[0])),
+                        help="quality.db 所在目录")
+    parser.add_argument("--days", type=int, default=7, help="统计最近几天（默认7）")
+    parser.add_argument("--site", help="只统计指定站点")
+    parser.add_argument("--http", action="store_true", help="统计HTTP延迟而不是连接延迟")
+    parser.add_argument("--dns", action="store_true", help="统计DNS解析耗时而不是连接延迟")
+    args = parser.parse_args(argv)
+
+    path = os.path.join(args.app_dir, "quality.db")
+    if not os.path.exists(path):
+        print(f"没有历史记录: {path}")
+        return 1
+    history = QualityHistory(path)
+    kind = KIND_HTTP if args.http else KIND_DNS if args.dns else KIND_CONNECT
+    print(f"最近 {args.days} 天{KIND_NAMES[kind]}延迟（按小时）")
+    print("小时  样本数    平均(ms)    最大(ms)   丢失率")
+    for hour, count, average, maximum, loss in history.by_hour(args.days, kind, args.site):
+        print(f"{hour:02d}   {count:6d}  {average or 0:10.1f}  {maximum or 0:10.1f}  {loss:7.1%}")
+    history.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
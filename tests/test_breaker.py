@@ -0,0 +1,107 @@
+"""登录熔断与限流的状态变化"""
+import pytest
+
+import breaker
+from breaker import (BREAKER_CLOSED, BREAKER_HALF_OPEN, BREAKER_OPEN, FAILURE_AUTH, FAILURE_TIMEOUT,
+                     CircuitBreaker, TokenBucket)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(breaker.time, "monotonic", clock)
+    return clock
+
+
+def test_opens_at_threshold(clock):
+    changes = []
+    cb = CircuitBreaker(threshold=3, cooldown=60, on_change=changes.append)
+    for _ in range(2):
+        cb.record_failure(FAILURE_TIMEOUT)
+        assert cb.state == BREAKER_CLOSED and cb.allow()
+    cb.record_failure(FAILURE_TIMEOUT)
+    assert cb.state == BREAKER_OPEN
+    assert not cb.allow()
+    assert cb.remaining() == 60
+    assert len(changes) == 1
+
+
+def test_auth_failure_counts_double(clock):
+    cb = CircuitBreaker(threshold=3)
+    cb.record_failure(FAILURE_AUTH)
+    assert cb.state == BREAKER_CLOSED
+    cb.record_failure(FAILURE_AUTH)
+    assert cb.state == BREAKER_OPEN
+
+
+def test_success_resets_count(clock):
+    cb = CircuitBreaker(threshold=3)
+    cb.record_failure(FAILURE_TIMEOUT)
+    cb.record_failure(FAILURE_TIMEOUT)
+    cb.record_success()
+    cb.record_failure(FAILURE_TIMEOUT)
+    assert cb.state == BREAKER_CLOSED and cb.failures == 1
+
+
+def open_breaker(cb):
+    for _ in range(cb.threshold):
+        cb.record_failure(FAILURE_TIMEOUT)
+    assert cb.state == BREAKER_OPEN
+
+
+def test_half_open_allows_single_trial(clock):
+    cb = CircuitBreaker(threshold=3, cooldown=60)
+    open_breaker(cb)
+    clock.now += 59
+    assert not cb.allow()
+    clock.now += 1
+    assert cb.allow()
+    assert cb.state == BREAKER_HALF_OPEN
+    assert not cb.allow()
+    cb.release()
+    assert cb.allow()
+
+
+def test_half_open_failure_doubles_cooldown(clock):
+    cb = CircuitBreaker(threshold=3, cooldown=60, max_cooldown=100)
+    open_breaker(cb)
+    clock.now += 60
+    assert cb.allow()
+    cb.record_failure(FAILURE_TIMEOUT)
+    assert cb.state == BREAKER_OPEN and cb.cooldown == 100
+    clock.now += 100
+    assert cb.allow()
+    cb.record_failure(FAILURE_TIMEOUT)
+    assert cb.cooldown == 100
+
+
+def test_half_open_success_closes(clock):
+    cb = CircuitBreaker(threshold=3, cooldown=60)
+    open_breaker(cb)
+    clock.now += 60
+    assert cb.allow()
+    cb.record_failure(FAILURE_TIMEOUT)
+    clock.now += 120
+    assert cb.allow()
+    cb.record_success()
+    assert cb.state == BREAKER_CLOSED
+    assert cb.cooldown == 60 and cb.failures == 0
+    assert cb.allow() and cb.allow()
+
+
+def test_token_bucket(clock):
+    bucket = TokenBucket(capacity=2, refill_seconds=10)
+    assert bucket.take() and bucket.take()
+    assert not bucket.take()
+    assert bucket.wait_time() == pytest.approx(10)
+    clock.now += 10
+    assert bucket.take()
+    assert not bucket.take()
@@ -0,0 +1,92 @@
+"""配置文件读写与旧格式迁移"""
+import json
+import os
+
+import pytest
+
+from configstore import SCHEMA_VERSION, ConfigStore, default_settings, parse_legacy
+
+LEGACY = '''userAccount = "2021001"
+encryptedPassword = "6a1fe9"
+serviceName = "%E7%94%B5%E4%BF%A1"
+targetUrl = "http://172.17.10.100/eportal/InterFace.do?method=login"
+networkParams = "wlanuserip%3D10.0.0.5"
+unknown = "x"
+'''
+
+
+def make_store(tmp_path):
+    return ConfigStore(str(tmp_path / "config.json"), str(tmp_path / "login_config.ini"))
+
+
+def test_parse_legacy():
+    account = parse_legacy(LEGACY)
+    assert account['userAccount'] == "2021001"
+    assert account['networkParams'] == "wlanuserip%3D10.0.0.5"
+    assert 'unknown' not in account
+
+
+def test_missing_file(tmp_path):
+    store = make_store(tmp_path)
+    assert not store.exists()
+    assert store.load() is None
+
+
+def test_migrates_legacy_file(tmp_path):
+    """旧配置被转换为config.json，旧文件保留为.bak"""
+    (tmp_path / "login_config.ini").write_text(LEGACY, encoding='utf-8')
+    store = make_store(tmp_path)
+    assert store.exists()
+    account, settings = store.load()
+    assert account == parse_legacy(LEGACY)
+    assert settings == default_settings()
+    assert not (tmp_path / "login_config.ini").exists()
+    assert (tmp_path / "login_config.ini.bak").exists()
+    data = json.loads((tmp_path / "config.json").read_text(encoding='utf-8'))
+    assert data['version'] == SCHEMA_VERSION
+    assert data['account'] == account
+    assert make_store(tmp_path).load() == (account, settings)
+
+
+def test_round_trip(tmp_path):
+    store = make_store(tmp_path)
+    settings = default_settings()
+    settings['pingInterval'] = 30
+    store.save({'userAccount': '2021001', 'other': 'x'}, settings)
+    assert not store.changed()
+    assert store.load() == ({'userAccount': '2021001'}, settings)
+
+
+def test_save_rejects_invalid_setting(tmp_path):
+    settings = default_settings()
+    settings['pingInterval'] = 5
+    with pytest.raises(ValueError):
+        make_store(tmp_path).save({}, settings)
+    assert not (tmp_path / "config.json").exists()
+
+
+def test_invalid_settings_fall_back_to_defaults(tmp_path):
+    data = {'version': SCHEMA_VERSION, 'account': {'userAccount': '2021001', 'targetUrl': 5},
+            'settings': {'pingInterval': 5, 'captiveMode': False, 'checkSites': []}}
+    (tmp_path / "config.json").write_text(json.dumps(data), encoding='utf-8')
+    account, settings = make_store(tmp_path).load()
+    assert account == {'userAccount': '2021001'}
+    assert settings['pingInterval'] == default_settings()['pingInterval']
+    assert settings['checkSites'] == default_settings()['checkSites']
+    assert settings['captiveMode'] is False
+
+
+@pytest.mark.parametrize("text", ["{", "[]", json.dumps({'version': SCHEMA_VERSION + 1})])
+def test_rejects_bad_file(tmp_path, text):
+    (tmp_path / "config.json").write_text(text, encoding='utf-8')
+    with pytest.raises(ValueError):
+        make_store(tmp_path).load()
+
+
+def test_detects_external_change(tmp_path):
+    store = make_store(tmp_path)
+    store.save({}, default_settings())
+    path = tmp_path / "config.json"
+    path.write_text(path.read_text(encoding='utf-8') + "\n", encoding='utf-8')
+    os.utime(path, ns=(0, 0))
+    assert store.changed()
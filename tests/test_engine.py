@@ -0,0 +1,142 @@
+"""登录引擎：配置加载、并发登录合并与熔断"""
+import json
+import threading
+import time
+
+import pytest
+
+from breaker import BREAKER_OPEN, FAILURE_AUTH
+from configstore import SCHEMA_VERSION, default_settings
+from engine import LoginEngine, LoginResult
+from portals import RuijieEportal
+
+ACCOUNT = {'userAccount': '2021001', 'encryptedPassword': 'pw', 'serviceName': '',
+           'targetUrl': 'http://172.17.10.100/eportal/InterFace.do?method=login', 'networkParams': 'wlanuserip=1'}
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = LoginEngine(str(tmp_path))
+    yield engine
+    engine.close()
+
+
+def write_config(engine, account, settings=None):
+    with open(engine.config_file, 'w', encoding='utf-8') as f:
+        json.dump({'version': SCHEMA_VERSION, 'account': account, 'settings': settings or {}}, f)
+
+
+def test_unknown_portal_keeps_previous_config(engine):
+    """外部把门户改成不支持的类型时，重新加载失败并保留原配置"""
+    engine.save_config(dict(ACCOUNT))
+    write_config(engine, dict(ACCOUNT, portal='srun', userAccount='other'), dict(default_settings(), pingInterval=20))
+    with pytest.raises(ValueError):
+        engine.load_config()
+    assert engine.config == ACCOUNT
+    assert engine.ping_interval == default_settings()['pingInterval']
+    assert isinstance(engine.portal, RuijieEportal)
+    assert not engine.reload_if_changed()
+
+
+def test_save_rejects_unknown_portal(engine):
+    engine.save_config(dict(ACCOUNT))
+    with pytest.raises(ValueError):
+        engine.save_config(dict(ACCOUNT, portal='srun'))
+    assert engine.config == ACCOUNT
+
+
+def blocking_login(engine, results):
+    """让 _guarded_login 阻塞到放行，按调用顺序返回results中的结果，记录每次调用的manual参数"""
+    release = threading.Event()
+    entered = threading.Event()
+    calls = []
+
+    def guarded_login(manual):
+        calls.append(manual)
+        entered.set()
+        release.wait(5)
+        outcome = results[len(calls) - 1]
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    engine._guarded_login = guarded_login
+    return entered, release, calls
+
+
+def ok_result():
+    result = LoginResult()
+    result.ok = True
+    return result
+
+
+def run_concurrently(engine, entered, *kwargs_list):
+    """先启动第一个登录，等它进入请求后再启动其余登录，返回 (线程列表, 结果字典)"""
+    outcomes = {}
+    threads = []
+    for i, kwargs in enumerate(kwargs_list):
+        thread = threading.Thread(target=lambda i=i, kw=kwargs: outcomes.__setitem__(i, engine.login(**kw)))
+        thread.start()
+        threads.append(thread)
+        if i == 0:
+            assert entered.wait(5)
+    time.sleep(0.1)
+    return threads, outcomes
+
+
+def test_concurrent_automatic_logins_share_one_request(engine):
+    engine.save_config(dict(ACCOUNT))
+    entered, release, calls = blocking_login(engine, [ok_result()])
+    threads, outcomes = run_concurrently(engine, entered, {'reuse': False}, {'reuse': False}, {'reuse': True})
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert calls == [False]
+    assert outcomes[0] is outcomes[1] is outcomes[2]
+
+
+def test_leader_exception_reaches_waiting_callers(engine):
+    """发起登录的线程出现异常时，等待中的调用者得到失败结果而不是IndexError"""
+    engine.save_config(dict(ACCOUNT))
+    entered, release, calls = blocking_login(engine, [RuntimeError("boom")])
+    threads, outcomes = run_concurrently(engine, entered, {'reuse': False}, {'reuse': False})
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert len(outcomes) == 2 and outcomes[0] is outcomes[1]
+    assert not outcomes[0].ok and isinstance(outcomes[0].exception, RuntimeError)
+    assert not engine.login_in_progress
+
+
+def test_manual_login_is_not_merged_into_automatic_login(engine):
+    """自动登录进行中到达的主动登录，在其结束后发送自己的请求"""
+    engine.save_config(dict(ACCOUNT))
+    first, second = LoginResult(), ok_result()
+    entered, release, calls = blocking_login(engine, [first, second])
+    threads, outcomes = run_concurrently(engine, entered, {'reuse': False}, {'reuse': False, 'manual': True})
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert calls == [False, True]
+    assert outcomes[0] is first and outcomes[1] is second
+
+
+def test_breaker_blocks_automatic_but_not_manual_login(engine):
+    engine.save_config(dict(ACCOUNT))
+    failures = []
+
+    def failed_login(capture=True):
+        result = LoginResult()
+        result.failure = FAILURE_AUTH
+        failures.append(capture)
+        return result
+
+    engine._login = failed_login
+    engine.login_bucket = None
+    for _ in range(2):
+        engine.login(reuse=False)
+    assert engine.breaker.state == BREAKER_OPEN
+    blocked = engine.login(reuse=False)
+    assert blocked.failure == "blocked" and len(failures) == 2
+    assert engine.login(reuse=False, manual=True).failure == FAILURE_AUTH
+    assert failures == [True, True, False]
@@ -0,0 +1,73 @@
+"""分层健康检查：遇到失败的层级即停止"""
+import socket
+
+import pytest
+
+import healthcheck
+from healthcheck import (TIER_GATEWAY, TIER_INTERFACE, TIER_INTERNET, TIER_PORTAL, TieredHealthCheck,
+                         tcp_reachable)
+from netcore import NET_CAPTIVE, NET_OFFLINE, NET_ONLINE
+
+
+class FakeDetector:
+    def __init__(self, state):
+        self.state = state
+        self.calls = 0
+
+    def detect(self):
+        self.calls += 1
+        return self.state, ""
+
+
+@pytest.fixture
+def portal_port():
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    sock.listen(4)
+    yield sock.getsockname()[1]
+    sock.close()
+
+
+@pytest.fixture(autouse=True)
+def no_gateway(monkeypatch):
+    monkeypatch.setattr(healthcheck, "default_gateway", lambda device=None: None)
+
+
+def closed_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def test_tcp_reachable(portal_port):
+    assert tcp_reachable("127.0.0.1", portal_port, 1) is True
+    assert tcp_reachable("127.0.0.1", closed_port(), 1) == "refused"
+
+
+@pytest.mark.parametrize("state, online, detail", [(NET_ONLINE, True, ""), (NET_CAPTIVE, False, "被门户拦截"),
+                                                   (NET_OFFLINE, False, "不可达")])
+def test_internet_tier(portal_port, state, online, detail):
+    """门户可达时都可以尝试登录，外网层级只决定是否已在线"""
+    report = TieredHealthCheck("127.0.0.1", portal_port, detector_getter=lambda: FakeDetector(state)).run()
+    assert [r.tier for r in report.results] == [TIER_INTERFACE, TIER_GATEWAY, TIER_PORTAL, TIER_INTERNET]
+    assert report.results[1].ok is None  # 网关未知不算失败
+    assert report.portal_reachable
+    assert report.online is online
+    assert report.results[3].detail == detail
+    assert report.failed_tier == (None if online else TIER_INTERNET)
+
+
+def test_stops_at_unreachable_portal():
+    detector = FakeDetector(NET_ONLINE)
+    report = TieredHealthCheck("127.0.0.1", closed_port(), detector_getter=lambda: detector).run()
+    assert report.failed_tier == TIER_PORTAL
+    assert not report.portal_reachable and not report.online
+    assert "拒绝连接" in report.results[-1].detail
+    assert detector.calls == 0
+
+
+def test_without_detector_skips_internet(portal_port):
+    report = TieredHealthCheck("127.0.0.1", portal_port).run()
+    assert report.results[-1].tier == TIER_INTERNET and report.results[-1].ok is None
+    assert report.portal_reachable and report.failed_tier is None
+    assert "❔ 外网" in str(report)
@@ -0,0 +1,36 @@
+"""netlink消息解析"""
+from linkwatch import (IFF_RUNNING, IFINFOMSG, NLMSGHDR, RT_TABLE_MAIN, RTM_DELROUTE, RTM_NEWADDR, RTM_NEWLINK,
+                       RTM_NEWROUTE, RTMSG, parse_events)
+
+
+def message(msg_type, body=b""):
+    data = NLMSGHDR.pack(NLMSGHDR.size + len(body), msg_type, 0, 0, 0) + body
+    return data + b"\0" * (-len(data) % 4)
+
+
+def link(index, flags, change):
+    return message(RTM_NEWLINK, IFINFOMSG.pack(0, 1, index, flags, change))
+
+
+def route(msg_type, dst_len, table=RT_TABLE_MAIN):
+    return message(msg_type, RTMSG.pack(2, dst_len, 0, 0, table, 3, 0, 1, 0))
+
+
+def test_address_and_link_up():
+    data = message(RTM_NEWADDR, b"\1\2\3") + link(3, IFF_RUNNING, IFF_RUNNING)
+    assert parse_events(data) == ["接口获得新地址", "接口 3 已连接"]
+
+
+def test_ignores_link_down_and_unrelated_changes():
+    assert parse_events(link(3, 0, IFF_RUNNING) + link(3, IFF_RUNNING, 0)) == []
+
+
+def test_default_route_only():
+    data = route(RTM_NEWROUTE, 24) + route(RTM_DELROUTE, 0) + route(RTM_NEWROUTE, 0, table=255)
+    assert parse_events(data) == ["默认路由已变化"]
+
+
+def test_truncated_messages():
+    assert parse_events(b"") == []
+    assert parse_events(link(3, IFF_RUNNING, IFF_RUNNING)[:NLMSGHDR.size + 4]) == []
+    assert parse_events(NLMSGHDR.pack(0, RTM_NEWADDR, 0, 0, 0)) == []
@@ -0,0 +1,72 @@
+"""界面登录线程：异常转为失败结果，登录进行中到达的主动登录不被丢弃"""
+import threading
+import time
+import types
+
+from engine import LoginResult
+from login import NetworkLoginApp
+
+
+class FakeEngine:
+    """第一次登录阻塞到放行，记录每次登录的参数"""
+
+    def __init__(self, outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = []
+        self.entered = threading.Event()
+        self.release = threading.Event()
+
+    def login(self, reuse=True, manual=False):
+        self.calls.append((reuse, manual))
+        if len(self.calls) == 1:
+            self.entered.set()
+            self.release.wait(5)
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+
+def make_app(engine):
+    """只带登录相关属性的界面对象，不创建窗口"""
+    app = types.SimpleNamespace(engine=engine, login_guard=threading.Lock(), login_running=False,
+                                pending_manual_login=None, startup_login_done=True, posted=[],
+                                logger=types.SimpleNamespace(info=lambda *a: None, error=lambda *a: None))
+    app.post_ui = lambda kind, payload: app.posted.append((kind, payload))
+    app._login_worker = lambda *args: NetworkLoginApp._login_worker(app, *args)
+    app.login = lambda **kwargs: NetworkLoginApp.login(app, **kwargs)
+    return app
+
+
+def results(app):
+    return [payload for kind, payload in app.posted if kind == "result"]
+
+
+def test_worker_posts_failed_result_on_exception():
+    engine = FakeEngine([RuntimeError("boom")])
+    engine.release.set()
+    app = make_app(engine)
+    NetworkLoginApp._login_worker(app, True, False)
+    [result] = results(app)
+    assert not result.ok and isinstance(result.exception, RuntimeError)
+    assert not app.login_running
+
+
+def test_manual_login_runs_after_current_login():
+    ok = LoginResult()
+    ok.ok = True
+    engine = FakeEngine([LoginResult(), ok])
+    app = make_app(engine)
+    app.login(reuse=True)
+    assert engine.entered.wait(5)
+    app.login(reuse=True)  # 自动登录：合并
+    app.login(reuse=False, manual=True)
+    app.login(reuse=True, manual=True)
+    engine.release.set()
+    for _ in range(50):
+        if len(results(app)) == 2 and not app.login_running:
+            break
+        time.sleep(0.1)
+    assert engine.calls == [(True, False), (False, True)]
+    assert results(app)[1] is ok
+    assert not app.login_running and app.pending_manual_login is None
@@ -0,0 +1,150 @@
+"""网络探测：并发探测站点，门户检测只有跳转到认证门户才算被拦截且不重试"""
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from netcore import (NET_CAPTIVE, NET_OFFLINE, NET_ONLINE, CaptiveDetector, ProbeEngine, create_http_session,
+                     portal_link)
+
+PORTAL = "172.17.10.100"
+PORTAL_PAGE = f"http://{PORTAL}/eportal/index.jsp?wlanuserip=10.0.0.5"
+
+# 路径 -> (状态码, 响应头, 响应体)
+RESPONSES = {
+    "/online": (204, {}, ""),
+    "/redirect": (302, {"Location": PORTAL_PAGE}, ""),
+    "/redirect-prefix": (302, {"Location": f"http://{PORTAL}0/eportal/index.jsp"}, ""),
+    "/redirect-other": (302, {"Location": "http://wifi.example.com/login"}, ""),
+    "/script": (200, {}, f"<script>top.self.location.href='{PORTAL_PAGE}'</script>"),
+    "/page": (200, {}, "<html>hello</html>"),
+    "/error": (502, {}, "bad gateway"),
+}
+
+
+class Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        status, headers, body = RESPONSES[self.path]
+        self.send_response(status)
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.send_header("Content-Length", str(len(body.encode())))
+        self.end_headers()
+        self.wfile.write(body.encode())
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture(scope="module")
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def closed_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.mark.parametrize("path, state", [
+    ("/online", NET_ONLINE),
+    ("/redirect", NET_CAPTIVE),
+    ("/script", NET_CAPTIVE),
+    ("/redirect-prefix", NET_OFFLINE),
+    ("/redirect-other", NET_OFFLINE),
+    ("/page", NET_OFFLINE),
+    ("/error", NET_OFFLINE),
+])
+def test_detect(server, path, state):
+    detector = CaptiveDetector(create_http_session(retries=0), check_url=server + path, portal_host=PORTAL)
+    result, detail = detector.detect()
+    assert result == state
+    if state == NET_CAPTIVE:
+        assert detail == PORTAL_PAGE
+
+
+def test_detect_does_not_retry_unreachable_host():
+    """地址不可达时只尝试一次连接，不叠加重试和退避等待"""
+    session = create_http_session(retries=0)
+    assert session.get_adapter("http://").max_retries.total == 0
+    detector = CaptiveDetector(session, check_url=f"http://127.0.0.1:{closed_port()}/generate_204", timeout=1)
+    started = time.monotonic()
+    assert detector.detect()[0] == NET_OFFLINE
+    assert time.monotonic() - started < 0.5
+
+
+def test_engine_detector_uses_session_without_retries(tmp_path):
+    from engine import LoginEngine
+
+    engine = LoginEngine(str(tmp_path))
+    try:
+        assert engine.detector.session is engine.probe_http
+        assert engine.probe_http.get_adapter("http://").max_retries.total == 0
+        assert engine.http.get_adapter("http://").max_retries.total == 2
+    finally:
+        engine.close()
+
+
+def test_portal_link_in_script_redirect():
+    text = ("<script>top.self.location.href='http://172.17.10.1000/x';"
+            f"location.href='{PORTAL_PAGE}'</script>")
+    assert portal_link(text, PORTAL) == PORTAL_PAGE
+    assert portal_link("<html>ok</html>", PORTAL) is None
+
+
+class FakeResolver:
+    """站点名 -> 本机端口；名为slow的站点解析一直等到超时"""
+
+    def __init__(self, ports):
+        self.ports = ports
+
+    def resolve(self, host, port, timeout=None):
+        if host == "slow":
+            time.sleep(timeout)
+            raise socket.gaierror("解析 slow 超时")
+        return [(socket.AF_INET, socket.SOCK_STREAM, socket.IPPROTO_TCP, '', ("127.0.0.1", self.ports[host]))], \
+            0.0, "cache"
+
+
+@pytest.fixture
+def listener():
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    sock.listen(16)
+    yield sock.getsockname()[1]
+    sock.close()
+
+
+def test_probe_first_returns_without_waiting_for_slow_sites(listener):
+    """首个成功即返回，不等其余站点超时"""
+    prober = ProbeEngine(timeout=3, resolver=FakeResolver({"up": listener, "down": closed_port()}))
+    started = time.monotonic()
+    winner, failures = prober.probe_first(["slow", "down", "up"])
+    assert time.monotonic() - started < 1
+    assert winner.site == "up" and winner.ok and winner.connect_ms is not None
+    assert all(not r.ok for r in failures)
+
+
+def test_probe_all_shares_one_deadline(listener):
+    prober = ProbeEngine(timeout=3, resolver=FakeResolver({"up": listener, "down": closed_port()}))
+    started = time.monotonic()
+    results = prober.probe_all(["up", "slow", "down", "up"], deadline=0.3)
+    assert time.monotonic() - started < 1
+    assert [r.site for r in results] == ["up", "slow", "down", "up"]
+    assert results[0].ok and results[3] is results[0]  # 重复的站点只探测一次
+    assert not results[1].ok
+    assert not results[2].ok and results[2].stage == "connect"
+
+
+def test_probe_first_all_failed():
+    prober = ProbeEngine(timeout=3, resolver=FakeResolver({"down": closed_port()}))
+    winner, failures = prober.probe_first(["down", "slow"], deadline=0.3)
+    assert winner is None
+    assert sorted(r.site for r in failures) == ["down", "slow"]
@@ -0,0 +1,57 @@
+"""门户参数的提取与缓存"""
+import logging
+
+import portalparams
+from portalparams import MAX_ENTRIES, ParamCache, query_user_ip, redirect_query
+
+
+def test_redirect_query():
+    url = "http://172.17.10.100/eportal/index.jsp?wlanuserip=10.0.0.5&nasip=1.2.3.4"
+    assert redirect_query(url, "172.17.10.100") == "wlanuserip=10.0.0.5&nasip=1.2.3.4"
+    assert redirect_query(url, "172.17.10.101") is None
+    assert redirect_query("http://172.17.10.100/eportal/index.jsp", "172.17.10.100") is None
+
+
+def test_query_user_ip():
+    assert query_user_ip("wlanuserip=10.0.0.5&nasip=1.2.3.4") == "10.0.0.5"
+    assert query_user_ip("wlanuserip%3D10.0.0.5%26nasip%3D1.2.3.4") == "10.0.0.5"
+    assert query_user_ip("nasip=1.2.3.4") is None
+
+
+def test_cache_put_get_discard(tmp_path):
+    cache = ParamCache(str(tmp_path / "portal_params.json"))
+    assert cache.get("10.0.0.5/aa:bb") is None
+    cache.put("10.0.0.5/aa:bb", "wlanuserip=10.0.0.5")
+    assert ParamCache(cache.path).get("10.0.0.5/aa:bb") == "wlanuserip=10.0.0.5"
+    cache.discard("10.0.0.5/aa:bb")
+    assert cache.get("10.0.0.5/aa:bb") is None
+
+
+def test_cache_evicts_oldest(tmp_path, monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr(portalparams.time, "time", lambda: now[0])
+    cache = ParamCache(str(tmp_path / "portal_params.json"))
+    for i in range(MAX_ENTRIES + 2):
+        now[0] = float(i)
+        cache.put(f"10.0.0.{i}/-", f"wlanuserip=10.0.0.{i}")
+    assert cache.get("10.0.0.0/-") is None
+    assert cache.get("10.0.0.1/-") is None
+    assert cache.get("10.0.0.2/-") == "wlanuserip=10.0.0.2"
+    assert cache.get(f"10.0.0.{MAX_ENTRIES + 1}/-") is not None
+
+
+def test_cache_ignores_corrupt_file(tmp_path):
+    path = tmp_path / "portal_params.json"
+    path.write_text("not json", encoding='utf-8')
+    cache = ParamCache(str(path))
+    assert cache.get("10.0.0.5/-") is None
+    cache.put("10.0.0.5/-", "wlanuserip=10.0.0.5")
+    assert cache.get("10.0.0.5/-") == "wlanuserip=10.0.0.5"
+
+
+def test_cache_write_failure_only_warns(tmp_path, caplog):
+    cache = ParamCache(str(tmp_path / "missing" / "portal_params.json"), logging.getLogger("test"))
+    with caplog.at_level(logging.WARNING):
+        cache.put("10.0.0.5/-", "wlanuserip=10.0.0.5")
+    assert "保存网络参数缓存失败" in caplog.text
+    assert cache.get("10.0.0.5/-") is None
@@ -0,0 +1,161 @@
+"""门户适配器：登录请求编码与响应解析"""
+import binascii
+import logging
+from urllib.parse import urlencode
+
+import pytest
+
+from breaker import FAILURE_AUTH, FAILURE_BAD_RESPONSE, FAILURE_HTTP_5XX, FAILURE_NON_JSON
+from engine import LoginResult
+from portals import get_portal
+
+LOGGER = logging.getLogger("test")
+CMCC = '%E4%B8%AD%E5%9B%BD%E7%A7%BB%E5%8A%A8%E5%AE%BD%E5%B8%A6'
+
+
+def ruijie_config(**overrides):
+    config = {'userAccount': '2021001', 'encryptedPassword': 'ab/c+d=', 'serviceName': CMCC,
+              'targetUrl': 'http://172.17.10.100/eportal/InterFace.do?method=login'}
+    config.update(overrides)
+    return config
+
+
+def parse(portal, text, status_code=200, config=None):
+    result = LoginResult()
+    get_portal(portal).parse_login(result, status_code, text, config or ruijie_config(), LOGGER)
+    return result
+
+
+def user_index(decoded):
+    return binascii.hexlify(decoded.encode('utf-8')).decode('ascii')
+
+
+def test_unknown_portal():
+    with pytest.raises(ValueError):
+        get_portal("srun")
+
+
+def test_ruijie_body_matches_form_encoding():
+    """编译后的请求体与按字段urlencode的结果逐字节一致"""
+    query = 'wlanuserip=10.0.0.5&wlanacname=ac 1&mac=aa:bb'
+    config = ruijie_config()
+    expected = urlencode({'userId': config['userAccount'], 'password': config['encryptedPassword'],
+                          'service': config['serviceName'], 'queryString': query, 'operatorPwd': '',
+                          'operatorUserId': '', 'validcode': '', 'passwordEncrypt': 'true'})
+    request = get_portal().compile(config)
+    assert request.method == "POST"
+    assert request.render(query) == expected
+    assert request.render(query) is request.render(query)  # queryString未变时复用
+
+
+def test_ruijie_success():
+    result = parse("eportal", '{"result":"success","message":"","userIndex":"%s"}'
+                   % user_index("dev1_10.0.0.5_2021001"))
+    assert result.ok and result.failure is None
+    assert (result.device_id, result.ip, result.account) == ("dev1", "10.0.0.5", "2021001")
+    assert result.account_match
+
+
+def test_ruijie_success_other_account():
+    result = parse("eportal", '{"userIndex":"%s","result":"success"}' % user_index("dev1_10.0.0.5_other"))
+    assert result.ok and not result.account_match
+
+
+def test_ruijie_rejection_with_null_user_index():
+    """门户拒绝登录时userIndex为null，应归为认证失败并带上门户提示"""
+    result = parse("eportal", '{"userIndex":null,"result":"fail","message":"用户不存在或密码错误"}')
+    assert not result.ok
+    assert result.failure == FAILURE_AUTH
+    assert "用户不存在或密码错误" in result.error
+
+
+def test_ruijie_success_without_user_index():
+    result = parse("eportal", '{"result":"success","message":"ok"}')
+    assert result.failure == FAILURE_AUTH
+
+
+@pytest.mark.parametrize("status_code, failure", [(200, FAILURE_NON_JSON), (502, FAILURE_HTTP_5XX)])
+def test_ruijie_non_json(status_code, failure):
+    result = parse("eportal", "<html>系统繁忙</html>", status_code)
+    assert not result.ok and result.failure == failure
+
+
+def test_ruijie_bad_user_index():
+    result = parse("eportal", '{"result":"success","userIndex":"not-hex"}')
+    assert result.failure == FAILURE_BAD_RESPONSE
+
+
+def test_ruijie_short_decoded_index():
+    result = parse("eportal", '{"result":"success","userIndex":"%s"}' % user_index("only_two"))
+    assert not result.ok and result.failure == FAILURE_BAD_RESPONSE
+
+
+@pytest.mark.parametrize("current, expected", [
+    ("", "wlanuserip%3D10.0.0.5%26wlanacname%3Dac1"),
+    ("wlanuserip%3D10.0.0.1", "wlanuserip%3D10.0.0.5%26wlanacname%3Dac1"),
+    ("wlanuserip=10.0.0.1", "wlanuserip=10.0.0.5&wlanacname=ac1"),
+])
+def test_ruijie_params_from_query(current, expected):
+    """跳转地址的查询串按原有配置的形式（是否再编码一次）转换"""
+    assert get_portal().params_from_query("wlanuserip=10.0.0.5&wlanacname=ac1", current) == expected
+
+
+def test_ruijie_session_request():
+    portal = get_portal()
+    method, url, data = portal.session_request(ruijie_config(), {'userIndex': 'abcd'})
+    assert method == "POST"
+    assert url == "http://172.17.10.100/eportal/InterFace.do?method=getOnlineUserInfo"
+    assert data == {'userIndex': 'abcd'}
+    assert portal.session_request(ruijie_config(), {'account': '2021001'}) is None
+    assert portal.session_valid('{"result":"success"}', {})[0]
+    assert not portal.session_valid('{"result":"fail"}', {})[0]
+
+
+def drcom_config(**overrides):
+    config = {'portal': 'drcom', 'userAccount': '2021001', 'encryptedPassword': 'pw', 'serviceName': '@telecom',
+              'targetUrl': 'http://172.17.10.100:801/eportal/'}
+    config.update(overrides)
+    return config
+
+
+@pytest.mark.parametrize("params", ["wlanuserip=10.0.0.5&wlanusermac=aabb&foo=1",
+                                    "wlanuserip%3D10.0.0.5%26wlanusermac%3Daabb%26foo%3D1"])
+def test_drcom_login_url(params):
+    """账号带运营商后缀，跳转参数换成登录接口的参数名，编码与否结果相同"""
+    request = get_portal("drcom").compile(drcom_config())
+    url = request.render(params)
+    assert request.method == "GET"
+    assert url.startswith("http://172.17.10.100:801/eportal/?c=Portal&a=login&callback=dr1003")
+    assert "user_account=%2C0%2C2021001%40telecom" in url
+    assert url.endswith("&wlan_user_ip=10.0.0.5&wlan_user_mac=aabb")
+
+
+def test_drcom_service_values():
+    portal = get_portal("drcom")
+    assert portal.service_value('campus') == ''
+    assert portal.service_key({'serviceName': '@unicom'}) == 'unicom'
+    with pytest.raises(ValueError):
+        get_portal().service_value('unicom')
+
+
+def test_drcom_success():
+    result = parse("drcom", 'dr1003({"result":"1","msg":"认证成功","v46ip":"10.0.0.5"});', config=drcom_config())
+    assert result.ok and result.ip == "10.0.0.5" and result.account == "2021001"
+
+
+def test_drcom_rejection():
+    result = parse("drcom", 'dr1003({"result":"0","msg":"账号或密码错误","ret_code":1})', config=drcom_config())
+    assert result.failure == FAILURE_AUTH and "账号或密码错误" in result.error
+
+
+def test_drcom_non_json():
+    result = parse("drcom", "<html></html>", 500, config=drcom_config())
+    assert result.failure == FAILURE_HTTP_5XX
+
+
+def test_drcom_session_check():
+    portal = get_portal("drcom")
+    method, url, _ = portal.session_request(drcom_config(), {'account': '2021001'})
+    assert (method, url) == ("GET", "http://172.17.10.100:801/drcom/chkstatus?callback=dr1002")
+    assert portal.session_valid('dr1002({"result":1,"uid":"2021001@telecom"})', {'account': '2021001'})[0]
+    assert not portal.session_valid('dr1002({"result":0})', {'account': '2021001'})[0]
@@ -0,0 +1,87 @@
+"""连接质量统计：连接延迟不含DNS解析"""
+from netcore import ProbeResult
+from quality import KIND_CONNECT, KIND_DNS, KIND_HTTP, QualityHistory, QualityMonitor, RollingWindow
+
+
+class FakeProber:
+    """按轮次依次返回预设的探测结果"""
+
+    def __init__(self, rounds):
+        self.rounds = list(rounds)
+
+    def probe_all(self, sites):
+        return self.rounds.pop(0)
+
+
+def probe(connect_ms, dns_ms=0.0, source="cache"):
+    return ProbeResult("qq.com", True, latency=dns_ms + connect_ms, dns_ms=dns_ms, connect_ms=connect_ms,
+                       dns_source=source)
+
+
+def make_monitor(rounds, history=None):
+    monitor = QualityMonitor(FakeProber(rounds), lambda: None, lambda: ["qq.com"], p95_threshold=300,
+                             min_samples=5, history=history)
+    monitor._http_latency = lambda site: 20.0
+    return monitor
+
+
+def test_rolling_window():
+    window = RollingWindow(3)
+    for value in (1, 2, 3, 10):
+        window.add(value)
+    assert list(window.ordered()) == [2, 3, 10]
+    assert window.percentile(0.5) == 3
+    assert window.jitter() == 4
+
+
+def test_slow_dns_does_not_raise_connect_p95():
+    """缓存过期后的一次慢速DNS查询只计入DNS样本，不影响连接p95，也不触发质量下降"""
+    rounds = [[probe(10.0)] for _ in range(9)] + [[probe(12.0, dns_ms=2900.0, source="dns")]]
+    statuses = []
+    monitor = make_monitor(rounds)
+    monitor.on_status = statuses.append
+    for _ in rounds:
+        monitor.sample()
+    summary = monitor.snapshot()["qq.com"]
+    assert summary['connect']['p95'] == 12.0
+    assert summary['connect']['n'] == 10
+    assert summary['dns'] == {'n': 1, 'p50': 2900.0, 'p95': 2900.0, 'jitter': None}
+    assert not summary['degraded'] and statuses == []
+
+
+def test_slow_connect_marks_degraded():
+    rounds = [[probe(500.0)] for _ in range(5)] + [[probe(10.0)] for _ in range(120)]
+    statuses = []
+    monitor = make_monitor(rounds)
+    monitor.on_status = statuses.append
+    for _ in range(5):
+        monitor.sample()
+    assert monitor.snapshot()["qq.com"]['degraded']
+    assert len(statuses) == 1 and "连接质量下降" in statuses[0]
+    for _ in range(120):
+        monitor.sample()
+    assert not monitor.snapshot()["qq.com"]['degraded']
+    assert "已恢复" in statuses[-1]
+
+
+def test_failures_count_as_loss(tmp_path):
+    history = QualityHistory(str(tmp_path / "quality.db"))
+    failed = ProbeResult("qq.com", False, error=OSError("unreachable"), dns_ms=1.0, stage="connect",
+                         dns_source="cache")
+    monitor = make_monitor([[probe(10.0)], [failed]], history)
+    monitor.sample()
+    monitor.sample()
+    assert monitor.snapshot()["qq.com"]['loss'] == 0.5
+    rows = history._connection().execute("SELECT kind, latency FROM samples ORDER BY rowid").fetchall()
+    history.close()
+    assert rows == [(KIND_CONNECT, 10.0), (KIND_HTTP, 20.0), (KIND_CONNECT, None)]
+
+
+def test_history_records_real_dns_lookups_only(tmp_path):
+    history = QualityHistory(str(tmp_path / "quality.db"))
+    make_monitor([[probe(10.0, dns_ms=0.0)], [probe(10.0, dns_ms=40.0, source="dns")]], history).sample()
+    monitor = make_monitor([[probe(10.0, dns_ms=40.0, source="dns")]], history)
+    monitor.sample()
+    kinds = [row[0] for row in history._connection().execute("SELECT kind FROM samples").fetchall()]
+    history.close()
+    assert kinds.count(KIND_DNS) == 1
@@ -0,0 +1,71 @@
+"""DNS缓存：按TTL缓存，解析失败时退回过期地址"""
+import socket
+
+import pytest
+
+import netcore
+from netcore import ResolverCache
+
+
+class FakeDns:
+    """替换getaddrinfo：记录查询次数，fail为True时解析失败"""
+
+    def __init__(self):
+        self.calls = 0
+        self.fail = False
+
+    def __call__(self, host, port, family=0, type=0, *args):
+        self.calls += 1
+        if self.fail:
+            raise socket.gaierror("name resolution failed")
+        if family == socket.AF_INET6:
+            raise socket.gaierror("no AAAA record")
+        return [(socket.AF_INET, socket.SOCK_STREAM, socket.IPPROTO_TCP, '', ("10.1.2.3", 0))]
+
+
+@pytest.fixture
+def dns(monkeypatch):
+    fake = FakeDns()
+    monkeypatch.setattr(netcore.socket, "getaddrinfo", fake)
+    return fake
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(netcore.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_cached_until_ttl(dns, clock):
+    resolver = ResolverCache(ttl=300)
+    infos, _, source = resolver.resolve("qq.com", 80)
+    assert source == "dns" and infos[0][4] == ("10.1.2.3", 80)
+    calls = dns.calls
+    infos, elapsed, source = resolver.resolve("qq.com", 443)
+    assert (source, elapsed, dns.calls) == ("cache", 0.0, calls)
+    assert infos[0][4] == ("10.1.2.3", 443)
+    clock[0] += 301
+    assert resolver.resolve("qq.com", 80)[2] == "dns"
+    assert dns.calls > calls
+
+
+def test_falls_back_to_stale_address(dns, clock):
+    resolver = ResolverCache(ttl=300)
+    resolver.resolve("qq.com", 80)
+    clock[0] += 301
+    dns.fail = True
+    infos, _, source = resolver.resolve("qq.com", 80)
+    assert source == "stale" and infos[0][4] == ("10.1.2.3", 80)
+    with pytest.raises(OSError):
+        resolver.resolve("unknown.example", 80)
+
+
+def test_pinned_address_skips_dns(dns):
+    resolver = ResolverCache()
+    resolver.pin("qq.com", ["1.2.3.4", "::1"])
+    infos, _, source = resolver.resolve("qq.com", 80)
+    assert source == "pinned" and dns.calls == 0
+    assert [info[4][0] for info in infos] == ["1.2.3.4", "::1"]
+    resolver.unpin_all()
+    assert resolver.resolve("qq.com", 80)[2] == "dns"